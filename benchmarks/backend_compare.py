@@ -0,0 +1,176 @@
+"""
+Accuracy versus latency of the inference backends on the same images.
+
+Each backend runs every image twice: once at the serving confidence threshold,
+timed one image at a time (p50/p99 latency), and once at a low threshold to
+score box mAP@0.5 and mAP@0.5:0.95. Ground truth is read from YOLO-format
+label files (--labels, one <stem>.txt per image); without labels the first
+backend's detections at the serving threshold are used as the reference, so
+the mAP columns measure agreement with it.
+
+    python -m benchmarks.backend_compare --images instance/uploads --limit 200 \\
+        --backends torch onnx openvino onnx-int8 openvino-int8
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from detector.backends import calibration_images, load_model
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "seg_n.pt")
+SERVING_CONF = 0.4
+EVAL_CONF = 0.001
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def parse_backend(spec):
+    backend, _, suffix = spec.partition("-")
+    if suffix not in ("", "int8"):
+        raise argparse.ArgumentTypeError(f"bad backend {spec!r}")
+    return spec, backend, suffix == "int8"
+
+
+def detections(result):
+    """(boxes (N, 4) xyxy, scores (N,), classes (N,)) as numpy arrays"""
+    boxes = result.boxes
+    return (
+        boxes.xyxy.cpu().numpy().reshape(-1, 4),
+        boxes.conf.cpu().numpy(),
+        boxes.cls.cpu().numpy().astype(int),
+    )
+
+
+def load_labels(label_dir, path, shape):
+    label_path = os.path.join(label_dir, os.path.splitext(os.path.basename(path))[0] + ".txt")
+    if not os.path.exists(label_path):
+        return np.zeros((0, 4)), np.zeros(0, dtype=int)
+    rows = np.loadtxt(label_path, ndmin=2)
+    if rows.size == 0:
+        return np.zeros((0, 4)), np.zeros(0, dtype=int)
+    h, w = shape[:2]
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+    return boxes, rows[:, 0].astype(int)
+
+
+def box_iou(a, b):
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def average_precision(tp, scores, n_gt):
+    """COCO-style 101-point interpolated AP"""
+    if n_gt == 0:
+        return None
+    if len(scores) == 0:
+        return 0.0
+    order = np.argsort(-scores, kind="stable")
+    tp = tp[order]
+    recall = np.cumsum(tp) / n_gt
+    precision = np.cumsum(tp) / np.arange(1, len(tp) + 1)
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    points = np.linspace(0, 1, 101)
+    idx = np.searchsorted(recall, points, side="left")
+    return float(np.mean([precision[i] if i < len(precision) else 0.0 for i in idx]))
+
+
+def mean_ap(predictions, ground_truth):
+    """predictions / ground_truth: per image (boxes, [scores,] classes); returns an AP per IoU threshold"""
+    classes = sorted({int(c) for _, g_cls in ground_truth for c in g_cls})
+    aps = np.zeros((len(classes), len(IOU_THRESHOLDS)))
+    valid = np.zeros(len(classes), dtype=bool)
+    for ci, cls in enumerate(classes):
+        scores, matches, n_gt = [], [], 0
+        for (p_boxes, p_scores, p_cls), (g_boxes, g_cls) in zip(predictions, ground_truth):
+            p = p_cls == cls
+            g = g_cls == cls
+            n_gt += int(g.sum())
+            pb, ps, gb = p_boxes[p], p_scores[p], g_boxes[g]
+            order = np.argsort(-ps, kind="stable")
+            pb, ps = pb[order], ps[order]
+            iou = box_iou(pb, gb) if len(pb) and len(gb) else np.zeros((len(pb), len(gb)))
+            tp = np.zeros((len(pb), len(IOU_THRESHOLDS)), dtype=bool)
+            for ti, threshold in enumerate(IOU_THRESHOLDS):
+                taken = np.zeros(len(gb), dtype=bool)
+                for i in range(len(pb)):
+                    candidates = np.where(~taken & (iou[i] >= threshold))[0]
+                    if len(candidates):
+                        j = candidates[np.argmax(iou[i, candidates])]
+                        taken[j] = True
+                        tp[i, ti] = True
+            scores.append(ps)
+            matches.append(tp)
+        scores = np.concatenate(scores) if scores else np.zeros(0)
+        matches = np.concatenate(matches) if matches else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool)
+        for ti in range(len(IOU_THRESHOLDS)):
+            ap = average_precision(matches[:, ti], scores, n_gt)
+            if ap is not None:
+                aps[ci, ti] = ap
+                valid[ci] = True
+    if not valid.any():
+        return np.full(len(IOU_THRESHOLDS), np.nan)
+    return aps[valid].mean(axis=0)
+
+
+def run_backend(model, images, warmup=3):
+    for img in images[:warmup]:
+        model.predict(img, conf=SERVING_CONF, verbose=False)
+    latencies, serving = [], []
+    for img in images:
+        start = time.perf_counter()
+        result = model.predict(img, conf=SERVING_CONF, verbose=False)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        serving.append(detections(result))
+    scored = [
+        detections(model.predict(img, conf=EVAL_CONF, verbose=False)[0]) for img in images
+    ]
+    return np.array(latencies), serving, scored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--images", required=True, help="folder of images to evaluate on")
+    parser.add_argument("--labels", help="folder of YOLO-format label files")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--backends", nargs="+", type=parse_backend,
+                        default=[parse_backend(b) for b in ("torch", "onnx", "openvino")])
+    parser.add_argument("--calib-dir", help="calibration images for INT8 (default: --images)")
+    parser.add_argument("--calib-size", type=int, default=300)
+    args = parser.parse_args()
+
+    paths = calibration_images(args.images, args.limit)
+    images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        parser.error(f"no images found in {args.images}")
+
+    reference = None
+    if args.labels:
+        reference = [load_labels(args.labels, p, img.shape) for p, img in zip(paths, images)]
+
+    rows = []
+    for name, backend, int8 in args.backends:
+        model = load_model(args.model, backend, int8, args.calib_dir or args.images, args.calib_size)
+        latencies, serving, scored = run_backend(model, images)
+        if reference is None:
+            reference = [(boxes, classes) for boxes, _, classes in serving]
+        aps = mean_ap(scored, reference)
+        rows.append((name, np.percentile(latencies, 50), np.percentile(latencies, 99), aps[0], aps.mean()))
+
+    ref_name = "labels" if args.labels else rows[0][0]
+    print(f"{len(images)} images, mAP against {ref_name}")
+    print(f"{'backend':>14} {'p50 ms':>8} {'p99 ms':>8} {'mAP50':>7} {'d':>7} {'mAP50-95':>9} {'d':>7}")
+    base50, base = rows[0][3], rows[0][4]
+    for name, p50, p99, ap50, ap in rows:
+        print(f"{name:>14} {p50:>8.1f} {p99:>8.1f} {ap50:>7.3f} {ap50 - base50:>+7.3f} {ap:>9.3f} {ap - base:>+7.3f}")
+
+
+if __name__ == "__main__":
+    main()
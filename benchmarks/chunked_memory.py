@@ -0,0 +1,97 @@
+"""
+Peak server memory per request: unary Detect against chunked DetectChunked.
+
+Starts grpc_server.py in a subprocess (or attaches to a running one with
+--pid), and for every image size resets the server's peak RSS through
+/proc/<pid>/clear_refs, sends one request and reads VmHWM back. The reported
+number is the peak above the RSS the server had before the request. Linux
+only.
+
+    python -m benchmarks.chunked_memory --sizes 2048x2048 8192x4096 16384x8192 --format png
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import grpc
+import numpy as np
+
+from src.rpc_client import DetectorClient
+
+SERVER = os.path.join(os.path.dirname(__file__), "..", "grpc_server.py")
+
+
+def read_status(pid, field):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def reset_peak(pid):
+    # "5" resets VmHWM to the current RSS (Linux >= 4.0)
+    with open(f"/proc/{pid}/clear_refs", "w") as f:
+        f.write("5")
+
+
+def make_image(width, height, fmt, seed=0):
+    rng = np.random.default_rng(seed)
+    # smooth noise, so the encoded size is realistic rather than incompressible
+    small = rng.integers(0, 256, (max(1, height // 8), max(1, width // 8), 3), dtype=np.uint8)
+    img = cv2.resize(small, (width, height), interpolation=cv2.INTER_LINEAR)
+    return cv2.imencode(f".{fmt}", img)[1].tobytes()
+
+
+def measure(pid, call, repeat):
+    peaks = []
+    for _ in range(repeat):
+        time.sleep(0.2)
+        baseline = read_status(pid, "VmRSS")
+        reset_peak(pid)
+        call()
+        peaks.append(read_status(pid, "VmHWM") - baseline)
+    return max(peaks) / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["2048x2048", "8192x4096", "16384x8192"])
+    parser.add_argument("--format", default="png", choices=["png", "jpg", "bmp"])
+    parser.add_argument("--chunk-kb", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--target", default="localhost:50051")
+    parser.add_argument("--pid", type=int, help="pid of a running server on the same host")
+    parser.add_argument("server_args", nargs="*", help="extra grpc_server.py arguments, after --")
+    args = parser.parse_args()
+
+    server = None
+    pid = args.pid
+    if pid is None:
+        server = subprocess.Popen([sys.executable, SERVER, *args.server_args])
+        pid = server.pid
+    client = DetectorClient(args.target)
+    try:
+        grpc.channel_ready_future(client.channel).result(timeout=300)
+        print(f"{'size':>12} {'encoded MB':>11} {'unary MB':>9} {'chunked MB':>11}")
+        for size in args.sizes:
+            width, height = (int(v) for v in size.lower().split("x"))
+            data = make_image(width, height, args.format)
+            client.detect(data)  # warm-up at this size
+            unary = measure(pid, lambda: client.detect(data), args.repeat)
+            chunked = measure(
+                pid, lambda: client.detect_chunked(data, args.chunk_kb * 1024), args.repeat
+            )
+            print(f"{size:>12} {len(data) / 2**20:>11.1f} {unary:>9.1f} {chunked:>11.1f}")
+    finally:
+        client.close()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
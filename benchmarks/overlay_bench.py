@@ -0,0 +1,76 @@
+"""
+Mask overlay micro-benchmark: per-mask compositing (the old DetectorServicer
+loop) against MaskOverlay, as a function of mask count and image size.
+
+    python -m benchmarks.overlay_bench --sizes 640x640 2048x1024 4096x2048 --masks 1 5 20 50
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from detector.overlay import MaskOverlay
+
+colors = [(255, 0, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255)]
+
+
+def legacy_overlay(img, masks, class_ids):
+    for i, mask in enumerate(masks):
+        class_id = int(class_ids[i].item())
+        mask_arr = (mask.cpu().numpy() * 255).astype(np.uint8)
+        mask_arr = cv2.resize(mask_arr, (img.shape[1], img.shape[0]))
+        colored_mask = np.zeros_like(img, dtype=np.uint8)
+        colored_mask[:, :, 0] = colors[class_id][0] * (mask_arr > 0)
+        colored_mask[:, :, 1] = colors[class_id][1] * (mask_arr > 0)
+        colored_mask[:, :, 2] = colors[class_id][2] * (mask_arr > 0)
+        img = cv2.addWeighted(img, 1, colored_mask, 0.35, 0)
+    return img
+
+
+def make_inputs(width, height, n_masks, mask_size=640, seed=0):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    # masks come out of the model at (roughly) the network input resolution
+    scale = mask_size / max(width, height)
+    mh, mw = max(1, int(height * scale)), max(1, int(width * scale))
+    masks = torch.zeros((n_masks, mh, mw))
+    for i in range(n_masks):
+        x, y = rng.integers(0, mw), rng.integers(0, mh)
+        w, h = rng.integers(5, mw // 4 + 6), rng.integers(5, mh // 4 + 6)
+        masks[i, y:y + h, x:x + w] = 1
+    class_ids = torch.as_tensor(rng.integers(0, len(colors), n_masks), dtype=torch.float32)
+    return img, masks, class_ids
+
+
+def time_it(fn, repeat):
+    fn()  # warm-up (and first buffer allocation)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["640x640", "2048x1024", "4096x2048"])
+    parser.add_argument("--masks", nargs="+", type=int, default=[1, 5, 20, 50])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    overlay = MaskOverlay(colors)
+    print(f"{'size':>10} {'masks':>6} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        width, height = (int(v) for v in size.lower().split("x"))
+        for n in args.masks:
+            img, masks, class_ids = make_inputs(width, height, n)
+            legacy = time_it(lambda: legacy_overlay(img.copy(), masks, class_ids), args.repeat)
+            vector = time_it(lambda: overlay.apply(img.copy(), masks, class_ids), args.repeat)
+            print(f"{size:>10} {n:>6} {legacy:>10.2f} {vector:>10.2f} {legacy / vector:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Throughput of the detection server against the number of model replicas.
+
+For every replica count starts grpc_server.py --replicas N on a free port,
+waits until every client channel gets an answer, and then drives it with
+--clients threads for --duration seconds. Every client thread has its own
+channel (and therefore its own connection), which SO_REUSEPORT spreads over
+the replicas. Reports images/s and latency percentiles per replica count.
+
+    python -m benchmarks.replica_throughput --images instance/uploads --replicas 1 2 4 --clients 16
+    python -m benchmarks.replica_throughput --replicas 1 2 4 -- --backend openvino
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import grpc
+import numpy as np
+
+from benchmarks.chunked_memory import make_image
+from detector.backends import calibration_images
+from src.rpc_client import DetectorClient
+
+SERVER = os.path.join(os.path.dirname(__file__), "..", "grpc_server.py")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+
+def load_images(folder, limit, size):
+    """Encoded sample images from folder, or synthetic ones of the given size"""
+    images = []
+    for path in calibration_images(folder, limit):
+        with open(path, "rb") as f:
+            images.append(f.read())
+    if images:
+        return images
+    width, height = (int(v) for v in size.lower().split("x"))
+    return [make_image(width, height, "jpg", seed) for seed in range(8)]
+
+
+def run_clients(clients, images, duration):
+    """Each client sends images back to back until the deadline, returns the latencies"""
+    latencies = [[] for _ in clients]
+    errors = []
+    deadline = time.monotonic() + duration
+
+    def worker(i, client):
+        n = i
+        while time.monotonic() < deadline:
+            data = images[n % len(images)]
+            n += len(clients)
+            start = time.perf_counter()
+            try:
+                client.detect(data)
+            except grpc.RpcError as e:
+                errors.append(e.code())
+                continue
+            latencies[i].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(i, c)) for i, c in enumerate(clients)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    return np.concatenate([np.array(l) for l in latencies]), elapsed, errors
+
+
+def bench(replicas, args, images):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, SERVER, "--replicas", str(replicas), "--port", str(port), *args.server_args],
+        stdout=subprocess.DEVNULL if args.quiet else None,
+    )
+    clients = [DetectorClient(f"localhost:{port}") for _ in range(args.clients)]
+    try:
+        # replicas come up one by one; a channel may reach any of them
+        for client in clients:
+            deadline = time.monotonic() + args.startup_timeout
+            while True:
+                try:
+                    client.detect(images[0])
+                    break
+                except grpc.RpcError:
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError(f"server with {replicas} replicas did not start")
+                    time.sleep(0.5)
+        run_clients(clients, images, args.warmup)
+        latencies, elapsed, errors = run_clients(clients, images, args.duration)
+    finally:
+        for client in clients:
+            client.close()
+        server.terminate()
+        server.wait()
+    return latencies, elapsed, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client threads, one channel each")
+    parser.add_argument("--duration", type=float, default=30, help="seconds measured per replica count")
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--images", help="folder with sample images (default: synthetic)")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--size", default="1280x960", help="synthetic image size")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--quiet", action="store_true", help="hide the server output")
+    parser.add_argument("server_args", nargs="*", help="extra grpc_server.py arguments, after --")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.limit, args.size)
+    print(f"{len(images)} images, {args.clients} clients, {args.duration:.0f}s per run, {os.cpu_count()} cpus")
+    rows = []
+    for replicas in args.replicas:
+        latencies, elapsed, errors = bench(replicas, args, images)
+        rows.append((replicas, latencies, elapsed, errors))
+
+    base = None
+    print(f"{'replicas':>8} {'images/s':>9} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for replicas, latencies, elapsed, errors in rows:
+        rate = len(latencies) / elapsed
+        base = base or rate or 1
+        p50, p99 = (np.percentile(latencies, [50, 99]) * 1000) if len(latencies) else (0, 0)
+        print(f"{replicas:>8} {rate:>9.1f} {rate / base:>7.2f}x {p50:>8.1f} {p99:>8.1f} {len(errors):>7}")
+
+
+if __name__ == "__main__":
+    main()
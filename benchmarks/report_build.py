@@ -0,0 +1,105 @@
+"""
+Report build time and PDF size as the number of images in the period grows.
+
+Builds the Flask app on a throwaway database and upload folder, stores
+--distinct synthetic JPEGs of --size and inserts --images detected image rows
+over one month that reference them (one defect each, types spread evenly),
+then renders the month's report twice in-process: the first build renders the
+sampled processed images, the second one can reuse cached derivatives for
+whatever images it samples again.
+
+    python -m benchmarks.report_build --images 100000 --size 4000x3000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.chunked_memory import make_image
+from src import create_app, stats
+from src.blobstore import blob_store
+from src.config import Config
+from src.detect_utils import DEFECT_NAMES
+from src.extensions import db
+from src.models import HSBatch, HSDefect, HSImage
+from src.reports import render_report
+
+
+def make_app(folder):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{folder}/bench.db"
+        UPLOAD_FOLDER = os.path.join(folder, "uploads")
+        STATIC_FOLDER = UPLOAD_FOLDER
+        REPORT_FOLDER = os.path.join(folder, "reports")
+
+    return create_app(BenchConfig)
+
+
+def seed(args, width, height, start):
+    rng = random.Random(0)
+    blobs = []
+    for seed_ in range(args.distinct):
+        relpath, image_hash = blob_store.put_bytes(make_image(width, height, "jpg", seed_), ".jpg", fsync=False)
+        blobs.append((relpath, image_hash))
+    batch = HSBatch(import_time=start)
+    db.session.add(batch)
+    db.session.flush()
+
+    rows = []
+    for i in range(args.images):
+        relpath, image_hash = blobs[i % len(blobs)]
+        when = start + timedelta(seconds=rng.randrange(28 * 24 * 3600))
+        rows.append(
+            dict(
+                image_original_path=relpath,
+                image_hash=image_hash,
+                batch_id=batch.batch_id,
+                create_time=when,
+                detect_time=when,
+                width=width,
+                height=height,
+            )
+        )
+    db.session.execute(db.insert(HSImage), rows)
+    ids = [image_id for (image_id,) in db.session.query(HSImage.image_id)]
+    db.session.execute(
+        db.insert(HSDefect),
+        [
+            dict(image_id=image_id, defect_type=DEFECT_NAMES[image_id % len(DEFECT_NAMES)], confidence=0.9)
+            for image_id in ids
+        ],
+    )
+    db.session.commit()
+    stats.rebuild()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=100000)
+    parser.add_argument("--distinct", type=int, default=8, help="distinct original files behind the rows")
+    parser.add_argument("--size", default="4000x3000")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    start = datetime(2025, 3, 1)
+    folder = tempfile.mkdtemp(prefix="report_bench_")
+    try:
+        app = make_app(folder)
+        with app.app_context():
+            seed(args, width, height, start)
+            print(f"{args.images} images of {args.size} in the period")
+            print(f"{'build':>6} {'seconds':>8} {'PDF MB':>7}")
+            for build in ("first", "second"):
+                begin = time.perf_counter()
+                data = render_report(start, start + timedelta(days=27))
+                elapsed = time.perf_counter() - begin
+                print(f"{build:>6} {elapsed:>8.2f} {len(data) / 2**20:>7.2f}")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
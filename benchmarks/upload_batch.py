@@ -0,0 +1,88 @@
+"""
+Time to upload one batch through /api/batch/create-batch.
+
+Builds the Flask app on a throwaway database and upload folder, posts
+--count synthetic JPEGs in one multipart request and reports the response
+time (files saved and fsynced, rows committed), then requests every
+thumbnail of the batch once, as the batch detail page does. Runs in-process
+through Flask's test client, so the multipart parsing is included but no
+network is involved.
+
+    python -m benchmarks.upload_batch --count 200 --size 2048x1536
+    python -m benchmarks.upload_batch --io-workers 1   # serial baseline
+"""
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.chunked_memory import make_image
+from src import create_app
+from src.config import Config
+
+
+def make_app(folder, args):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{folder}/bench.db"
+        UPLOAD_FOLDER = os.path.join(folder, "uploads")
+        STATIC_FOLDER = UPLOAD_FOLDER
+        MAX_CONTENT_LENGTH = 1024 * 1024 * 1024
+        UPLOAD_IO_WORKERS = args.io_workers
+        UPLOAD_FSYNC = args.fsync
+
+    return create_app(BenchConfig)
+
+
+def fetch_thumbnails(client, batch_id):
+    detail = client.get(f"/api/batch/get-batch-detail?batchId={batch_id}").get_json()
+    for image in detail["images"]:
+        response = client.get(image["thumbnail"])
+        if response.status_code != 200:
+            raise RuntimeError(f"thumbnail failed: {response.status_code}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--size", default="2048x1536")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--io-workers", type=int, default=Config.UPLOAD_IO_WORKERS)
+    parser.add_argument("--fsync", action=argparse.BooleanOptionalAction, default=Config.UPLOAD_FSYNC)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    images = [make_image(width, height, "jpg", seed) for seed in range(args.count)]
+    total_mb = sum(len(data) for data in images) / 2**20
+    print(f"{args.count} images of {args.size}, {total_mb:.1f} MB per batch")
+
+    responses, thumbnails = [], []
+    for _ in range(args.repeat):
+        folder = tempfile.mkdtemp(prefix="upload_bench_")
+        try:
+            client = make_app(folder, args).test_client()
+            files = [(io.BytesIO(data), f"{i}.jpg") for i, data in enumerate(images)]
+            start = time.perf_counter()
+            response = client.post(
+                "/api/batch/create-batch", data={"images": files}, content_type="multipart/form-data"
+            )
+            responded = time.perf_counter() - start
+            if response.status_code != 201:
+                raise RuntimeError(f"upload failed: {response.status_code} {response.get_json()}")
+            start = time.perf_counter()
+            fetch_thumbnails(client, response.get_json()["batchId"])
+            thumbnails.append(time.perf_counter() - start)
+            responses.append(responded)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    response_s, thumbnail_s = np.median(responses), np.median(thumbnails)
+    print(f"{'response s':>11} {'images/s':>9} {'thumbnails s':>13}")
+    print(f"{response_s:>11.2f} {args.count / response_s:>9.1f} {thumbnail_s:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,19 +24,37 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0c\x64\x65tect.proto\x12\x06\x64\x65tect\"#\n\rDetectRequest\x12\x12\n\nimage_data\x18\x01 \x01(\x0c\"A\n\x0c\x44\x65tectResult\x12\x0b\n\x03\x62ox\x18\x01 \x03(\x02\x12\x12\n\nconfidence\x18\x02 \x01(\x02\x12\x10\n\x08\x63lass_id\x18\x03 \x01(\x05\"P\n\x0e\x44\x65tectResponse\x12%\n\x07results\x18\x01 \x03(\x0b\x32\x14.detect.DetectResult\x12\x17\n\x0fprocessed_image\x18\x02 \x01(\x0c\x32\x43\n\x08\x44\x65tector\x12\x37\n\x06\x44\x65tect\x12\x15.detect.DetectRequest\x1a\x16.detect.DetectResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0c\x64\x65tect.proto\x12\x06\x64\x65tect\"\x8e\x01\n\rDetectRequest\x12\x12\n\nimage_data\x18\x01 \x01(\x0c\x12\x13\n\x0bskip_render\x18\x02 \x01(\x08\x12\x11\n\ttile_size\x18\x03 \x01(\x05\x12\x14\n\x0ctile_overlap\x18\x04 \x01(\x05\x12\x17\n\x0fmerge_threshold\x18\x05 \x01(\x02\x12\x12\n\nconfidence\x18\x06 \x01(\x02\"8\n\x07MaskRLE\x12\x0e\n\x06height\x18\x01 \x01(\x05\x12\r\n\x05width\x18\x02 \x01(\x05\x12\x0e\n\x06\x63ounts\x18\x03 \x03(\r\"`\n\x0c\x44\x65tectResult\x12\x0b\n\x03\x62ox\x18\x01 \x03(\x02\x12\x12\n\nconfidence\x18\x02 \x01(\x02\x12\x10\n\x08\x63lass_id\x18\x03 \x01(\x05\x12\x1d\n\x04mask\x18\x04 \x01(\x0b\x32\x0f.detect.MaskRLE\"\x7f\n\x0e\x44\x65tectResponse\x12%\n\x07results\x18\x01 \x03(\x0b\x32\x14.detect.DetectResult\x12\x17\n\x0fprocessed_image\x18\x02 \x01(\x0c\x12\x16\n\x0eprocessed_path\x18\x03 \x01(\t\x12\x15\n\rmodel_version\x18\x04 \x01(\t\"=\n\x12\x44\x65tectBatchRequest\x12\'\n\x08requests\x18\x01 \x03(\x0b\x32\x15.detect.DetectRequest\"@\n\x13\x44\x65tectBatchResponse\x12)\n\tresponses\x18\x01 \x03(\x0b\x32\x16.detect.DetectResponse\"W\n\x0b\x44\x65tectChunk\x12\x12\n\ntotal_size\x18\x01 \x01(\x04\x12&\n\x07options\x18\x02 \x01(\x0b\x32\x15.detect.DetectRequest\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\"\x91\x01\n\x12\x44\x65tectLocalRequest\x12\x0e\n\x04path\x18\x01 \x01(\tH\x00\x12\x12\n\x08shm_name\x18\x02 \x01(\tH\x00\x12\x10\n\x08shm_size\x18\x03 \x01(\x04\x12&\n\x07options\x18\x04 \x01(\x0b\x32\x15.detect.DetectRequest\x12\x13\n\x0boutput_path\x18\x05 \x01(\tB\x08\n\x06source\"B\n\x0b\x44\x65tectFrame\x12\x0b\n\x03seq\x18\x01 \x01(\x04\x12\x12\n\nimage_data\x18\x02 \x01(\x0c\x12\x12\n\nconfidence\x18\x03 \x01(\x02\"Y\n\x11\x44\x65tectFrameResult\x12\x0b\n\x03seq\x18\x01 \x01(\x04\x12(\n\x08response\x18\x02 \x01(\x0b\x32\x16.detect.DetectResponse\x12\r\n\x05\x65rror\x18\x03 \x01(\t\"\x0f\n\rHealthRequest\"H\n\x0eHealthResponse\x12\x0f\n\x07serving\x18\x01 \x01(\x08\x12\x0e\n\x06queued\x18\x02 \x01(\x05\x12\x15\n\rmodel_version\x18\x03 \x01(\t2\x8b\x03\n\x08\x44\x65tector\x12\x37\n\x06\x44\x65tect\x12\x15.detect.DetectRequest\x1a\x16.detect.DetectResponse\x12\x46\n\x0b\x44\x65tectBatch\x12\x1a.detect.DetectBatchRequest\x1a\x1b.detect.DetectBatchResponse\x12\x42\n\x0c\x44\x65tectStream\x12\x13.detect.DetectFrame\x1a\x19.detect.DetectFrameResult(\x01\x30\x01\x12>\n\rDetectChunked\x12\x13.detect.DetectChunk\x1a\x16.detect.DetectResponse(\x01\x12\x41\n\x0b\x44\x65tectLocal\x12\x1a.detect.DetectLocalRequest\x1a\x16.detect.DetectResponse\x12\x37\n\x06Health\x12\x15.detect.HealthRequest\x1a\x16.detect.HealthResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'detect_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_DETECTREQUEST']._serialized_start=24
-  _globals['_DETECTREQUEST']._serialized_end=59
-  _globals['_DETECTRESULT']._serialized_start=61
-  _globals['_DETECTRESULT']._serialized_end=126
-  _globals['_DETECTRESPONSE']._serialized_start=128
-  _globals['_DETECTRESPONSE']._serialized_end=208
-  _globals['_DETECTOR']._serialized_start=210
-  _globals['_DETECTOR']._serialized_end=277
+  _globals['_DETECTREQUEST']._serialized_start=25
+  _globals['_DETECTREQUEST']._serialized_end=167
+  _globals['_MASKRLE']._serialized_start=169
+  _globals['_MASKRLE']._serialized_end=225
+  _globals['_DETECTRESULT']._serialized_start=227
+  _globals['_DETECTRESULT']._serialized_end=323
+  _globals['_DETECTRESPONSE']._serialized_start=325
+  _globals['_DETECTRESPONSE']._serialized_end=452
+  _globals['_DETECTBATCHREQUEST']._serialized_start=454
+  _globals['_DETECTBATCHREQUEST']._serialized_end=515
+  _globals['_DETECTBATCHRESPONSE']._serialized_start=517
+  _globals['_DETECTBATCHRESPONSE']._serialized_end=581
+  _globals['_DETECTCHUNK']._serialized_start=583
+  _globals['_DETECTCHUNK']._serialized_end=670
+  _globals['_DETECTLOCALREQUEST']._serialized_start=673
+  _globals['_DETECTLOCALREQUEST']._serialized_end=818
+  _globals['_DETECTFRAME']._serialized_start=820
+  _globals['_DETECTFRAME']._serialized_end=886
+  _globals['_DETECTFRAMERESULT']._serialized_start=888
+  _globals['_DETECTFRAMERESULT']._serialized_end=977
+  _globals['_HEALTHREQUEST']._serialized_start=979
+  _globals['_HEALTHREQUEST']._serialized_end=994
+  _globals['_HEALTHRESPONSE']._serialized_start=996
+  _globals['_HEALTHRESPONSE']._serialized_end=1068
+  _globals['_DETECTOR']._serialized_start=1071
+  _globals['_DETECTOR']._serialized_end=1466
 # @@protoc_insertion_point(module_scope)
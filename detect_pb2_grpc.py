@@ -1,5 +1,6 @@
 # Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
 """Client and server classes corresponding to protobuf-defined services."""
+
 import grpc
 import warnings
 
@@ -43,13 +44,79 @@ class DetectorStub(object):
             response_deserializer=detect__pb2.DetectResponse.FromString,
             _registered_method=True,
         )
+        self.DetectBatch = channel.unary_unary(
+            "/detect.Detector/DetectBatch",
+            request_serializer=detect__pb2.DetectBatchRequest.SerializeToString,
+            response_deserializer=detect__pb2.DetectBatchResponse.FromString,
+            _registered_method=True,
+        )
+        self.DetectStream = channel.stream_stream(
+            "/detect.Detector/DetectStream",
+            request_serializer=detect__pb2.DetectFrame.SerializeToString,
+            response_deserializer=detect__pb2.DetectFrameResult.FromString,
+            _registered_method=True,
+        )
+        self.DetectChunked = channel.stream_unary(
+            "/detect.Detector/DetectChunked",
+            request_serializer=detect__pb2.DetectChunk.SerializeToString,
+            response_deserializer=detect__pb2.DetectResponse.FromString,
+            _registered_method=True,
+        )
+        self.DetectLocal = channel.unary_unary(
+            "/detect.Detector/DetectLocal",
+            request_serializer=detect__pb2.DetectLocalRequest.SerializeToString,
+            response_deserializer=detect__pb2.DetectResponse.FromString,
+            _registered_method=True,
+        )
+        self.Health = channel.unary_unary(
+            "/detect.Detector/Health",
+            request_serializer=detect__pb2.HealthRequest.SerializeToString,
+            response_deserializer=detect__pb2.HealthResponse.FromString,
+            _registered_method=True,
+        )
 
 
 class DetectorServicer(object):
     """Missing associated documentation comment in .proto file."""
 
     def Detect(self, request, context):
-        """Performs detection on a given image path"""
+        """Performs detection on the encoded image sent in the request"""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def DetectBatch(self, request, context):
+        """Performs detection on several images in one call"""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def DetectStream(self, request_iterator, context):
+        """Long-lived stream of video frames, results are tagged with the frame seq
+        and may be returned out of order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def DetectChunked(self, request_iterator, context):
+        """Detection on an image uploaded in chunks, so large images never have to
+        fit into a single message
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def DetectLocal(self, request, context):
+        """Detection on an image the server reads itself, for clients on the same
+        host: a file path or a shared memory segment instead of image bytes
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details("Method not implemented!")
+        raise NotImplementedError("Method not implemented!")
+
+    def Health(self, request, context):
+        """Cheap liveness / readiness / load probe used by client-side load balancing"""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details("Method not implemented!")
         raise NotImplementedError("Method not implemented!")
@@ -62,6 +129,31 @@ def add_DetectorServicer_to_server(servicer, server):
             request_deserializer=detect__pb2.DetectRequest.FromString,
             response_serializer=detect__pb2.DetectResponse.SerializeToString,
         ),
+        "DetectBatch": grpc.unary_unary_rpc_method_handler(
+            servicer.DetectBatch,
+            request_deserializer=detect__pb2.DetectBatchRequest.FromString,
+            response_serializer=detect__pb2.DetectBatchResponse.SerializeToString,
+        ),
+        "DetectStream": grpc.stream_stream_rpc_method_handler(
+            servicer.DetectStream,
+            request_deserializer=detect__pb2.DetectFrame.FromString,
+            response_serializer=detect__pb2.DetectFrameResult.SerializeToString,
+        ),
+        "DetectChunked": grpc.stream_unary_rpc_method_handler(
+            servicer.DetectChunked,
+            request_deserializer=detect__pb2.DetectChunk.FromString,
+            response_serializer=detect__pb2.DetectResponse.SerializeToString,
+        ),
+        "DetectLocal": grpc.unary_unary_rpc_method_handler(
+            servicer.DetectLocal,
+            request_deserializer=detect__pb2.DetectLocalRequest.FromString,
+            response_serializer=detect__pb2.DetectResponse.SerializeToString,
+        ),
+        "Health": grpc.unary_unary_rpc_method_handler(
+            servicer.Health,
+            request_deserializer=detect__pb2.HealthRequest.FromString,
+            response_serializer=detect__pb2.HealthResponse.SerializeToString,
+        ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
         "detect.Detector", rpc_method_handlers
@@ -103,3 +195,153 @@ class Detector(object):
             metadata,
             _registered_method=True,
         )
+
+    @staticmethod
+    def DetectBatch(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/detect.Detector/DetectBatch",
+            detect__pb2.DetectBatchRequest.SerializeToString,
+            detect__pb2.DetectBatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
+    @staticmethod
+    def DetectStream(
+        request_iterator,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            "/detect.Detector/DetectStream",
+            detect__pb2.DetectFrame.SerializeToString,
+            detect__pb2.DetectFrameResult.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
+    @staticmethod
+    def DetectChunked(
+        request_iterator,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            "/detect.Detector/DetectChunked",
+            detect__pb2.DetectChunk.SerializeToString,
+            detect__pb2.DetectResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
+    @staticmethod
+    def DetectLocal(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/detect.Detector/DetectLocal",
+            detect__pb2.DetectLocalRequest.SerializeToString,
+            detect__pb2.DetectResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
+
+    @staticmethod
+    def Health(
+        request,
+        target,
+        options=(),
+        channel_credentials=None,
+        call_credentials=None,
+        insecure=False,
+        compression=None,
+        wait_for_ready=None,
+        timeout=None,
+        metadata=None,
+    ):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            "/detect.Detector/Health",
+            detect__pb2.HealthRequest.SerializeToString,
+            detect__pb2.HealthResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True,
+        )
@@ -0,0 +1,192 @@
+"""
+Inference backends for the segmentation model.
+
+Every backend is loaded through ultralytics' YOLO class, so the predict() call
+and the Results objects are the same whichever runtime executes the network:
+
+    torch     the .pt checkpoint, as before
+    onnx      exported to ONNX and run by ONNX Runtime (CPU)
+    openvino  exported to OpenVINO IR and run by the OpenVINO runtime
+
+Exports are written next to the checkpoint and reused as long as they are
+newer than it. With int8=True the exported model is additionally quantized
+with static (calibrated) INT8 quantization, using sample images from
+calib_dir: onnxruntime.quantization for ONNX, NNCF for OpenVINO.
+
+onnxruntime, openvino and nncf are optional and only needed for the
+backends that use them.
+"""
+import glob
+import os
+import random
+import shutil
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+BACKENDS = ("torch", "onnx", "openvino")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+# derived files written next to the originals in the upload folder
+DERIVED_SUFFIXES = ("_processed", "_thumbnail")
+
+
+def backend_name(backend, int8=False):
+    return f"{backend}-int8" if int8 else backend
+
+
+def prepare_model(model_path, backend="torch", int8=False, calib_dir=None,
+                  calib_size=300, imgsz=640):
+    """Export/quantize the model for the backend if needed, returns the path to load"""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "torch":
+        if int8:
+            raise ValueError("int8 is only supported by the onnx and openvino backends")
+        return model_path
+    if int8:
+        samples = calibration_images(calib_dir, calib_size)
+        if not samples:
+            raise ValueError(f"no calibration images found in {calib_dir!r}")
+        if backend == "onnx":
+            return quantize_onnx(model_path, samples, imgsz)
+        return quantize_openvino(model_path, samples, imgsz)
+    return export(model_path, backend, imgsz)
+
+
+def load_model(model_path, backend="torch", int8=False, calib_dir=None,
+               calib_size=300, imgsz=640):
+    """Return a YOLO model for the given backend, exporting/quantizing on first use."""
+    return open_model(prepare_model(model_path, backend, int8, calib_dir, calib_size, imgsz))
+
+
+def open_model(path):
+    """Load a model returned by prepare_model (.pt, .onnx or an OpenVINO directory)"""
+    return YOLO(path, task="segment")
+
+
+def _stem(model_path):
+    return os.path.splitext(model_path)[0]
+
+
+def _up_to_date(artifact, model_path):
+    return os.path.exists(artifact) and os.path.getmtime(artifact) >= os.path.getmtime(model_path)
+
+
+def export(model_path, backend, imgsz=640):
+    """Export the checkpoint once, returns the ONNX file or OpenVINO model directory"""
+    target = _stem(model_path) + (".onnx" if backend == "onnx" else "_openvino_model")
+    if not _up_to_date(target, model_path):
+        # dynamic axes keep micro-batches of any size working
+        exported = YOLO(model_path, task="segment").export(
+            format=backend, imgsz=imgsz, dynamic=True, half=False
+        )
+        if os.path.abspath(exported) != os.path.abspath(target):
+            shutil.move(exported, target)
+    return target
+
+
+def calibration_images(folder, limit=300, seed=0):
+    """Original (not processed/thumbnail) images under folder, a fixed random sample of at most limit"""
+    if not folder or not os.path.isdir(folder):
+        return []
+    paths = [
+        p for p in glob.glob(os.path.join(folder, "**", "*"), recursive=True)
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+        and not os.path.splitext(p)[0].endswith(DERIVED_SUFFIXES)
+    ]
+    paths.sort()
+    random.Random(seed).shuffle(paths)
+    return paths[:limit]
+
+
+def preprocess(path, imgsz=640):
+    """The same letterbox + RGB + [0, 1] NCHW input ultralytics feeds the network"""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * scale), round(w * scale)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255
+    return np.ascontiguousarray(tensor[None])
+
+
+def _calibration_tensors(samples, imgsz):
+    for path in samples:
+        tensor = preprocess(path, imgsz)
+        if tensor is not None:
+            yield tensor
+
+
+def quantize_onnx(model_path, samples, imgsz=640):
+    """Static INT8 (QDQ, per-channel weights) quantization of the exported ONNX model"""
+    try:
+        import onnx
+        from onnxruntime.quantization import (
+            CalibrationDataReader, QuantFormat, QuantType, quantize_static,
+        )
+    except ImportError as e:
+        raise RuntimeError("INT8 ONNX needs onnx and onnxruntime installed") from e
+
+    target = _stem(model_path) + "_int8.onnx"
+    if _up_to_date(target, model_path):
+        return target
+    source = export(model_path, "onnx", imgsz)
+    input_name = onnx.load(source, load_external_data=False).graph.input[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._tensors = _calibration_tensors(samples, imgsz)
+
+        def get_next(self):
+            tensor = next(self._tensors, None)
+            return None if tensor is None else {input_name: tensor}
+
+    quantize_static(
+        source, target, Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    # ultralytics reads stride/names/imgsz from the model metadata
+    fp32, int8 = onnx.load(source), onnx.load(target)
+    del int8.metadata_props[:]
+    int8.metadata_props.extend(fp32.metadata_props)
+    onnx.save(int8, target)
+    return target
+
+
+def quantize_openvino(model_path, samples, imgsz=640):
+    """Post-training INT8 quantization of the exported OpenVINO model with NNCF"""
+    try:
+        import nncf
+        import openvino as ov
+    except ImportError as e:
+        raise RuntimeError("INT8 OpenVINO needs openvino and nncf installed") from e
+
+    target = _stem(model_path) + "_int8_openvino_model"
+    if _up_to_date(target, model_path):
+        return target
+    source = export(model_path, "openvino", imgsz)
+    xml = glob.glob(os.path.join(source, "*.xml"))[0]
+    model = ov.Core().read_model(xml)
+    quantized = nncf.quantize(
+        model,
+        nncf.Dataset(list(_calibration_tensors(samples, imgsz))),
+        preset=nncf.QuantizationPreset.MIXED,
+        subset_size=len(samples),
+    )
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    ov.save_model(quantized, os.path.join(tmp, os.path.basename(xml)))
+    shutil.copy(os.path.join(source, "metadata.yaml"), tmp)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
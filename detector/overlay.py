@@ -0,0 +1,58 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class MaskOverlay:
+    """
+    Blends all segmentation masks onto an image in a single pass.
+
+    The masks are reduced to one class-index map at mask resolution with a
+    single tensor op (later masks win where they overlap), moved to the CPU
+    once, resized once with nearest-neighbour, colour-mapped through a LUT and
+    blended with one addWeighted. Full-size scratch buffers are kept per
+    thread and reused while the image size does not change.
+    """
+
+    def __init__(self, colors, alpha=0.35):
+        # index 0 is background and maps to black, which leaves pixels unchanged
+        self.lut = np.array([(0, 0, 0)] + list(colors), dtype=np.uint8)
+        self.alpha = alpha
+        self._local = threading.local()
+
+    def _buffer(self, name, shape, dtype):
+        buf = getattr(self._local, name, None)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            setattr(self._local, name, buf)
+        return buf
+
+    @staticmethod
+    def class_map(masks, class_ids):
+        """(N, h, w) masks + (N,) class ids -> (h, w) uint8 map, 0 = background, c + 1 = class c"""
+        # imported here so that blend() works in processes without torch
+        import torch
+
+        n = masks.shape[0]
+        order = torch.arange(1, n + 1, device=masks.device, dtype=torch.int32)
+        winner = ((masks > 0.5) * order.view(-1, 1, 1)).amax(dim=0)
+        lut = torch.zeros(n + 1, device=masks.device, dtype=torch.uint8)
+        lut[1:] = torch.as_tensor(class_ids, device=masks.device).to(torch.uint8) + 1
+        return lut[winner.long()].cpu().numpy()
+
+    def apply(self, img, masks, class_ids):
+        """Blend masks onto img in place and return it"""
+        if masks is None or masks.shape[0] == 0:
+            return img
+        return self.blend(img, self.class_map(masks, class_ids))
+
+    def blend(self, img, small):
+        """Blend a class-index map (any resolution, 0 = background) onto img in place"""
+        height, width = img.shape[:2]
+        full = self._buffer("classes", (height, width), np.uint8)
+        cv2.resize(small, (width, height), dst=full, interpolation=cv2.INTER_NEAREST)
+        colored = self._buffer("colored", (height, width, 3), np.uint8)
+        np.take(self.lut, full, axis=0, out=colored)
+        cv2.addWeighted(img, 1, colored, self.alpha, 0, dst=img)
+        return img
@@ -0,0 +1,124 @@
+"""
+The model currently served, and zero-downtime swaps to a new one.
+
+A ModelSource turns the checkpoint on disk into a loaded model and a version
+string (checkpoint name, backend and a digest of the checkpoint), so the
+version changes whenever the file does. The ModelRegistry holds the active
+version together with its micro-batcher: a new model is warmed up with
+synthetic images before it takes any traffic, then swapped in atomically.
+Calls that already submitted work to the previous model finish on it, and
+its batcher is stopped once everything queued there has been predicted.
+"""
+import contextlib
+import fcntl
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from detector.backends import backend_name, open_model, prepare_model
+
+
+class ModelNotReady(Exception):
+    """No model has finished loading and warming up yet"""
+
+
+def checkpoint_version(path, backend="torch"):
+    """<checkpoint name>-<backend>-<first 8 hex digits of the checkpoint's sha256>"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while piece := f.read(1 << 20):
+            digest.update(piece)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{name}-{backend}-{digest.hexdigest()[:8]}"
+
+
+class ModelSource:
+    """The checkpoint behind the served model; changed() tells when it should be reloaded"""
+
+    def __init__(self, path, backend="torch", int8=False, calib_dir=None, calib_size=300):
+        self.path = path
+        self.backend = backend
+        self.int8 = int8
+        self.calib_dir = calib_dir
+        self.calib_size = calib_size
+        self._mtime = None
+
+    def changed(self):
+        try:
+            return os.path.getmtime(self.path) != self._mtime
+        except FileNotFoundError:
+            # being replaced right now, look again later
+            return False
+
+    def prepare(self):
+        """Export/quantize for the backend; the lock keeps replicas from exporting at the same time"""
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            return prepare_model(self.path, self.backend, self.int8, self.calib_dir, self.calib_size)
+
+    def load(self):
+        """Returns (model, version) for the checkpoint as it is now"""
+        # remembered up front, so a broken file is not retried until it changes again
+        self._mtime = os.path.getmtime(self.path)
+        version = checkpoint_version(self.path, backend_name(self.backend, self.int8))
+        return open_model(self.prepare()), version
+
+
+def warm_up(batcher, rounds=2, size=640):
+    """
+    Run synthetic images through the batcher, a single image and a full batch
+    per round, so lazy initialisation (graph compilation, memory pools, kernel
+    selection) happens before real requests arrive
+    """
+    rng = np.random.default_rng(0)
+    for _ in range(rounds):
+        for count in sorted({1, batcher.max_batch_size}):
+            batcher.predict([rng.integers(0, 256, (size, size, 3), dtype=np.uint8) for _ in range(count)])
+
+
+class ModelVersion:
+    """A loaded model's batcher, with the number of calls currently submitting to it"""
+
+    def __init__(self, version, batcher):
+        self.version = version
+        self.batcher = batcher
+        self.users = 0
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._current = None
+        self._cond = threading.Condition()
+
+    @property
+    def current(self):
+        return self._current
+
+    def activate(self, version, batcher):
+        """Serve batcher (already warmed up) from now on; returns once the previous one has drained"""
+        with self._cond:
+            previous, self._current = self._current, ModelVersion(version, batcher)
+            # new calls go to the new model; wait for the ones still submitting to the old one
+            while previous is not None and previous.users:
+                self._cond.wait()
+        if previous is not None:
+            # stops after predicting everything already queued
+            previous.batcher.close()
+        return previous
+
+    @contextlib.contextmanager
+    def use(self):
+        """The active ModelVersion; submit to its batcher inside the with block"""
+        with self._cond:
+            current = self._current
+            if current is None:
+                raise ModelNotReady("model is still loading")
+            current.users += 1
+        try:
+            yield current
+        finally:
+            with self._cond:
+                current.users -= 1
+                self._cond.notify_all()
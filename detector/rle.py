@@ -0,0 +1,19 @@
+import numpy as np
+
+
+def rle_encode(mask):
+    """Row-major run lengths of a 2-D boolean mask, starting with a background run"""
+    flat = np.asarray(mask, dtype=bool).ravel()
+    if flat.size == 0:
+        return np.zeros(0, dtype=np.uint32)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    counts = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+    return counts.astype(np.uint32)
+
+
+def rle_decode(counts, height, width):
+    values = np.zeros(len(counts), dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, np.asarray(counts, dtype=np.int64)).reshape(height, width)
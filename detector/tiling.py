@@ -0,0 +1,137 @@
+"""
+Tiled inference helpers for images much larger than the model input.
+
+The image is cut into overlapping tile_size x tile_size tiles (edge tiles are
+shifted inwards so every tile is full size when the image allows it), every
+tile is detected at full resolution and the detections are mapped back to
+image coordinates. An object crossing a seam is seen as two partial
+detections, so same-class detections are merged greedily when their
+intersection covers at least merge_threshold of the smaller box: boxes are
+united, the confidence is the maximum and the masks are united too.
+"""
+import cv2
+import numpy as np
+
+DEFAULT_OVERLAP_RATIO = 0.2
+DEFAULT_MERGE_THRESHOLD = 0.5
+
+
+def tile_starts(length, tile_size, overlap):
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """(x0, y0, x1, y1) of the tiles covering a width x height image"""
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in tile_starts(height, tile_size, overlap)
+        for x0 in tile_starts(width, tile_size, overlap)
+    ]
+
+
+class TileDetection:
+    """A detection in image coordinates; its mask is kept as per-tile parts"""
+
+    __slots__ = ("box", "confidence", "class_id", "parts")
+
+    def __init__(self, box, confidence, class_id, parts):
+        self.box = box
+        self.confidence = confidence
+        self.class_id = class_id
+        # [(x0, y0, bool mask of the tile's size)]
+        self.parts = parts
+
+    @property
+    def area(self):
+        return max(self.box[2] - self.box[0], 0) * max(self.box[3] - self.box[1], 0)
+
+    def absorb(self, other):
+        self.box = [
+            min(self.box[0], other.box[0]),
+            min(self.box[1], other.box[1]),
+            max(self.box[2], other.box[2]),
+            max(self.box[3], other.box[3]),
+        ]
+        self.confidence = max(self.confidence, other.confidence)
+        self.parts.extend(other.parts)
+
+
+def tile_detections(r, tile):
+    """ultralytics Results of one tile -> TileDetections in image coordinates"""
+    x0, y0, x1, y1 = tile
+    width, height = x1 - x0, y1 - y0
+    masks = None
+    if r.masks:
+        masks = (r.masks.data > 0.5).cpu().numpy().astype(np.uint8)
+    detections = []
+    for i, box in enumerate(r.boxes.xyxy):
+        bx1, by1, bx2, by2 = box.tolist()
+        parts = []
+        if masks is not None:
+            mask = cv2.resize(masks[i], (width, height), interpolation=cv2.INTER_NEAREST)
+            parts.append((x0, y0, mask.astype(bool)))
+        detections.append(
+            TileDetection(
+                [bx1 + x0, by1 + y0, bx2 + x0, by2 + y0],
+                float(r.boxes.conf[i].item()),
+                int(r.boxes.cls[i].item()),
+                parts,
+            )
+        )
+    return detections
+
+
+def _overlap_ratio(a, b):
+    """intersection over the smaller of the two boxes"""
+    iw = min(a.box[2], b.box[2]) - max(a.box[0], b.box[0])
+    ih = min(a.box[3], b.box[3]) - max(a.box[1], b.box[1])
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    smaller = min(a.area, b.area)
+    return iw * ih / smaller if smaller > 0 else 0.0
+
+
+def merge_detections(detections, threshold=DEFAULT_MERGE_THRESHOLD):
+    """Greedy same-class merging by confidence, repeated until nothing overlaps enough"""
+    merged = sorted(detections, key=lambda d: d.confidence, reverse=True)
+    changed = True
+    while changed:
+        changed = False
+        kept = []
+        for det in merged:
+            for keeper in kept:
+                if keeper.class_id == det.class_id and _overlap_ratio(keeper, det) >= threshold:
+                    keeper.absorb(det)
+                    changed = True
+                    break
+            else:
+                kept.append(det)
+        merged = kept
+    return merged
+
+
+def paste_mask(detection, height, width, out=None):
+    """Union of a detection's mask parts on a height x width canvas"""
+    if out is None:
+        out = np.zeros((height, width), dtype=bool)
+    else:
+        out.fill(False)
+    for x0, y0, mask in detection.parts:
+        h, w = mask.shape
+        out[y0:y0 + h, x0:x0 + w] |= mask
+    return out
+
+
+def class_map(detections, height, width):
+    """(height, width) uint8 map, 0 = background, c + 1 = class c; higher confidence wins"""
+    classes = np.zeros((height, width), dtype=np.uint8)
+    for det in sorted(detections, key=lambda d: d.confidence):
+        for x0, y0, mask in det.parts:
+            h, w = mask.shape
+            classes[y0:y0 + h, x0:x0 + w][mask] = det.class_id + 1
+    return classes
@@ -1,71 +1,648 @@
+import argparse
+import itertools
+import mmap
+import multiprocessing
 import os
+import queue
+import signal
+import threading
 from concurrent import futures
 import time
+from multiprocessing import resource_tracker, shared_memory
+
 import grpc
 import cv2
 import numpy as np
-from ultralytics import YOLO
 
-import src.grpc.detect_pb2 as detect_pb2
-import src.grpc.detect_pb2_grpc as detect_pb2_grpc
+import detect_pb2
+import detect_pb2_grpc
+from detector.backends import BACKENDS, backend_name
+from detector.registry import ModelNotReady, ModelRegistry, ModelSource, warm_up
+from detector import tiling
+from detector.overlay import MaskOverlay
+from detector.rle import rle_encode
 
 # Path to the YOLO model
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "./models/seg_n.pt")
 # Class names
 DEFECT_NAMES = ["边缘裂纹", "横向裂纹", "表面杂质", "斑块缺陷"]
 colors = [(255, 0, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255)]
+overlay = MaskOverlay(colors)
+CONF_THRESHOLD = 0.4
 
-# Load model globally
-yolo_model = YOLO(MODEL_PATH, task="segment")
+PORT = int(os.environ.get("DETECT_PORT", "50051"))
 
+# Micro-batching: requests arriving within the window are run through one predict call
+MAX_BATCH_SIZE = int(os.environ.get("DETECT_MAX_BATCH_SIZE", "8"))
+BATCH_WINDOW_MS = float(os.environ.get("DETECT_BATCH_WINDOW_MS", "10"))
+# Largest encoded image accepted by DetectChunked
+MAX_CHUNKED_SIZE = int(os.environ.get("DETECT_MAX_CHUNKED_MB", "512")) * 1024 * 1024
 
-class DetectorServicer(detect_pb2_grpc.DetectorServicer):
-    def Detect(self, request, context):
-        # Decode raw image bytes
-        nparr = np.frombuffer(request.image_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        # Run prediction directly on image array
-        result = yolo_model.predict(source=img, conf=0.4)
-        r = result[0]
-        response = detect_pb2.DetectResponse()
-        # Apply masks and boxes
-        if r.masks:
-            masks = r.masks.data
-            for i, mask in enumerate(masks):
-                class_id = int(r.boxes.cls[i].item())
-                mask_arr = (mask.cpu().numpy() * 255).astype(np.uint8)
-                mask_arr = cv2.resize(mask_arr, (img.shape[1], img.shape[0]))
-                colored_mask = np.zeros_like(img, dtype=np.uint8)
-                colored_mask[:, :, 0] = colors[class_id][0] * (mask_arr > 0)
-                colored_mask[:, :, 1] = colors[class_id][1] * (mask_arr > 0)
-                colored_mask[:, :, 2] = colors[class_id][2] * (mask_arr > 0)
-                img = cv2.addWeighted(img, 1, colored_mask, 0.35, 0)
-        # Draw boxes
-        for i, box in enumerate(r.boxes.xyxy):
-            x1, y1, x2, y2 = box.tolist()
-            response.results.add(
-                box=[x1, y1, x2, y2],
-                confidence=float(r.boxes.conf[i].item()),
-                class_id=int(r.boxes.cls[i].item()),
-            )
-        # Encode processed image to bytes
+# Inference backend (torch / onnx / openvino), optionally INT8-quantized with
+# calibration images from the upload folder; overridable on the command line
+BACKEND = os.environ.get("DETECT_BACKEND", "torch")
+INT8 = os.environ.get("DETECT_INT8", "0") == "1"
+UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "instance/uploads")
+CALIB_DIR = os.environ.get("DETECT_CALIB_DIR", UPLOAD_DIR)
+CALIB_SIZE = int(os.environ.get("DETECT_CALIB_SIZE", "300"))
+# DetectLocal only reads and writes files below this directory
+LOCAL_ROOT = os.path.realpath(os.environ.get("DETECT_LOCAL_ROOT", UPLOAD_DIR))
+# Warm-up rounds before a model takes traffic, and how often (seconds) the
+# checkpoint is checked for changes to hot-swap in (0 = only on SIGHUP)
+WARMUP_ROUNDS = int(os.environ.get("DETECT_WARMUP_ROUNDS", "2"))
+RELOAD_INTERVAL = float(os.environ.get("DETECT_RELOAD_INTERVAL", "10"))
+
+
+class MicroBatcher:
+    """Gathers images from concurrent calls and runs them through one batched predict."""
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, window_ms=BATCH_WINDOW_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, img, conf=CONF_THRESHOLD):
+        """Queue a decoded image, returns a Future resolving to its ultralytics Results."""
+        future = futures.Future()
+        self._queue.put((img, conf, future))
+        return future
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def predict(self, imgs):
+        return [f.result() for f in [self.submit(img) for img in imgs]]
+
+    def close(self):
+        """Stop once everything submitted so far has been predicted"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # run this batch first, stop on the next round
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while (batch := self._collect()) is not None:
+            # one predict call per confidence threshold in the batch, usually just one
+            groups = {}
+            for img, conf, future in batch:
+                groups.setdefault(conf, []).append((img, future))
+            for conf, group in groups.items():
+                try:
+                    results = self.model.predict(
+                        source=[img for img, _ in group], conf=conf
+                    )
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+                for (_, future), r in zip(group, results):
+                    future.set_result(r)
+
+
+def decode_image(image_data):
+    nparr = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image data")
+    return img
+
+
+def inside_local_root(path):
+    real = os.path.realpath(path)
+    return os.path.commonpath([real, LOCAL_ROOT]) == LOCAL_ROOT
+
+
+def attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks the segment and would unlink the
+        # client's segment when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def read_local(request):
+    """Decode a DetectLocal source in place, without copying it into a message"""
+    source = request.WhichOneof("source")
+    if source == "path":
+        with open(request.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("Image file is empty")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return decode_image(mm)
+    if source == "shm_name":
+        shm = attach_shared_memory(request.shm_name)
+        try:
+            size = request.shm_size or shm.size
+            if size > shm.size:
+                raise ValueError("shm_size is larger than the segment")
+            return decode_image(shm.buf[:size])
+        finally:
+            shm.close()
+    raise ValueError("Either path or shm_name is required")
+
+
+def write_image(path, img):
+    """Encode in the format given by the extension and move into place atomically"""
+    ext = os.path.splitext(path)[1] or ".jpg"
+    ok, buffer = cv2.imencode(ext, img)
+    if not ok:
+        raise ValueError(f"Could not encode image as {ext}")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    buffer.tofile(tmp)
+    os.replace(tmp, path)
+
+
+def receive_chunks(request_iterator):
+    """Copy a chunked upload into one buffer allocated up front, returns (options, buffer)"""
+    first = next(request_iterator, None)
+    if first is None:
+        raise ValueError("Empty upload")
+    total = first.total_size
+    if not 0 < total <= MAX_CHUNKED_SIZE:
+        raise ValueError(f"total_size must be between 1 and {MAX_CHUNKED_SIZE} bytes")
+    buffer = np.empty(total, dtype=np.uint8)
+    offset = 0
+    for chunk in itertools.chain([first], request_iterator):
+        end = offset + len(chunk.data)
+        if end > total:
+            raise ValueError("Upload is larger than total_size")
+        buffer[offset:end] = np.frombuffer(chunk.data, np.uint8)
+        offset = end
+    if offset != total:
+        raise ValueError("Upload ended before total_size bytes")
+    return first.options, buffer
+
+
+def encode_output(img, response, output_path=None):
+    """Put the rendered image into the response, or write it to output_path"""
+    if output_path:
+        write_image(output_path, img)
+        response.processed_path = output_path
+    else:
         _, buffer = cv2.imencode(".jpg", img)
         response.processed_image = buffer.tobytes()
+    return response
+
+
+def build_response(img, r, skip_render=False, output_path=None):
+    response = detect_pb2.DetectResponse()
+    for i, box in enumerate(r.boxes.xyxy):
+        x1, y1, x2, y2 = box.tolist()
+        response.results.add(
+            box=[x1, y1, x2, y2],
+            confidence=float(r.boxes.conf[i].item()),
+            class_id=int(r.boxes.cls[i].item()),
+        )
+    if skip_render:
+        # Structured output: one RLE mask per result, no overlay
+        if r.masks:
+            masks = (r.masks.data > 0.5).cpu().numpy()
+            height, width = masks.shape[1:]
+            for result, mask in zip(response.results, masks):
+                result.mask.height = height
+                result.mask.width = width
+                result.mask.counts.extend(rle_encode(mask).tolist())
         return response
+    # Apply all masks in one blend pass
+    if r.masks:
+        overlay.apply(img, r.masks.data, r.boxes.cls)
+    return encode_output(img, response, output_path)
+
+
+def build_tiled_response(img, detections, skip_render=False, output_path=None):
+    """Response for merged tile detections, masks are at full image resolution"""
+    response = detect_pb2.DetectResponse()
+    height, width = img.shape[:2]
+    canvas = None
+    for det in detections:
+        result = response.results.add(
+            box=det.box, confidence=det.confidence, class_id=det.class_id
+        )
+        if skip_render and det.parts:
+            canvas = tiling.paste_mask(det, height, width, out=canvas)
+            result.mask.height = height
+            result.mask.width = width
+            result.mask.counts.extend(rle_encode(canvas).tolist())
+    if skip_render:
+        return response
+    if any(det.parts for det in detections):
+        overlay.blend(img, tiling.class_map(detections, height, width))
+    return encode_output(img, response, output_path)
+
+
+def confidence(request):
+    """Confidence threshold of a request (or frame), the server default when unset"""
+    conf = request.confidence or CONF_THRESHOLD
+    if not 0 < conf <= 1:
+        raise ValueError("confidence must be between 0 and 1")
+    return conf
+
+
+def tile_grid(img, request):
+    """Tiles for a tiled request, None when tiling is off or the image fits in one tile"""
+    tile_size = request.tile_size
+    if tile_size <= 0:
+        return None
+    height, width = img.shape[:2]
+    if width <= tile_size and height <= tile_size:
+        return None
+    overlap = request.tile_overlap or int(tile_size * tiling.DEFAULT_OVERLAP_RATIO)
+    if not 0 <= overlap < tile_size:
+        raise ValueError("tile_overlap must be between 0 and tile_size")
+    return tiling.tile_grid(width, height, tile_size, overlap)
+
+
+class DetectorServicer(detect_pb2_grpc.DetectorServicer):
+    def __init__(self, registry):
+        self.registry = registry
 
+    def _submit(self, context, jobs):
+        """
+        Submit (img, tiles, conf) jobs to the active model, returns its version and
+        the futures of every job. All jobs of a call go to the same model, and
+        all tiles of an image go to the batcher together and share predict calls.
+        """
+        try:
+            with self.registry.use() as model:
+                pending = [
+                    (
+                        [model.batcher.submit(img, conf)]
+                        if tiles is None
+                        else [
+                            model.batcher.submit(
+                                np.ascontiguousarray(img[y0:y1, x0:x1]), conf
+                            )
+                            for x0, y0, x1, y1 in tiles
+                        ]
+                    )
+                    for img, tiles, conf in jobs
+                ]
+        except ModelNotReady as e:
+            context.abort(grpc.StatusCode.UNAVAILABLE, str(e))
+        return model.version, pending
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
-    detect_pb2_grpc.add_DetectorServicer_to_server(DetectorServicer(), server)
-    server.add_insecure_port("[::]:50051")
+    @staticmethod
+    def _respond(img, request, tiles, pending, version, output_path=None):
+        results = [f.result() for f in pending]
+        if tiles is None:
+            response = build_response(img, results[0], request.skip_render, output_path)
+        else:
+            detections = [
+                det
+                for tile, r in zip(tiles, results)
+                for det in tiling.tile_detections(r, tile)
+            ]
+            merged = tiling.merge_detections(
+                detections, request.merge_threshold or tiling.DEFAULT_MERGE_THRESHOLD
+            )
+            response = build_tiled_response(
+                img, merged, request.skip_render, output_path
+            )
+        response.model_version = version
+        return response
+
+    def Detect(self, request, context):
+        try:
+            img = decode_image(request.image_data)
+            tiles = tile_grid(img, request)
+            conf = confidence(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        version, (pending,) = self._submit(context, [(img, tiles, conf)])
+        return self._respond(img, request, tiles, pending, version)
+
+    def DetectBatch(self, request, context):
+        try:
+            imgs = [decode_image(req.image_data) for req in request.requests]
+            grids = [tile_grid(img, req) for img, req in zip(imgs, request.requests)]
+            confs = [confidence(req) for req in request.requests]
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        version, pending = self._submit(context, list(zip(imgs, grids, confs)))
+        return detect_pb2.DetectBatchResponse(
+            responses=[
+                self._respond(img, req, tiles, tile_futures, version)
+                for img, req, tiles, tile_futures in zip(
+                    imgs, request.requests, grids, pending
+                )
+            ]
+        )
+
+    def DetectChunked(self, request_iterator, context):
+        try:
+            options, buffer = receive_chunks(request_iterator)
+            img = decode_image(buffer)
+            # only the decoded image is kept while the model runs
+            del buffer
+            tiles = tile_grid(img, options)
+            conf = confidence(options)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        version, (pending,) = self._submit(context, [(img, tiles, conf)])
+        return self._respond(img, options, tiles, pending, version)
+
+    def DetectLocal(self, request, context):
+        for path in (request.path, request.output_path):
+            if path and not inside_local_root(path):
+                context.abort(
+                    grpc.StatusCode.PERMISSION_DENIED, f"{path} is outside {LOCAL_ROOT}"
+                )
+        try:
+            img = read_local(request)
+            tiles = tile_grid(img, request.options)
+            conf = confidence(request.options)
+        except FileNotFoundError as e:
+            context.abort(grpc.StatusCode.NOT_FOUND, str(e))
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, str(e))
+        version, (pending,) = self._submit(context, [(img, tiles, conf)])
+        return self._respond(
+            img, request.options, tiles, pending, version, request.output_path
+        )
+
+    def Health(self, request, context):
+        current = self.registry.current
+        if current is None:
+            return detect_pb2.HealthResponse(serving=False)
+        return detect_pb2.HealthResponse(
+            serving=True,
+            queued=current.batcher.queued(),
+            model_version=current.version,
+        )
+
+    def DetectStream(self, request_iterator, context):
+        # Frames are read on a separate thread so the client can keep pushing
+        # while earlier frames are still in the batcher
+        done = queue.Queue()
+
+        def read_frames():
+            count = 0
+            try:
+                for frame in request_iterator:
+                    count += 1
+                    try:
+                        img = decode_image(frame.image_data)
+                        conf = confidence(frame)
+                        with self.registry.use() as model:
+                            future = model.batcher.submit(img, conf)
+                    except (ValueError, ModelNotReady) as e:
+                        done.put((frame.seq, None, e, None))
+                        continue
+                    future.add_done_callback(
+                        lambda f, seq=frame.seq, img=img, version=model.version: done.put(
+                            (seq, img, f, version)
+                        )
+                    )
+            finally:
+                done.put((None, count, None, None))
+
+        threading.Thread(target=read_frames, daemon=True).start()
+        expected, received = None, 0
+        while expected is None or received < expected:
+            seq, img, future, version = done.get()
+            if seq is None:
+                expected = img
+                continue
+            received += 1
+            result = detect_pb2.DetectFrameResult(seq=seq)
+            try:
+                if isinstance(future, Exception):
+                    raise future
+                result.response.CopyFrom(build_response(img, future.result()))
+                result.response.model_version = version
+            except Exception as e:
+                result.error = str(e)
+            yield result
+
+
+def swap_in(registry, source, name):
+    """Load the source's checkpoint, warm it up and swap it in"""
+    started = time.monotonic()
+    model, version = source.load()
+    batcher = MicroBatcher(model)
+    try:
+        warm_up(batcher, WARMUP_ROUNDS)
+    except BaseException:
+        batcher.close()
+        raise
+    previous = registry.activate(version, batcher)
+    replaced = f", replaced {previous.version}" if previous else ""
+    print(
+        f"{name}: serving {version} "
+        f"(ready in {time.monotonic() - started:.1f}s{replaced})"
+    )
+
+
+def serve(source, port=PORT, reuse_port=False, name="gRPC server"):
+    """
+    Start the server right away (Health reports serving = false until the
+    model is loaded and warmed up), then load the model, and swap in the
+    checkpoint again whenever the file changes (checked every RELOAD_INTERVAL
+    seconds) or on SIGHUP
+    """
+    registry = ModelRegistry()
+    # Enough workers that a full batch can be waiting while the previous one runs
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=max(4, 2 * MAX_BATCH_SIZE)),
+        options=[
+            ("grpc.max_send_message_length", 100 * 1024 * 1024),
+            ("grpc.max_receive_message_length", 100 * 1024 * 1024),
+            # replicas share the port; a lone server should fail if it is taken
+            ("grpc.so_reuseport", 1 if reuse_port else 0),
+        ],
+    )
+    detect_pb2_grpc.add_DetectorServicer_to_server(DetectorServicer(registry), server)
+    server.add_insecure_port(f"[::]:{port}")
     server.start()
-    print("gRPC server started on port 50051")
+    print(
+        f"{name} started on port {port} "
+        f"(max batch {MAX_BATCH_SIZE}, window {BATCH_WINDOW_MS}ms)"
+    )
+    reload = threading.Event()
+    signal.signal(signal.SIGHUP, lambda signum, frame: reload.set())
     try:
         while True:
-            time.sleep(86400)
+            if registry.current is None or reload.is_set() or source.changed():
+                reload.clear()
+                try:
+                    swap_in(registry, source, name)
+                except Exception as e:
+                    if registry.current is None:
+                        raise
+                    # keep serving the previous model
+                    print(f"{name}: reloading {source.path} failed: {e!r}")
+            reload.wait(RELOAD_INTERVAL or None)
     except KeyboardInterrupt:
         server.stop(0)
 
 
+def replica_cpus(index, threads):
+    """CPUs for one replica: consecutive blocks of `threads` cores, wrapping around"""
+    available = sorted(os.sched_getaffinity(0))
+    return {available[(index * threads + i) % len(available)] for i in range(threads)}
+
+
+def pin_threads(threads, cpus=None):
+    """Restrict this process to cpus and size the intra-op thread pools to match"""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def model_source(args):
+    return ModelSource(
+        MODEL_PATH, args.backend, args.int8, args.calib_dir, args.calib_size
+    )
+
+
+def run_replica(index, args):
+    # each replica exits quietly on Ctrl+C / terminate, the parent reports it
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    cpus = replica_cpus(index, args.threads) if args.pin else None
+    pin_threads(args.threads, cpus)
+    cpu_info = f", cpus {sorted(cpus)}" if cpus else ""
+    serve(
+        model_source(args),
+        args.port,
+        reuse_port=True,
+        name=f"Replica {index} (pid {os.getpid()}, {args.threads} threads{cpu_info})",
+    )
+
+
+def serve_replicas(args):
+    """
+    Start args.replicas worker processes, each with its own model and micro-batcher,
+    all listening on the same port through SO_REUSEPORT. The kernel spreads
+    incoming connections over the replicas, so clients should open several
+    channels (see DETECTOR_CHANNELS_PER_TARGET). Replicas that die are restarted.
+    Every replica watches the checkpoint and swaps models on its own; SIGHUP
+    is passed on to all of them.
+    """
+    # spawn: gRPC does not survive fork, and every replica loads its own model
+    context = multiprocessing.get_context("spawn")
+    if args.threads is None:
+        args.threads = max(1, len(os.sched_getaffinity(0)) // args.replicas)
+    # thread pools read these when torch / OpenMP initialise in the child
+    os.environ["OMP_NUM_THREADS"] = str(args.threads)
+    os.environ["MKL_NUM_THREADS"] = str(args.threads)
+
+    def start(index):
+        process = context.Process(target=run_replica, args=(index, args), daemon=True)
+        process.start()
+        return process
+
+    # export / quantize once, before any replica tries to load the result
+    model_source(args).prepare()
+    processes = [start(i) for i in range(args.replicas)]
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    def reload(signum, frame):
+        for process in processes:
+            os.kill(process.pid, signal.SIGHUP)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, reload)
+    try:
+        while True:
+            for i, process in enumerate(processes):
+                process.join(timeout=1 / len(processes))
+                if process.exitcode is not None:
+                    print(f"Replica {i} exited with {process.exitcode}, restarting")
+                    processes[i] = start(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HuiScan detection gRPC server")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND)
+    parser.add_argument(
+        "--int8",
+        action=argparse.BooleanOptionalAction,
+        default=INT8,
+        help="static INT8 quantization (onnx / openvino only)",
+    )
+    parser.add_argument(
+        "--calib-dir",
+        default=CALIB_DIR,
+        help="folder with calibration images for --int8",
+    )
+    parser.add_argument("--calib-size", type=int, default=CALIB_SIZE)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument(
+        "--replicas",
+        type=int,
+        default=int(os.environ.get("DETECT_REPLICAS", "1")),
+        help="worker processes sharing the port, each with its own model",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="intra-op threads per replica (default: cores / replicas, or the library default with a single replica)",
+    )
+    parser.add_argument(
+        "--pin",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="pin each replica to its own block of cores (--replicas > 1)",
+    )
+    args = parser.parse_args()
+    if args.replicas < 1:
+        parser.error("--replicas must be at least 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    print(f"Using {backend_name(args.backend, args.int8)} backend")
+    if args.replicas > 1:
+        serve_replicas(args)
+        return
+    if args.threads:
+        pin_threads(args.threads)
+    serve(model_source(args), args.port)
+
+
 if __name__ == "__main__":
-    serve()
+    main()
@@ -1,16 +1,15 @@
 from src import create_app
-from src.cli import init_db, reset_db
+from src.cli import init_db, reset_db, upgrade_db, rebuild_stats, migrate_blobs, gc_blobs
 from flask_socketio import SocketIO
 from src.routes.stream_controller import register_video_events
-from src.detect_utils import detection_worker, task_queue, results, events
-import threading
 
 app = create_app()
 app.cli.add_command(init_db)
 app.cli.add_command(reset_db)
-
-# 启动检测线程
-threading.Thread(target=detection_worker, args=(app,), daemon=True).start()
+app.cli.add_command(upgrade_db)
+app.cli.add_command(rebuild_stats)
+app.cli.add_command(migrate_blobs)
+app.cli.add_command(gc_blobs)
 
 socketio = SocketIO(app, cors_allowed_origins="*")
 register_video_events(socketio)
@@ -2,6 +2,13 @@ from flask import Flask
 from flask_cors import CORS
 from .config import Config
 from .extensions import db
+from .blobstore import blob_store
+from .ingest import ingestor
+from .thumbnails import thumbnails
+from .detect_utils import dispatcher
+from .detect_jobs import job_runner
+from .reports import report_images, report_runner
+from .db_writer import db_writer
 from .models import *
 
 
@@ -11,6 +18,14 @@ def create_app(config_class=Config):
 
     # 初始化扩展
     db.init_app(app)
+    blob_store.init_app(app)
+    ingestor.init_app(app)
+    thumbnails.init_app(app)
+    dispatcher.init_app(app)
+    job_runner.init_app(app)
+    report_runner.init_app(app)
+    report_images.init_app(app)
+    db_writer.init_app(app)
     CORS(app)
 
     # 注册蓝图
@@ -18,14 +33,22 @@ def create_app(config_class=Config):
     from src.routes.batch_controller import batch_bp
     from src.routes.detect_controller import detect_bp
     from src.routes.report_controller import report_bp
+    from src.routes.defect_controller import defect_bp
 
     app.register_blueprint(image_bp, url_prefix='/api/image')
     app.register_blueprint(batch_bp, url_prefix='/api/batch')
     app.register_blueprint(detect_bp, url_prefix='/api/detect')
     app.register_blueprint(report_bp, url_prefix='/api/report')
+    app.register_blueprint(defect_bp, url_prefix='/api/defect')
 
     # 初始化数据库
     with app.app_context():
         db.create_all()
 
+    # 后台线程在提供服务的进程收到第一个请求时启动，调试模式下重新加载器的监视进程和 flask 命令行不会启动
+    if app.config['JOB_RUNNER_ENABLED']:
+        app.before_request(job_runner.start)
+    if app.config['REPORT_RUNNER_ENABLED']:
+        app.before_request(report_runner.start)
+
     return app
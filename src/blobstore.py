@@ -0,0 +1,126 @@
+import hashlib
+import os
+import time
+
+# 原图的内容寻址存储：上传目录下 blobs/<哈希前两位>/<哈希第 3、4 位>/<哈希><扩展名>，
+# 同样内容只存一份。HSImage.image_original_path 记录相对上传目录的路径，
+# 引用计数在 hs_blob 中由触发器维护（见 models.BLOB_REFCOUNT_DDL）。
+BLOB_DIR = "blobs"
+INCOMING_DIR = ".incoming"
+
+
+def blob_relpath(image_hash, ext):
+    return "/".join(
+        [BLOB_DIR, image_hash[:2], image_hash[2:4], image_hash + ext.lower()]
+    )
+
+
+def original_relpath(image):
+    """
+    原图相对上传目录的路径：内容寻址存储中的图片直接记录相对路径，
+    旧的按日目录布局只记录文件名，位于创建日期的目录下
+    """
+    path = image.image_original_path
+    if "/" in path:
+        return path
+    return f"{image.create_time.strftime('%Y-%m-%d')}/{path}"
+
+
+def fsync_dir(folder):
+    """让目录中新建/改名的文件项落盘"""
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BlobStore:
+    """
+    写入流程：内容先写到 blobs/.incoming 下的临时文件并计算哈希，再由 put() 放进存储；
+    同样内容已存在时只删除临时文件。已有文件被复用时会更新修改时间，
+    清理（flask gc-blobs）只删除引用计数为 0 且一段时间内未被复用的文件。
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        self.root = os.path.join(self.upload_folder, BLOB_DIR)
+        self.incoming = os.path.join(self.root, INCOMING_DIR)
+        app.extensions["blob_store"] = self
+
+    def abspath(self, relpath):
+        return os.path.join(self.upload_folder, relpath)
+
+    def incoming_path(self, ext=""):
+        os.makedirs(self.incoming, exist_ok=True)
+        return os.path.join(self.incoming, f"{os.urandom(8).hex()}{ext}")
+
+    def put(self, tmp_path, image_hash, ext, fsync=True):
+        """
+        把写好的临时文件以 image_hash 存入，返回 (相对路径, 是否新存入)。
+        新文件 fsync 后改名过去并同步所在目录，已存在时删除临时文件
+        """
+        relpath = blob_relpath(image_hash, ext)
+        path = self.abspath(relpath)
+        try:
+            # 复用已有文件：更新修改时间，避免被同时进行的清理删掉
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            os.remove(tmp_path)
+            return relpath, False
+        if fsync:
+            with open(tmp_path, "rb") as f:
+                os.fsync(f.fileno())
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        os.replace(tmp_path, path)
+        if fsync:
+            fsync_dir(folder)
+        return relpath, True
+
+    def put_bytes(self, data, ext, fsync=True):
+        """存入内存中的图片字节，返回 (相对路径, 哈希)"""
+        image_hash = hashlib.sha256(data).hexdigest()
+        tmp_path = self.incoming_path(ext)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        relpath, _ = self.put(tmp_path, image_hash, ext, fsync)
+        return relpath, image_hash
+
+    def stray_files(self, known, grace):
+        """
+        blobs 下不在 known（相对路径集合）中、且超过 grace 秒未修改的文件，
+        包括写了一半的临时文件（上传中断或提交失败时留下）
+        """
+        cutoff = time.time() - grace
+        for root, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(root, name)
+                relpath = os.path.relpath(path, self.upload_folder).replace(os.sep, "/")
+                if relpath in known:
+                    continue
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        yield path
+                except FileNotFoundError:
+                    continue
+
+    def remove(self, relpath, grace):
+        """删除不再被引用的文件，grace 秒内被复用过（修改时间较新）的保留；返回是否删除"""
+        path = self.abspath(relpath)
+        try:
+            if os.path.getmtime(path) >= time.time() - grace:
+                return False
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+
+blob_store = BlobStore()
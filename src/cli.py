@@ -1,9 +1,15 @@
+import hashlib
 import os
 import shutil
 import click
 from flask import current_app
+from sqlalchemy import delete
+from sqlalchemy.schema import CreateColumn
 
+from . import stats
+from .blobstore import blob_relpath, blob_store, original_relpath
 from .extensions import db
+from .models import BLOB_REFCOUNT_DDL, DEFECT_RTREE_DDL, HSBlob, HSDefect, HSImage
 
 
 @click.command('init-db')
@@ -23,3 +29,161 @@ def reset_db():
     db.drop_all()
     db.create_all()
     click.echo('Database reset')
+
+
+@click.command('upgrade-db')
+def upgrade_db():
+    """Add tables, columns and indexes introduced since the database was created"""
+    had_stats = db.inspect(db.engine).has_table('hs_daily_stats')
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+                    click.echo(f'Added column {table.name}.{column.name}')
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        for ddl in DEFECT_RTREE_DDL + BLOB_REFCOUNT_DDL:
+            conn.exec_driver_sql(ddl)
+
+    # 旧缺陷只有 bbox 字符串，补上数值坐标列（触发器会同步 R*Tree）
+    count = 0
+    for defect in HSDefect.query.filter(HSDefect.x1.is_(None), HSDefect.bbox.isnot(None)):
+        try:
+            columns = HSDefect.box_columns(defect.bbox.split(','))
+        except ValueError:
+            continue
+        for key, value in columns.items():
+            setattr(defect, key, value)
+        count += 1
+    db.session.commit()
+    click.echo(f'{count} defect boxes backfilled')
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(
+            'INSERT OR IGNORE INTO hs_defect_rtree '
+            'SELECT defect_id, x1, x2, y1, y2 FROM hs_defect WHERE x1 IS NOT NULL'
+        )
+
+    # 为旧图片补算内容哈希，使其可以命中检测结果缓存
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    count = 0
+    for image in HSImage.query.filter(HSImage.image_hash.is_(None)):
+        file_path = os.path.join(upload_folder, original_relpath(image))
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, 'rb') as f:
+            image.image_hash = hashlib.sha256(f.read()).hexdigest()
+        count += 1
+    db.session.commit()
+    click.echo(f'Database upgraded, {count} image hashes backfilled')
+
+    if not had_stats:
+        days = stats.rebuild()
+        click.echo(f'Daily statistics built for {days} days')
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@click.command('migrate-blobs')
+@click.option('--chunk-size', default=500, show_default=True, help='每多少张图片提交一次')
+def migrate_blobs(chunk_size):
+    """Move originals from the per-day folders into the content-addressed blob store"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    moved = deduplicated = missing = saved_bytes = 0
+    thumbnails = set()
+    while True:
+        # 每轮取还没迁移的图片，迁移过的路径以 blobs/ 开头，不会再被取到；找不到文件的跳过
+        images = (HSImage.query.filter(~HSImage.image_original_path.like('blobs/%'))
+                  .order_by(HSImage.image_id).offset(missing).limit(chunk_size).all())
+        if not images:
+            break
+        for image in images:
+            legacy_path = os.path.join(upload_folder, original_relpath(image))
+            ext = os.path.splitext(image.image_original_path)[1]
+            exists = os.path.exists(legacy_path)
+            if exists and not image.image_hash:
+                image.image_hash = file_hash(legacy_path)
+            if not image.image_hash:
+                missing += 1
+                continue
+            relpath = blob_relpath(image.image_hash, ext)
+            target = blob_store.abspath(relpath)
+            if exists:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if os.path.exists(target):
+                    saved_bytes += os.path.getsize(legacy_path)
+                    os.remove(legacy_path)
+                    deduplicated += 1
+                else:
+                    os.replace(legacy_path, target)
+                thumbnails.add(os.path.splitext(legacy_path)[0] + '_thumbnail' + ext)
+            elif not os.path.exists(target):
+                # 上次迁移中断时文件可能已经移走但还没提交，此时存储中已有同哈希的文件
+                missing += 1
+                continue
+            # 触发器据此登记存储中的文件并增加引用计数
+            image.image_original_path = relpath
+            moved += 1
+        db.session.commit()
+
+    # 旧的缩略图已改为按需生成，不再使用
+    for path in thumbnails:
+        if os.path.exists(path):
+            os.remove(path)
+    for entry in os.scandir(upload_folder):
+        if entry.is_dir() and not entry.name.startswith('.') and entry.name != 'blobs':
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                pass
+    click.echo(f'{moved} images migrated, {deduplicated} duplicates removed '
+               f'({saved_bytes / 2 ** 20:.1f} MB), {missing} originals not found')
+
+
+@click.command('gc-blobs')
+@click.option('--grace', default=3600, show_default=True, help='最近这么多秒内写入或复用过的文件不删除')
+@click.option('--dry-run', is_flag=True, help='只列出要删除的文件')
+def gc_blobs(grace, dry_run):
+    """Delete stored originals no image refers to any more"""
+    removed = 0
+    unreferenced = db.session.query(HSBlob.blob_hash, HSBlob.path).filter(HSBlob.ref_count <= 0).all()
+    for blob_hash, path in unreferenced:
+        if dry_run:
+            click.echo(path)
+            continue
+        # 读出之后可能有上传又引用了这份原图（触发器已加了计数），按条件删除，删到了才删文件；
+        # 删除后到提交前持有写锁，同时进行的上传要等这里决定后才能登记引用
+        deleted = db.session.execute(
+            delete(HSBlob).where(HSBlob.blob_hash == blob_hash, HSBlob.ref_count <= 0)
+        ).rowcount
+        if deleted and blob_store.remove(path, grace):
+            db.session.commit()
+            removed += 1
+        else:
+            db.session.rollback()
+    # 中断的上传、提交失败的批次留下的文件不在 hs_blob 中
+    known = {path for (path,) in db.session.query(HSBlob.path)}
+    for path in list(blob_store.stray_files(known, grace)):
+        if dry_run:
+            click.echo(path)
+        else:
+            os.remove(path)
+            removed += 1
+    click.echo(f'{removed} unreferenced files removed')
+
+
+@click.command('rebuild-stats')
+def rebuild_stats():
+    """Recompute the daily statistics rollup from images and defects"""
+    days = stats.rebuild()
+    click.echo(f'Daily statistics rebuilt for {days} days')
@@ -8,11 +8,70 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 class Config:
     SQLALCHEMY_DATABASE_URI = f"sqlite:///{BASE_DIR}/instance/app.db"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 数据库被锁时最多等待的秒数（SQLite busy timeout）
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}}
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'instance/uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'gif'}
     STATIC_FOLDER = os.path.join(BASE_DIR, 'instance/uploads')
     STATIC_URL_PATH = '/static'
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+    # 检测服务地址，可以有多个（多进程或多台机器），请求发给未完成请求最少的健康服务
+    DETECTOR_TARGETS = ['localhost:50051']
+    # 每个地址建立的连接数；检测服务用 --replicas N 启动时设为不少于 N，内核按连接把请求分给各副本
+    DETECTOR_CHANNELS_PER_TARGET = 1
+    # 检测调度：同时进行的 gRPC 调用数、排队上限、单张超时（秒，含排队）和 503 时的 Retry-After
+    DETECT_CONCURRENCY = 4
+    DETECT_QUEUE_SIZE = 32
+    DETECT_TIMEOUT = 60
+    DETECT_RETRY_AFTER = 5
+    # 检测服务健康检查间隔（秒）和调用失败时换服务重试的次数
+    DETECT_HEALTH_INTERVAL = 5
+    DETECT_RETRIES = 1
+    # 模型版本与置信度阈值，作为结果缓存键的一部分；置信度阈值随每个请求发给检测服务，
+    # 模型版本以检测服务报告的为准，DETECT_MODEL_VERSION 只在检测服务不报告版本（旧版检测服务）时使用
+    DETECT_MODEL_VERSION = 'seg_n'
+    DETECT_CONFIDENCE = 0.4
+    # 结构化输出：检测服务只返回框和 RLE 掩码，不再回传叠加后的 JPEG，处理后图像在首次查看时再生成
+    DETECT_STRUCTURED_OUTPUT = False
+    # 分块检测：大于 DETECT_TILE_SIZE 的图片切成相互重叠 DETECT_TILE_OVERLAP 像素的小块检测后合并，0 表示不分块
+    DETECT_TILE_SIZE = 0
+    DETECT_TILE_OVERLAP = 0
+    # 不小于 DETECT_CHUNKED_MIN_SIZE 字节的图片用 DetectChunked 按 DETECT_CHUNK_SIZE 分块上传
+    DETECT_CHUNK_SIZE = 1024 * 1024
+    DETECT_CHUNKED_MIN_SIZE = 4 * 1024 * 1024
+    # 检测服务在本机时用 DetectLocal 只传文件路径，处理后图像由检测服务直接写入上传目录；
+    # 'auto' 按每个检测服务的地址判断，检测服务读不到文件时自动改回传字节
+    DETECT_LOCAL = 'auto'
+    # 批量检测流水线：预读/同时检测的图片数、写处理后图像的线程数、每多少张提交一次
+    BATCH_DETECT_PREFETCH = 8
+    BATCH_DETECT_WRITERS = 2
+    BATCH_DETECT_COMMIT_SIZE = 20
+    # 单写线程：攒够多少条记录或等待多少毫秒后在一个事务里批量写入
+    DB_WRITER_BATCH_SIZE = 200
+    DB_WRITER_FLUSH_MS = 50
+    # 上传：并行落盘的线程数、写完是否 fsync
+    UPLOAD_IO_WORKERS = 8
+    UPLOAD_FSYNC = True
+    # 缩略图在第一次请求时生成：可选边长（请求的尺寸向上取到这些档位）、默认边长，
+    # 缓存在上传目录的 .thumbs 下，超过 THUMBNAIL_CACHE_MAX_MB 时删除最久未访问的
+    THUMBNAIL_SIZES = [64, 150, 300, 600]
+    THUMBNAIL_SIZE = 150
+    THUMBNAIL_CACHE_MAX_MB = 512
+    # 后台生成的检测报告 PDF 的保存目录（不在静态文件目录下，经下载接口访问）
+    REPORT_FOLDER = os.path.join(BASE_DIR, 'instance/reports')
+    # 报告中每类缺陷展示的图片数；图片缩小到 REPORT_IMAGE_SIZE（宽, 高）以内再插入（显示尺寸最大 800x200，
+    # 按 2 倍像素生成），缩小后的图片缓存在 REPORT_FOLDER/assets 下供各报告复用，超过上限时删除最久未用的
+    REPORT_SAMPLE_SIZE = 5
+    REPORT_IMAGE_SIZE = (1600, 400)
+    REPORT_IMAGE_CACHE_MAX_MB = 256
+    # 是否在本进程运行后台报告生成线程（收到第一个请求时启动）；多进程部署时只在一个进程里开启
+    REPORT_RUNNER_ENABLED = True
+    # get-image-list 流式导出时每次查询的行数
+    IMAGE_LIST_STREAM_CHUNK = 1000
+    # 后台检测任务进度流的轮询间隔（秒）
+    DETECT_JOB_POLL_INTERVAL = 1
+    # 是否在本进程运行后台检测任务线程（收到第一个请求时启动）；多进程部署时只在一个进程里开启
+    JOB_RUNNER_ENABLED = True
 
 
 def get_allowed_extensions():
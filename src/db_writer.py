@@ -0,0 +1,152 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import insert
+
+from src import stats
+from src.extensions import db
+from src.models import HSBatch, HSDefect, HSImage
+
+
+def insert_batches(payloads):
+    return (
+        db.session.execute(
+            insert(HSBatch).returning(HSBatch.batch_id, sort_by_parameter_order=True),
+            payloads,
+        )
+        .scalars()
+        .all()
+    )
+
+
+def insert_frames(payloads):
+    """payload: {'image': HSImage 字段, 'defects': [HSDefect 字段（不含 image_id）]}"""
+    image_rows = [p["image"] for p in payloads]
+    image_ids = (
+        db.session.execute(
+            insert(HSImage).returning(HSImage.image_id, sort_by_parameter_order=True),
+            image_rows,
+        )
+        .scalars()
+        .all()
+    )
+    defect_rows = [
+        dict(d, image_id=image_id)
+        for p, image_id in zip(payloads, image_ids)
+        for d in p["defects"]
+    ]
+    if defect_rows:
+        db.session.execute(insert(HSDefect), defect_rows)
+    stats.record_created([row["create_time"] for row in image_rows])
+    for p in payloads:
+        stats.record_detected(
+            p["image"]["create_time"], [d["defect_type"] for d in p["defects"]]
+        )
+    return image_ids
+
+
+class DBWriter:
+    """
+    单写线程：写入请求排队交给一个线程，每攒够 DB_WRITER_BATCH_SIZE 条或等待 DB_WRITER_FLUSH_MS 毫秒后，
+    同类记录批量插入并在一个事务里提交。submit() 返回 Future，需要 ID 的调用方可以等待它；
+    flush() 等待之前提交的写入全部提交。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._handlers = {"batch": insert_batches, "frame": insert_frames}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config["DB_WRITER_BATCH_SIZE"]
+        self.flush_interval = app.config["DB_WRITER_FLUSH_MS"] / 1000
+        app.extensions["db_writer"] = self
+
+    def register(self, kind, handler):
+        """handler(payloads) -> 与 payloads 一一对应的结果列表，在写线程的事务中执行"""
+        self._handlers[kind] = handler
+
+    def submit(self, kind, payload) -> Future:
+        if kind not in self._handlers:
+            raise ValueError(f"unknown write kind: {kind}")
+        return self._put(kind, payload)
+
+    def flush(self, timeout=None):
+        """等待此前提交的所有写入完成"""
+        self._put(None, None).result(timeout)
+
+    def _put(self, kind, payload):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((kind, payload, future))
+        return future
+
+    def _ensure_started(self):
+        # 第一次写入时才启动线程，CLI 命令等不需要它
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(items) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    @staticmethod
+    def _runs(items):
+        """按到达顺序把连续的同类记录分成一组，保证先建批次再写图片"""
+        runs = []
+        for item in items:
+            if runs and runs[-1][0][0] == item[0]:
+                runs[-1].append(item)
+            else:
+                runs.append([item])
+        return runs
+
+    def _write(self, items):
+        results = []
+        for run in self._runs(items):
+            kind = run[0][0]
+            if kind is None:
+                results.extend([None] * len(run))
+            else:
+                results.extend(self._handlers[kind]([payload for _, payload, _ in run]))
+        db.session.commit()
+        for (_, _, future), result in zip(items, results):
+            future.set_result(result)
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                items = self._collect()
+                try:
+                    self._write(items)
+                except Exception:
+                    db.session.rollback()
+                    # 整组失败时逐条重试，避免一条坏记录拖累其他记录
+                    for item in items:
+                        try:
+                            self._write([item])
+                        except Exception as e:
+                            db.session.rollback()
+                            self.app.logger.exception("DB write failed")
+                            item[2].set_exception(e)
+
+
+db_writer = DBWriter()
@@ -0,0 +1,160 @@
+import queue
+import threading
+from datetime import datetime
+
+from sqlalchemy import func, update
+
+from src.detect_utils import detect_images
+from src.extensions import db
+from src.models import HSDetectJob, HSImage
+
+
+class DetectJobRunner:
+    """
+    后台批量检测任务：任务记录在 hs_detect_job 表里，由一个后台线程依次执行。
+    进度随检测结果一起提交，服务重启后未完成的任务会从未检测的图片（detect_time IS NULL）继续。
+    执行前用 pending -> running 的条件更新认领任务，同一个任务不会被两个线程（或进程）同时执行。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._cancelled = set()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["detect_job_runner"] = self
+
+    def start(self):
+        """启动后台线程，并把上次没跑完的任务重新排队；每个进程只启动一次"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._start()
+
+    def _start(self):
+        with self.app.app_context():
+            # 只有提供服务的进程启动后台线程，启动时仍是 running 的任务属于已退出的上一个进程，改回排队
+            HSDetectJob.query.filter(HSDetectJob.status == "running").update(
+                {"status": "pending"}
+            )
+            db.session.commit()
+            unfinished = (
+                HSDetectJob.query.filter(
+                    HSDetectJob.status.in_(HSDetectJob.ACTIVE_STATUSES)
+                )
+                .order_by(HSDetectJob.job_id)
+                .all()
+            )
+            for job in unfinished:
+                self._queue.put(job.job_id)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, batch):
+        """为批次创建任务；已有未结束的任务时直接返回它"""
+        job = HSDetectJob.query.filter(
+            HSDetectJob.batch_id == batch.batch_id,
+            HSDetectJob.status.in_(HSDetectJob.ACTIVE_STATUSES),
+        ).first()
+        if job is not None:
+            return job
+        job = HSDetectJob(
+            batch_id=batch.batch_id,
+            status="pending",
+            total=batch.images.filter(HSImage.detect_time.is_(None)).count(),
+            create_time=datetime.now(),
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._queue.put(job.job_id)
+        return job
+
+    def cancel(self, job):
+        if not job.is_active():
+            return job
+        self._cancelled.add(job.job_id)
+        job.status = "cancelled"
+        job.finish_time = datetime.now()
+        db.session.commit()
+        return job
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            with self.app.app_context():
+                try:
+                    self._run_job(job_id)
+                except Exception as e:
+                    db.session.rollback()
+                    job = db.session.get(HSDetectJob, job_id)
+                    if job is not None:
+                        job.status = "failed"
+                        job.error = str(e)
+                        job.finish_time = datetime.now()
+                        db.session.commit()
+                finally:
+                    self._cancelled.discard(job_id)
+                    db.session.remove()
+
+    def _claim(self, job_id):
+        """把任务从 pending 改为 running，返回是否由本线程认领成功"""
+        claimed = db.session.execute(
+            update(HSDetectJob)
+            .where(HSDetectJob.job_id == job_id, HSDetectJob.status == "pending")
+            .values(
+                status="running",
+                start_time=func.coalesce(HSDetectJob.start_time, datetime.now()),
+            )
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _run_job(self, job_id):
+        if job_id in self._cancelled or not self._claim(job_id):
+            return
+        job = db.session.get(HSDetectJob, job_id)
+        images = (
+            HSImage.query.filter(
+                HSImage.batch_id == job.batch_id, HSImage.detect_time.is_(None)
+            )
+            .order_by(HSImage.image_id)
+            .all()
+        )
+        # 续跑时 processed 保留上次的进度
+        job.total = job.processed + len(images)
+        db.session.commit()
+
+        config = self.app.config
+        pipeline = detect_images(
+            images,
+            prefetch=config["BATCH_DETECT_PREFETCH"],
+            commit_size=config["BATCH_DETECT_COMMIT_SIZE"],
+            writers=config["BATCH_DETECT_WRITERS"],
+        )
+        try:
+            for image, has_defect, error in pipeline:
+                # 进度随下一次分组提交写入数据库
+                job.processed += 1
+                if error is not None:
+                    job.failed += 1
+                if job_id in self._cancelled:
+                    break
+        finally:
+            pipeline.close()
+
+        if job_id in self._cancelled:
+            # cancel() 已经写入了 cancelled 状态，这里只补上最后的进度
+            db.session.refresh(job, ["status", "finish_time"])
+        else:
+            job.status = "finished"
+            job.finish_time = datetime.now()
+        db.session.commit()
+
+
+job_runner = DetectJobRunner()
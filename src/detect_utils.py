@@ -1,36 +1,514 @@
-import queue
+import os
+import shutil
 import threading
 import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-import cv2
-import numpy as np
+import grpc
+from flask import current_app, jsonify
+from sqlalchemy import insert
 
-from src.rpc_client import DetectorClient
-
-task_queue = queue.Queue()
-results = {}
-events = {}
+import detect_pb2
+from src.blobstore import original_relpath
+from src.config import get_upload_folder
+from src.extensions import db, savepoint
+from src.models import HSImage, HSDefect
+from src.rpc_client import DetectorPool, iter_chunks
+from src import stats
 
 DEFECT_NAMES = ["边缘裂纹", "横向裂纹", "表面杂质", "斑块缺陷"]
 colors = [(255, 0, 0), (0, 255, 0), (0, 255, 255), (0, 0, 255)]  # 蓝  # 绿  # 黄  # 红
 
 
-def detection_worker(app):
-    client = DetectorClient()
-    with app.app_context():
-        while True:
-            task_id, image_bytes = task_queue.get()
-            response = client.detect(image_bytes)
-            results[task_id] = response
-            events[task_id].set()
-            task_queue.task_done()
-
-
-def detect(image_bytes: bytes):
-    """Accept raw image bytes, enqueue for detection, return DetectResponse"""
-    task_id = f"task-{time.time_ns()}"
-    events[task_id] = threading.Event()
-    task_queue.put((task_id, image_bytes))
-    events[task_id].wait()
-    return results.pop(task_id)
+class DetectorBusyError(Exception):
+    """检测队列已满"""
+
+
+class DetectTimeoutError(Exception):
+    """检测超时（包括排队时间）"""
+
+
+# DetectLocal 返回这些错误说明检测服务读不到本机文件，改为传图像字节
+LOCAL_UNAVAILABLE_CODES = (
+    grpc.StatusCode.UNIMPLEMENTED,
+    grpc.StatusCode.NOT_FOUND,
+    grpc.StatusCode.PERMISSION_DENIED,
+)
+
+
+class DetectionDispatcher:
+    """
+    并发检测调度器：最多 DETECT_CONCURRENCY 个 gRPC 调用同时进行，
+    另有 DETECT_QUEUE_SIZE 个排队位置，满了以后直接拒绝（HTTP 503）。
+    调用经 DetectorPool 分发到 DETECTOR_TARGETS 中的检测服务。
+    结果通过 Future 返回，超时或出错都不会残留状态。
+    """
+
+    def __init__(self, app=None):
+        self.pool = None
+        self.executor = None
+        self.timeout = None
+        self.retry_after = None
+        self.options = {}
+        self.chunk_size = None
+        self.chunked_min_size = None
+        self.staging_dir = None
+        self.logger = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        concurrency = app.config["DETECT_CONCURRENCY"]
+        self.timeout = app.config["DETECT_TIMEOUT"]
+        self.retry_after = app.config["DETECT_RETRY_AFTER"]
+        # DetectRequest 中除图像以外的字段
+        self.options = dict(
+            skip_render=app.config["DETECT_STRUCTURED_OUTPUT"],
+            tile_size=app.config["DETECT_TILE_SIZE"],
+            tile_overlap=app.config["DETECT_TILE_OVERLAP"],
+            confidence=app.config["DETECT_CONFIDENCE"],
+        )
+        self.chunk_size = app.config["DETECT_CHUNK_SIZE"]
+        self.chunked_min_size = app.config["DETECT_CHUNKED_MIN_SIZE"]
+        self.pool = DetectorPool(
+            app.config["DETECTOR_TARGETS"],
+            health_interval=app.config["DETECT_HEALTH_INTERVAL"],
+            retries=app.config["DETECT_RETRIES"],
+            channels=app.config["DETECTOR_CHANNELS_PER_TARGET"],
+        )
+        if app.config["DETECT_LOCAL"] != "auto":
+            for endpoint in self.pool.endpoints:
+                endpoint.local = app.config["DETECT_LOCAL"]
+        self.staging_dir = os.path.join(app.config["UPLOAD_FOLDER"], ".staging")
+        self.logger = app.logger
+        self.executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="detect"
+        )
+        self._slots = threading.BoundedSemaphore(
+            concurrency + app.config["DETECT_QUEUE_SIZE"]
+        )
+        app.extensions["detection_dispatcher"] = self
+        app.register_error_handler(DetectorBusyError, self._handle_busy)
+        app.register_error_handler(DetectTimeoutError, self._handle_timeout)
+
+    def submit(self, image_bytes: bytes, timeout=None, block=False):
+        """
+        提交一张图片，返回 Future[DetectResponse]。
+        block=False 时队列满立即抛出 DetectorBusyError，否则最多等待 timeout 秒。
+        """
+        return self._submit(self._call, image_bytes, timeout, block)
+
+    def submit_file(self, path, timeout=None, block=False):
+        """
+        提交一个图片文件。检测服务在本机时只传路径，处理后图像由检测服务写到暂存目录，
+        路径在 DetectResponse.processed_path 中；否则读出字节后按 submit() 处理。
+        """
+        return self._submit(self._call_file, path, timeout, block)
+
+    def _submit(self, call, source, timeout, block):
+        timeout = timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        if not self._slots.acquire(blocking=block, timeout=timeout if block else None):
+            raise DetectorBusyError()
+        try:
+            future = self.executor.submit(call, source, deadline)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def detect(self, image_bytes: bytes, timeout=None, block=False):
+        return self.submit(image_bytes, timeout, block).result()
+
+    def _send_bytes(self, endpoint, image_bytes, timeout):
+        # 大图分块上传，检测服务不必一次持有整个请求消息
+        if len(image_bytes) >= self.chunked_min_size:
+            return endpoint.client.stub.DetectChunked(
+                iter_chunks(image_bytes, self.chunk_size, self.options),
+                timeout=timeout,
+            )
+        request = detect_pb2.DetectRequest(image_data=image_bytes, **self.options)
+        return endpoint.client.stub.Detect(request, timeout=timeout)
+
+    def _call(self, image_bytes, deadline):
+        return self._pool_call(
+            lambda endpoint, timeout: self._send_bytes(endpoint, image_bytes, timeout),
+            deadline,
+        )
+
+    def _call_file(self, path, deadline):
+        def attempt(endpoint, timeout):
+            if endpoint.local:
+                output_path = os.path.join(
+                    self.staging_dir, uuid.uuid4().hex + os.path.splitext(path)[1]
+                )
+                try:
+                    return endpoint.client.detect_local(
+                        path=os.path.abspath(path),
+                        output_path=output_path,
+                        timeout=timeout,
+                        **self.options,
+                    )
+                except grpc.RpcError as e:
+                    if e.code() not in LOCAL_UNAVAILABLE_CODES:
+                        raise
+                    unavailable = e
+            else:
+                unavailable = None
+            with open(path, "rb") as f:
+                image_bytes = f.read()
+            if unavailable is not None:
+                # 文件在本机存在而检测服务读不到：不在同一台机器或目录不同，之后都传字节
+                endpoint.local = False
+                self.logger.warning(
+                    "DetectLocal unavailable on %s (%s), falling back to sending bytes",
+                    endpoint.target,
+                    unavailable.details(),
+                )
+            return self._send_bytes(endpoint, image_bytes, timeout)
+
+        return self._pool_call(attempt, deadline)
+
+    def _pool_call(self, attempt, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DetectTimeoutError()
+        try:
+            return self.pool.call(attempt, remaining)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                raise DetectTimeoutError() from e
+            raise
+
+    def _handle_busy(self, e):
+        return (
+            jsonify({"error": "检测服务繁忙，请稍后重试"}),
+            503,
+            {"Retry-After": str(self.retry_after)},
+        )
+
+    def _handle_timeout(self, e):
+        return jsonify({"error": "检测超时"}), 504
+
+
+dispatcher = DetectionDispatcher()
+
+
+def detect(image_bytes: bytes, timeout=None, block=False):
+    """Accept raw image bytes, dispatch for detection, return DetectResponse"""
+    return dispatcher.detect(image_bytes, timeout, block)
+
+
+def get_original_path(image):
+    return os.path.join(get_upload_folder(), original_relpath(image))
+
+
+def get_processed_path(image):
+    return os.path.join(
+        get_upload_folder(),
+        image.detect_time.strftime("%Y-%m-%d"),
+        image.image_processed_path,
+    )
+
+
+def processed_name(image):
+    # 内容相同的图片共用一个原图文件，处理后图像带上图片 ID 区分
+    stem, ext = os.path.splitext(os.path.basename(image.image_original_path))
+    return f"{stem}_{image.image_id}_processed{ext}"
+
+
+def processed_path_at(image, detect_time):
+    """检测时间为 detect_time 时处理后图像的完整路径，并创建所在目录"""
+    processed_path = os.path.join(
+        get_upload_folder(), detect_time.strftime("%Y-%m-%d"), processed_name(image)
+    )
+    os.makedirs(os.path.dirname(processed_path), exist_ok=True)
+    return processed_path
+
+
+def prepare_processed_path(image):
+    """设置处理后图像的文件名并创建目录，返回完整路径"""
+    image.image_processed_path = processed_name(image)
+    return processed_path_at(image, image.detect_time)
+
+
+def model_signature(version=None):
+    """
+    记录在图片上的模型版本，分块检测的结果与整图不同，把分块参数也算进去。
+    version 为检测服务报告的版本，默认取连接池中各服务当前的版本，
+    旧版检测服务不报告时用 DETECT_MODEL_VERSION
+    """
+    version = (
+        version
+        or dispatcher.pool.model_version()
+        or current_app.config["DETECT_MODEL_VERSION"]
+    )
+    tile_size = current_app.config["DETECT_TILE_SIZE"]
+    if tile_size:
+        version += f"@tile{tile_size}-{current_app.config['DETECT_TILE_OVERLAP']}"
+    return version
+
+
+def _mark_detected(image, rendered=True, version=None, detect_time=None):
+    """
+    记录检测时间（默认为当前时间）和模型信息；rendered=False（结构化输出）时处理后图像尚未生成，
+    image_processed_path 置空并返回 None
+    """
+    image.detect_time = detect_time or datetime.now()
+    image.model_version = model_signature(version)
+    image.detect_conf = current_app.config["DETECT_CONFIDENCE"]
+    if not rendered:
+        image.image_processed_path = None
+        return None
+    return prepare_processed_path(image)
+
+
+def _mask_column(det):
+    if not det.HasField("mask"):
+        return None
+    return {
+        "height": det.mask.height,
+        "width": det.mask.width,
+        "counts": list(det.mask.counts),
+    }
+
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _store_processed(path, response):
+    """检测服务已把处理后图像写到暂存文件时直接改名过去，否则写入返回的字节"""
+    if response.processed_path:
+        os.replace(response.processed_path, path)
+    else:
+        _write_file(path, response.processed_image)
+
+
+def _discard_staged(response):
+    if response is not None and response.processed_path:
+        try:
+            os.remove(response.processed_path)
+        except OSError:
+            pass
+
+
+def _read_and_detect(path):
+    # 批量检测时队列满就等待，而不是直接失败
+    return dispatcher.submit_file(path, block=True).result()
+
+
+def save_detection(image, response):
+    """写入处理后图像并记录缺陷，由调用方提交事务；返回是否有缺陷"""
+    try:
+        processed_path = record_detection(image, response)
+    except Exception:
+        _discard_staged(response)
+        raise
+    if processed_path is not None:
+        _store_processed(processed_path, response)
+    return len(response.results) > 0
+
+
+def record_detection(image, response, detect_time=None):
+    """
+    只更新数据库中的检测结果和每日统计（不写文件），返回处理后图像应写入的路径；
+    响应里没有处理后图像（结构化输出）时返回 None
+    """
+    previously_defective = stats.had_defects(image)
+    processed_path = _mark_detected(
+        image,
+        rendered=bool(response.processed_image or response.processed_path),
+        version=response.model_version,
+        detect_time=detect_time,
+    )
+    # 缺陷一次批量插入
+    rows = [
+        dict(
+            HSDefect.box_columns(det.box),
+            defect_type=DEFECT_NAMES[det.class_id],
+            confidence=det.confidence,
+            mask=_mask_column(det),
+            image_id=image.image_id,
+        )
+        for det in response.results
+    ]
+    if rows:
+        db.session.execute(insert(HSDefect), rows)
+    stats.record_detected(
+        image.create_time, [row["defect_type"] for row in rows], previously_defective
+    )
+    return processed_path
+
+
+def find_cached_detection(image):
+    """查找内容相同、且用同一模型版本和阈值检测过的图片"""
+    if not image.image_hash:
+        return None
+    return (
+        HSImage.query.filter(
+            HSImage.image_hash == image.image_hash,
+            HSImage.image_id != image.image_id,
+            HSImage.model_version == model_signature(),
+            HSImage.detect_conf == current_app.config["DETECT_CONFIDENCE"],
+        )
+        .order_by(HSImage.detect_time.desc())
+        .first()
+    )
+
+
+def reuse_detection(image, cached):
+    """
+    复用 cached 的检测结果：处理后图像尽量用硬链接共享，缺陷逐条复制，由调用方提交事务。
+    返回是否有缺陷；cached 的处理后图像已不存在时返回 None。
+    cached 还没有生成处理后图像（结构化输出）时只复制缺陷和掩码。
+    """
+    source_path = None
+    if cached.image_processed_path is not None:
+        source_path = get_processed_path(cached)
+        if not os.path.exists(source_path):
+            return None
+    previously_defective = stats.had_defects(image)
+    processed_path = _mark_detected(image, rendered=source_path is not None)
+    image.model_version = cached.model_version
+    if processed_path is not None:
+        if os.path.exists(processed_path):
+            os.remove(processed_path)
+        try:
+            os.link(source_path, processed_path)
+        except OSError:
+            shutil.copyfile(source_path, processed_path)
+    defects = cached.defects.all()
+    rows = [
+        dict(
+            defect_type=d.defect_type,
+            bbox=d.bbox,
+            x1=d.x1,
+            y1=d.y1,
+            x2=d.x2,
+            y2=d.y2,
+            area=d.area,
+            confidence=d.confidence,
+            mask=d.mask,
+            image_id=image.image_id,
+        )
+        for d in defects
+    ]
+    if rows:
+        db.session.execute(insert(HSDefect), rows)
+    stats.record_detected(
+        image.create_time, [d.defect_type for d in defects], previously_defective
+    )
+    return len(defects) > 0
+
+
+def detect_image(image, block=False):
+    """检测数据库中的一张图片，命中缓存时不调用 gRPC，由调用方提交事务；返回是否有缺陷"""
+    cached = find_cached_detection(image)
+    if cached is not None:
+        has_defect = reuse_detection(image, cached)
+        if has_defect is not None:
+            return has_defect
+    response = dispatcher.submit_file(get_original_path(image), block=block).result()
+    return save_detection(image, response)
+
+
+def detect_images(images, prefetch, commit_size, writers):
+    """
+    流水线批量检测：预读并同时检测接下来的 prefetch 张图片，处理后图像交给写线程池，
+    每 commit_size 张为一组：等这一组的文件写完，再逐张记录结果并提交事务。
+    写文件或记录出错时只丢掉这张图片的结果，同组的其他图片照常提交。
+    按输入顺序逐张产出 (image, has_defect, error)（每组提交后产出），出错时 has_defect 为 None。
+    """
+    read_pool = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="prefetch")
+    write_pool = ThreadPoolExecutor(max_workers=writers, thread_name_prefix="writer")
+    window = deque()
+    # 本组的 (image, has_defect, error, detected)，detected 为待记录的 (response, detect_time, path, write)
+    group = []
+    remaining = iter(images)
+
+    def fill():
+        while len(window) < prefetch:
+            image = next(remaining, None)
+            if image is None:
+                return
+            try:
+                cached = find_cached_detection(image)
+                has_defect = None
+                if cached is not None:
+                    # 复制结果出错时只回滚这张图片，和检测出错一样按这张图片的错误产出
+                    with savepoint():
+                        has_defect = reuse_detection(image, cached)
+            except Exception as e:
+                window.append((image, e))
+                continue
+            if has_defect is not None:
+                window.append((image, has_defect))
+                continue
+            window.append(
+                (image, read_pool.submit(_read_and_detect, get_original_path(image)))
+            )
+
+    def settle(image, response, detect_time, path, write):
+        try:
+            if write is not None:
+                write.result()
+            with savepoint():
+                record_detection(image, response, detect_time)
+            return len(response.results) > 0, None
+        except Exception as e:
+            _discard_staged(response)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            return None, e
+
+    def flush():
+        results = []
+        for image, has_defect, error, detected in group:
+            if detected is not None:
+                has_defect, error = settle(image, *detected)
+            results.append((image, has_defect, error))
+        group.clear()
+        db.session.commit()
+        return results
+
+    try:
+        fill()
+        while window:
+            image, pending = window.popleft()
+            if isinstance(pending, bool):
+                group.append((image, pending, None, None))
+            elif isinstance(pending, Exception):
+                group.append((image, None, pending, None))
+            else:
+                response = None
+                try:
+                    response = pending.result()
+                    detect_time = datetime.now()
+                    path = write = None
+                    if response.processed_image or response.processed_path:
+                        path = processed_path_at(image, detect_time)
+                        write = write_pool.submit(_store_processed, path, response)
+                    group.append(
+                        (image, None, None, (response, detect_time, path, write))
+                    )
+                except Exception as e:
+                    _discard_staged(response)
+                    group.append((image, None, e, None))
+            fill()
+            if len(group) >= commit_size:
+                yield from flush()
+        yield from flush()
+    except GeneratorExit:
+        # 客户端断开时保留已完成的结果
+        flush()
+        raise
+    finally:
+        read_pool.shutdown(wait=False, cancel_futures=True)
+        write_pool.shutdown(wait=True)
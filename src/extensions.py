@@ -1,3 +1,28 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
+
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    # WAL 模式下读写互不阻塞；synchronous=NORMAL 在 WAL 下仍能保证不损坏数据库
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+def savepoint():
+    """
+    db.session.begin_nested()，出错时只回滚这一段。sqlite3 模块只在写语句前隐式 BEGIN，
+    在事务外执行的 SAVEPOINT 会自己开启事务并在 RELEASE 时直接提交，所以先确保事务已经开始
+    """
+    dbapi_connection = db.session.connection().connection.dbapi_connection
+    if isinstance(dbapi_connection, sqlite3.Connection) and not dbapi_connection.in_transaction:
+        dbapi_connection.execute("BEGIN")
+    return db.session.begin_nested()
@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class FileCache:
+    """
+    目录下按需生成的文件，总大小超过 max_bytes 时删除最久未访问的。访问时更新文件的修改时间，
+    重启后按修改时间恢复访问顺序。多个进程共用目录时各自统计大小，总量只是近似受限。
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._entries = None  # 路径 -> 字节数，最久未访问的在前
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, render):
+        """返回 path；文件不存在时调用 render(path) 生成"""
+        if os.path.exists(path):
+            self._touch(path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        render(path)
+        self._add(path, os.path.getsize(path))
+        return path
+
+    def _index(self):
+        """第一次使用时扫描目录，按修改时间恢复访问顺序；调用方持有锁"""
+        if self._entries is None:
+            found = []
+            for root, _, names in os.walk(self.folder):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    found.append((st.st_mtime, path, st.st_size))
+            found.sort()
+            self._entries = OrderedDict((path, size) for _, path, size in found)
+            self._total = sum(self._entries.values())
+        return self._entries
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            entries = self._index()
+            if path in entries:
+                entries.move_to_end(path)
+
+    def _add(self, path, size):
+        with self._lock:
+            entries = self._index()
+            self._total += size - entries.pop(path, 0)
+            entries[path] = size
+            # 刚生成的这个总是保留
+            while self._total > self.max_bytes and len(entries) > 1:
+                old_path, old_size = entries.popitem(last=False)
+                self._total -= old_size
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,72 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, UnidentifiedImageError
+
+from src.blobstore import blob_store
+
+# 上传文件按块写盘，每块同时更新哈希
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def save_upload(stream, tmp_path):
+    """把上传流按块原样写入 tmp_path（不解码、不重新编码），边写边算 SHA-256，返回哈希"""
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, "wb") as f:
+            while chunk := stream.read(COPY_BUFFER_SIZE):
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return digest.hexdigest()
+
+
+def image_size(path):
+    """只解析文件头得到 (宽, 高)，不解码像素；不是图片时抛出 OSError"""
+    with Image.open(path) as image:
+        return image.size
+
+
+class UploadIngestor:
+    """
+    create_batch 的文件处理：多个线程并行把上传文件原样写入内容寻址存储（同样内容只存一份）
+    并读取尺寸，新文件全部 fsync 后请求即可返回。缩略图不在上传时生成，见 src.thumbnails。
+    """
+
+    def __init__(self, app=None):
+        self._io = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.fsync = app.config["UPLOAD_FSYNC"]
+        self._io = ThreadPoolExecutor(
+            max_workers=app.config["UPLOAD_IO_WORKERS"], thread_name_prefix="upload"
+        )
+        app.extensions["ingestor"] = self
+
+    def save_files(self, files):
+        """
+        并行保存上传的 FileStorage，返回一一对应的 (相对上传目录的路径, 哈希, 宽, 高)，
+        不是图片的文件被丢弃，对应位置为 None
+        """
+        return list(self._io.map(self._save, files))
+
+    def _save(self, file):
+        ext = os.path.splitext(file.filename)[1]
+        tmp_path = blob_store.incoming_path(ext)
+        image_hash = save_upload(file.stream, tmp_path)
+        # 先读文件头确认是图片，再放进存储
+        try:
+            width, height = image_size(tmp_path)
+        except (OSError, UnidentifiedImageError):
+            os.remove(tmp_path)
+            return None
+        relpath, _ = blob_store.put(tmp_path, image_hash, ext, self.fsync)
+        return relpath, image_hash, width, height
+
+
+ingestor = UploadIngestor()
@@ -1,3 +1,5 @@
+from sqlalchemy import DDL, event
+
 from .extensions import db
 
 
@@ -5,7 +7,7 @@ class HSBatch(db.Model):
     __tablename__ = 'hs_batch'
 
     batch_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    import_time = db.Column(db.DateTime, default=db.func.now(), nullable=False)
+    import_time = db.Column(db.DateTime, default=db.func.now(), nullable=False, index=True)
 
     # 关系：一个 batch 可以包含多个 image
     images = db.relationship('HSImage', backref='batch', lazy='dynamic')
@@ -22,14 +24,25 @@ class HSBatch(db.Model):
 
 class HSImage(db.Model):
     __tablename__ = 'hs_image'
+    __table_args__ = (
+        # 批次内查未检测图片、按创建/检测时间筛选
+        db.Index('ix_hs_image_batch_id_detect_time', 'batch_id', 'detect_time'),
+        db.Index('ix_hs_image_create_time', 'create_time'),
+        db.Index('ix_hs_image_detect_time', 'detect_time'),
+    )
 
     image_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # 内容寻址存储中相对上传目录的路径（blobs/...）；旧数据只有文件名，位于创建日期的目录下
     image_original_path = db.Column(db.String(255), nullable=False)
     image_processed_path = db.Column(db.String(255), nullable=True)
     detect_time = db.Column(db.DateTime, nullable=True)
     create_time = db.Column(db.DateTime, default=db.func.now(), nullable=False)
     width = db.Column(db.Integer, nullable=True)
     height = db.Column(db.Integer, nullable=True)
+    # 原图内容的 SHA-256，和模型版本、置信度阈值一起作为检测结果缓存的键
+    image_hash = db.Column(db.String(64), nullable=True, index=True)
+    model_version = db.Column(db.String(64), nullable=True)
+    detect_conf = db.Column(db.Float, nullable=True)
 
     # 外键，关联到 batch 表
     batch_id = db.Column(db.Integer, db.ForeignKey('hs_batch.batch_id'), nullable=False)
@@ -40,22 +53,202 @@ class HSImage(db.Model):
 
 class HSDefect(db.Model):
     __tablename__ = 'hs_defect'
+    __table_args__ = (
+        # 取图片的缺陷类型 / 按类型找图片
+        db.Index('ix_hs_defect_image_id_defect_type', 'image_id', 'defect_type'),
+        db.Index('ix_hs_defect_defect_type_image_id', 'defect_type', 'image_id'),
+        db.Index('ix_hs_defect_area', 'area'),
+        db.Index('ix_hs_defect_confidence', 'confidence'),
+    )
 
     defect_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     defect_type = db.Column(db.String(50), nullable=False)
 
+    # "x1,y1,x2,y2"，保留给旧接口使用
     bbox = db.Column(db.Text, nullable=True)
+    x1 = db.Column(db.Float, nullable=True)
+    y1 = db.Column(db.Float, nullable=True)
+    x2 = db.Column(db.Float, nullable=True)
+    y2 = db.Column(db.Float, nullable=True)
+    area = db.Column(db.Float, nullable=True)
     confidence = db.Column(db.Float, nullable=True)
+    # 结构化输出模式下的掩码：{"height", "width", "counts"}，counts 为按行展开、从背景开始的游程长度
+    mask = db.Column(db.JSON, nullable=True)
 
     # 外键，关联到 image 表
     image_id = db.Column(db.Integer, db.ForeignKey('hs_image.image_id'), nullable=False)
 
+    @staticmethod
+    def box_columns(box):
+        """由 [x1, y1, x2, y2] 得到 bbox 字符串和各数值列"""
+        x1, y1, x2, y2 = (float(v) for v in box)
+        return {
+            'bbox': ",".join(map(str, box)),
+            'x1': x1,
+            'y1': y1,
+            'x2': x2,
+            'y2': y2,
+            'area': max(x2 - x1, 0) * max(y2 - y1, 0),
+        }
+
+
+# SQLite R*Tree 空间索引，由触发器与 hs_defect 的坐标列保持同步
+DEFECT_RTREE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS hs_defect_rtree USING rtree(defect_id, min_x, max_x, min_y, max_y)",
+    """CREATE TRIGGER IF NOT EXISTS hs_defect_rtree_insert AFTER INSERT ON hs_defect
+    WHEN new.x1 IS NOT NULL BEGIN
+        INSERT OR REPLACE INTO hs_defect_rtree VALUES (new.defect_id, new.x1, new.x2, new.y1, new.y2);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS hs_defect_rtree_update AFTER UPDATE OF x1, y1, x2, y2 ON hs_defect
+    BEGIN
+        DELETE FROM hs_defect_rtree WHERE defect_id = old.defect_id;
+        INSERT INTO hs_defect_rtree SELECT new.defect_id, new.x1, new.x2, new.y1, new.y2 WHERE new.x1 IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS hs_defect_rtree_delete AFTER DELETE ON hs_defect
+    BEGIN
+        DELETE FROM hs_defect_rtree WHERE defect_id = old.defect_id;
+    END""",
+]
+defect_rtree = db.table(
+    'hs_defect_rtree',
+    db.column('defect_id'),
+    db.column('min_x'),
+    db.column('max_x'),
+    db.column('min_y'),
+    db.column('max_y'),
+)
+
+for _ddl in DEFECT_RTREE_DDL:
+    event.listen(HSDefect.__table__, 'after_create', DDL(_ddl))
+event.listen(HSDefect.__table__, 'before_drop', DDL("DROP TABLE IF EXISTS hs_defect_rtree"))
+
+
+class HSBlob(db.Model):
+    """内容寻址存储中的一份原图，ref_count 为引用它的图片数，由 hs_image 上的触发器维护"""
+    __tablename__ = 'hs_blob'
+
+    blob_hash = db.Column(db.String(64), primary_key=True)
+    # 相对上传目录的路径
+    path = db.Column(db.String(255), nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+
+
+# 图片插入、删除或改路径时增减所引用原图的计数，第一次引用时登记；
+# 批量插入（db_writer）和迁移也都经过这里，应用代码不用自己维护。
+# 计数的键由路径 blobs/xx/yy/<哈希><扩展名> 中的哈希得到，不依赖 image_hash 列：
+# 它在旧数据中可能为空，也可能和路径在同一条 UPDATE 中一起改变。
+# 先删除再创建，upgrade-db 重放时会替换旧版本的触发器
+BLOB_REFCOUNT_DDL = [
+    "DROP TRIGGER IF EXISTS hs_blob_ref_insert",
+    """CREATE TRIGGER hs_blob_ref_insert AFTER INSERT ON hs_image
+    WHEN new.image_original_path GLOB 'blobs/??/??/*' BEGIN
+        INSERT INTO hs_blob (blob_hash, path, ref_count)
+        VALUES (substr(new.image_original_path, 13, 64), new.image_original_path, 1)
+        ON CONFLICT (blob_hash) DO UPDATE SET ref_count = ref_count + 1;
+    END""",
+    "DROP TRIGGER IF EXISTS hs_blob_ref_delete",
+    """CREATE TRIGGER hs_blob_ref_delete AFTER DELETE ON hs_image
+    WHEN old.image_original_path GLOB 'blobs/??/??/*' BEGIN
+        UPDATE hs_blob SET ref_count = ref_count - 1 WHERE blob_hash = substr(old.image_original_path, 13, 64);
+    END""",
+    "DROP TRIGGER IF EXISTS hs_blob_ref_update",
+    """CREATE TRIGGER hs_blob_ref_update AFTER UPDATE OF image_original_path ON hs_image
+    WHEN old.image_original_path IS NOT new.image_original_path BEGIN
+        UPDATE hs_blob SET ref_count = ref_count - 1
+        WHERE old.image_original_path GLOB 'blobs/??/??/*' AND blob_hash = substr(old.image_original_path, 13, 64);
+        INSERT INTO hs_blob (blob_hash, path, ref_count)
+        SELECT substr(new.image_original_path, 13, 64), new.image_original_path, 1
+        WHERE new.image_original_path GLOB 'blobs/??/??/*'
+        ON CONFLICT (blob_hash) DO UPDATE SET ref_count = ref_count + 1;
+    END""",
+]
+for _ddl in BLOB_REFCOUNT_DDL:
+    event.listen(HSImage.__table__, 'after_create', DDL(_ddl))
+
 
 class HSReport(db.Model):
     __tablename__ = 'hs_report'
 
     report_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # pending / running / finished / failed；升级前就有的记录视为 finished
+    status = db.Column(db.String(20), default='pending', server_default='finished', nullable=False, index=True)
+    error = db.Column(db.Text, nullable=True)
     create_time = db.Column(db.DateTime, default=db.func.now(), nullable=False)
+    finish_time = db.Column(db.DateTime, nullable=True)
+    # 报告统计的时间段（按天）
     start_time = db.Column(db.DateTime, nullable=True)
     end_time = db.Column(db.DateTime, nullable=True)
+    # 生成的 PDF，相对 REPORT_FOLDER 的路径
     report_file_path = db.Column(db.String(255), nullable=True)
+
+    ACTIVE_STATUSES = ('pending', 'running')
+
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def to_dict(self):
+        return {
+            'reportId': self.report_id,
+            'status': self.status,
+            'error': self.error,
+            'startTime': self.start_time.strftime('%Y-%m-%d') if self.start_time else None,
+            'endTime': self.end_time.strftime('%Y-%m-%d') if self.end_time else None,
+            'createTime': self.create_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'finishTime': self.finish_time.strftime('%Y-%m-%d %H:%M:%S') if self.finish_time else None,
+        }
+
+
+class HSDetectJob(db.Model):
+    __tablename__ = 'hs_detect_job'
+
+    job_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # pending / running / finished / cancelled / failed
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    processed = db.Column(db.Integer, default=0, nullable=False)
+    failed = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    create_time = db.Column(db.DateTime, default=db.func.now(), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=True)
+    finish_time = db.Column(db.DateTime, nullable=True)
+
+    # 外键，关联到 batch 表
+    batch_id = db.Column(db.Integer, db.ForeignKey('hs_batch.batch_id'), nullable=False)
+
+    ACTIVE_STATUSES = ('pending', 'running')
+
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+    def to_dict(self):
+        return {
+            'jobId': self.job_id,
+            'batchId': self.batch_id,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'failed': self.failed,
+            'error': self.error,
+            'createTime': self.create_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'startTime': self.start_time.strftime('%Y-%m-%d %H:%M:%S') if self.start_time else None,
+            'finishTime': self.finish_time.strftime('%Y-%m-%d %H:%M:%S') if self.finish_time else None,
+        }
+
+
+class HSDailyStats(db.Model):
+    """按图片创建日期汇总的统计，在导入和检测时增量维护（见 src/stats.py）"""
+    __tablename__ = 'hs_daily_stats'
+
+    stat_date = db.Column(db.Date, primary_key=True)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    # 至少有一个缺陷的图片数
+    defective = db.Column(db.Integer, default=0, nullable=False)
+
+
+class HSDailyDefectStats(db.Model):
+    __tablename__ = 'hs_daily_defect_stats'
+
+    stat_date = db.Column(db.Date, primary_key=True)
+    defect_type = db.Column(db.String(50), primary_key=True)
+    # 该类型的缺陷个数
+    count = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values):
+    """把排序键编码成不透明的游标字符串（datetime 按 ISO 格式保存）"""
+    raw = [
+        {"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values
+    ]
+    return base64.urlsafe_b64encode(json.dumps(raw).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = [
+            datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in raw
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor(cursor)
+    if len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def parse_limit(value, max_limit=500):
+    """解析 limit 参数，未提供时返回 None（不分页）"""
+    if value is None or value == "":
+        return None
+    limit = int(value)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return min(limit, max_limit)
+
+
+def keyset_filter(columns, values, descending=False):
+    """
+    生成 (columns) > (values) 的条件（降序时为 <），用于键集分页。
+    columns 的最后一列应唯一（通常是主键），保证顺序稳定。
+    """
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        compare = column < value if descending else column > value
+        clauses.append(and_(*equal, compare))
+    return or_(*clauses)
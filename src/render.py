@@ -0,0 +1,136 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+from flask import url_for
+from sqlalchemy import update
+
+from detector.overlay import MaskOverlay
+from detector.rle import rle_decode
+from src.detect_utils import (
+    DEFECT_NAMES,
+    colors,
+    get_original_path,
+    get_processed_path,
+    processed_name,
+    processed_path_at,
+)
+from src.extensions import db
+from src.models import HSDefect, HSImage
+
+overlay = MaskOverlay(colors)
+
+# cv2.imread 直接按 1/8、1/4、1/2 缩小解码（JPEG 在解码时缩小，其他格式解码后缩小）
+REDUCED_READ_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+def class_map(defects):
+    """由缺陷的 RLE 掩码拼出类别图（0 为背景，后面的缺陷覆盖前面的），没有掩码时返回 None"""
+    classes = None
+    for defect in defects:
+        if not defect.mask:
+            continue
+        mask = rle_decode(
+            defect.mask["counts"], defect.mask["height"], defect.mask["width"]
+        )
+        if classes is None:
+            classes = np.zeros(mask.shape, dtype=np.uint8)
+        classes[mask] = DEFECT_NAMES.index(defect.defect_type) + 1
+    return classes
+
+
+def read_original(image, box=None):
+    """读原图；给出 box（宽, 高）时缩小到 box 以内，按不小于目标尺寸的最大比例缩小解码"""
+    flags = cv2.IMREAD_COLOR
+    scale = 1
+    if box is not None and image.width and image.height:
+        scale = min(box[0] / image.width, box[1] / image.height, 1)
+        for factor, reduced in REDUCED_READ_FLAGS:
+            if factor * scale <= 1:
+                flags = reduced
+                break
+    img = cv2.imread(get_original_path(image), flags)
+    if img is None:
+        raise OSError(f"cannot read {image.image_original_path}")
+    if scale < 1:
+        size = (max(round(image.width * scale), 1), max(round(image.height * scale), 1))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def render_processed(image, box=None):
+    """
+    按原图和缺陷掩码生成处理后图像，按原图格式编码后返回字节；
+    给出 box（宽, 高）时生成缩小到 box 以内的 JPEG，原图只按需要的分辨率解码
+    """
+    img = read_original(image, box)
+    defects = image.defects.order_by(HSDefect.defect_id).all()
+    classes = class_map(defects)
+    if classes is not None:
+        # 掩码按图像尺寸最近邻缩放
+        overlay.blend(img, classes)
+    if box is None:
+        ext = os.path.splitext(image.image_original_path)[1] or ".jpg"
+        ok, buffer = cv2.imencode(ext, img)
+    else:
+        ok, buffer = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        raise OSError(f"cannot encode {image.image_original_path}")
+    return buffer.tobytes()
+
+
+def ensure_processed(image):
+    """
+    结构化输出模式下处理后图像在第一次需要时才生成：已存在时直接返回路径，
+    否则渲染后原子写入（先写临时文件再替换）再记录 image_processed_path。
+    同一张图片的并发请求各自写临时文件，替换后内容相同；记录用条件更新，
+    只在路径仍为空且图片没有被重新检测时写入，不会覆盖别的请求或新的检测结果
+    """
+    if image.image_processed_path is not None:
+        path = get_processed_path(image)
+        if os.path.exists(path):
+            return path
+    detect_time = image.detect_time
+    data = render_processed(image)
+    path = processed_path_at(image, detect_time)
+    write_file(path, data)
+    db.session.execute(
+        update(HSImage)
+        .where(
+            HSImage.image_id == image.image_id,
+            HSImage.detect_time == detect_time,
+            HSImage.image_processed_path.is_(None),
+        )
+        .values(image_processed_path=processed_name(image))
+    )
+    db.session.commit()
+    return path
+
+
+def write_file(path, data):
+    """先写临时文件再替换，读的一方不会看到写了一半的文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def processed_url(image):
+    """处理后图像的地址：已生成时走静态文件，未生成时指向按需渲染的接口"""
+    if image.detect_time is None:
+        return None
+    if image.image_processed_path is None:
+        return url_for("image.get_processed_image", image_id=image.image_id)
+    return url_for(
+        "static",
+        filename=f"{image.detect_time.strftime('%Y-%m-%d')}/{image.image_processed_path}",
+    )
@@ -0,0 +1,383 @@
+import io
+import os
+import queue
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from matplotlib.figure import Figure
+from reportlab import rl_config
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from sqlalchemy import exists, func, update
+
+from src import stats
+from src.extensions import db
+from src.models import HSDefect, HSImage, HSReport
+from src.detect_utils import DEFECT_NAMES, get_processed_path
+from src.ingest import image_size
+from src.render import render_processed, write_file
+from src.file_cache import FileCache
+from src.thumbnails import render_thumbnail
+
+# 注册中文字体
+font_path = os.path.join(os.path.dirname(__file__), "ttc", "msyh.ttc")
+pdfmetrics.registerFont(TTFont("SimHei", font_path))
+# 图片按二进制嵌入 PDF：默认的 ASCII85 编码让图片数据变大 1/4，且在没有 C 扩展时逐字节用 Python 编码
+rl_config.useA85 = 0
+
+# 典型缺陷图片在报告中的最大显示尺寸（点）
+IMAGE_BOX = (800, 200)
+
+
+class ReportImageCache:
+    """
+    报告中插入的处理后图像：缩小到 REPORT_IMAGE_SIZE 以内后缓存在 REPORT_FOLDER/assets 下，
+    各报告共用，PDF 中不再嵌入全分辨率图像。图片重新检测后 detect_time 改变，会重新生成。
+    已有处理后图像时由它缩小，否则直接按缩小后的尺寸由原图和掩码生成，不生成全分辨率的处理后图像
+    """
+
+    def __init__(self, app=None):
+        self.files = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.size = tuple(app.config["REPORT_IMAGE_SIZE"])
+        self.files = FileCache(
+            os.path.join(app.config["REPORT_FOLDER"], "assets"),
+            app.config["REPORT_IMAGE_CACHE_MAX_MB"] * 1024 * 1024,
+        )
+        app.extensions["report_images"] = self
+
+    def get(self, image):
+        """返回 image 缩小后的处理后图像路径，不存在时生成"""
+        name = f"{image.image_id}_{image.detect_time:%Y%m%d%H%M%S%f}.jpg"
+        path = os.path.join(self.files.folder, f"{image.image_id % 256:02x}", name)
+        return self.files.get(path, lambda target: self._render(image, target))
+
+    def _render(self, image, path):
+        if image.image_processed_path is not None:
+            processed = get_processed_path(image)
+            if os.path.exists(processed):
+                render_thumbnail(processed, path, self.size)
+                return
+        write_file(path, render_processed(image, self.size))
+
+
+report_images = ReportImageCache()
+
+
+def sample_images(defect_type, start_time, end_time, k):
+    """
+    随机取检测时间在 start_time 当天 ~ end_time 当天、有 defect_type 类缺陷的至多 k 张图片。
+    每次在 image_id 范围内随机取一个起点，沿主键找它之后（没有时找它之前）第一张符合条件的图片，
+    只扫描起点附近的行，不对所有匹配的图片排序
+    """
+    query = HSImage.query.filter(
+        HSImage.detect_time >= start_time,
+        HSImage.detect_time < end_time + timedelta(days=1),
+        exists().where(
+            HSDefect.image_id == HSImage.image_id,
+            HSDefect.defect_type == defect_type,
+        ),
+    )
+    low, high = db.session.query(
+        func.min(HSImage.image_id), func.max(HSImage.image_id)
+    ).one()
+    found = {}
+    while low is not None and len(found) < k:
+        pivot = random.randint(low, high)
+        candidates = query.filter(HSImage.image_id.notin_(found))
+        image = (
+            candidates.filter(HSImage.image_id >= pivot)
+            .order_by(HSImage.image_id)
+            .first()
+            or candidates.filter(HSImage.image_id < pivot)
+            .order_by(HSImage.image_id.desc())
+            .first()
+        )
+        if image is None:
+            break
+        found[image.image_id] = image
+    return list(found.values())
+
+
+def chart_image(fig):
+    """把图表编码成内存中的 PNG，供 reportlab 插入"""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    return ImageReader(buffer)
+
+
+# 图表直接用 Figure 绘制，不经过 pyplot 的全局状态，可以在后台线程中使用
+def bar_chart(statistics):
+    data = statistics["statisticsData"]
+    fig = Figure()
+    ax = fig.subplots()
+    x = range(len(data["dates"]))
+    ax.bar(x, data["total"], width=0.4, label="总数", align="center")
+    ax.bar(x, data["defect"], width=0.4, label="缺陷", align="edge")
+    ax.set_xticks(x, data["dates"], fontproperties="SimHei")
+    ax.set_title("每日检测统计", fontproperties="SimHei")
+    ax.set_xlabel("日期", fontproperties="SimHei")
+    ax.set_ylabel("数量", fontproperties="SimHei")
+    ax.legend(prop={"family": "SimHei"})
+    return chart_image(fig)
+
+
+def pie_chart(statistics):
+    data = statistics["proportionData"]
+    fig = Figure()
+    ax = fig.subplots()
+    # 时间段内没有图片时 pie() 会报错，只留标题
+    if data:
+        ax.pie(
+            [item["value"] for item in data],
+            labels=[item["name"] for item in data],
+            autopct="%1.1f%%",
+            textprops={"fontproperties": "SimHei"},
+        )
+    ax.set_title("缺陷比例统计", fontproperties="SimHei")
+    return chart_image(fig)
+
+
+def line_chart(statistics):
+    data = statistics["singleStatisticsData"]
+    fig = Figure()
+    ax = fig.subplots()
+    for defect_type, values in data.items():
+        if defect_type != "dates":
+            ax.plot(data["dates"], values, label=defect_type, marker="o")
+    ax.set_title("每日缺陷统计", fontproperties="SimHei")
+    ax.set_xlabel("日期", fontproperties="SimHei")
+    ax.set_ylabel("数量", fontproperties="SimHei")
+    ax.legend(prop={"family": "SimHei"})
+    ax.grid(True)
+    return chart_image(fig)
+
+
+def render_report(start_time, end_time):
+    """生成 start_time ~ end_time 的检测报告，图表和 PDF 都在内存中完成，返回 PDF 字节"""
+    statistics = stats.summarize(start_time.date(), end_time.date())
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(1000, 1440))
+    c.setFont("SimHei", 30)  # 设置中文字体
+
+    # 标题
+    c.drawCentredString(500, 1350, "慧识-钢材缺陷检测报告")
+
+    # 副标题
+    c.setFont("SimHei", 15)
+    c.drawString(
+        50,
+        1300,
+        f"检测时间段：{start_time:%Y-%m-%d} - {end_time:%Y-%m-%d}",
+    )
+
+    # 次级标题
+    c.setFont("SimHei", 20)
+    c.drawString(50, 1250, "一、统计数据")
+
+    c.setFont("SimHei", 16)
+    c.drawString(
+        50,
+        1220,
+        f"共检测{sum(statistics['statisticsData']['total'])}张图片，"
+        f"其中缺陷图像{sum(statistics['statisticsData']['defect'])}张",
+    )
+
+    c.setFont("SimHei", 14)
+
+    # 插入柱状图
+    c.drawImage(bar_chart(statistics), 100, 730, width=800)
+    c.drawCentredString(500, 710, "图一 每日钢材检测数量统计")
+
+    # 插入饼图
+    c.drawImage(pie_chart(statistics), 200, 110, width=600)
+    c.drawCentredString(500, 90, "图二 钢材缺陷类型占比")
+
+    c.showPage()
+    c.setFont("SimHei", 14)
+
+    # 插入折线图
+    c.drawImage(line_chart(statistics), 100, 750, width=800)
+    c.drawCentredString(500, 730, "图三 各项缺陷数量统计")
+
+    # 次级标题
+    c.setFont("SimHei", 20)
+    c.drawString(50, 700, "二、典型缺陷展示")
+
+    y_position = 650  # 初始 y 坐标
+    for index, defect_type in enumerate(DEFECT_NAMES, 1):
+        # 添加再次一级标题
+        c.setFont("SimHei", 18)
+        c.drawString(70, y_position, f"{index}. {defect_type}")
+        y_position -= 30
+
+        # 随机选择该类缺陷的图片
+        images = sample_images(
+            defect_type, start_time, end_time, current_app.config["REPORT_SAMPLE_SIZE"]
+        )
+
+        if not images:
+            # 如果没有图片，插入提示文字
+            c.setFont("SimHei", 14)
+            c.drawString(100, y_position, "该缺陷类别没有检测到")
+            y_position -= 30
+            continue
+
+        for image in images:
+            # 插入说明
+            c.setFont("SimHei", 12)
+            c.drawString(100, y_position, f"检测时间：{image.detect_time}")
+            y_position -= 20
+            c.drawString(100, y_position, f"检测批次号：{image.batch_id}")
+            y_position -= 20
+            c.drawString(100, y_position, "检测结果：")
+            y_position -= 20
+
+            # 插入缩小后的图片，等比缩放到最大宽度800和最大高度200。尺寸取自缩小后的文件：
+            # 它和原图等比例，且是原图本身或不小于显示尺寸的 2 倍，结果相同；旧数据和部分视频帧没有记录宽高
+            image_path = report_images.get(image)
+            width, height = image_size(image_path)
+            scale = min(IMAGE_BOX[0] / width, IMAGE_BOX[1] / height, 1)
+            scaled_width = int(width * scale)
+            scaled_height = int(height * scale)
+            c.drawImage(
+                image_path,
+                100,
+                y_position - scaled_height,
+                width=scaled_width,
+                height=scaled_height,
+            )
+            y_position -= 20 + scaled_height
+
+            # 自动换页处理
+            if y_position < 100:
+                c.showPage()
+                c.setFont("SimHei", 18)
+                y_position = 1350
+
+    c.save()
+    return buffer.getvalue()
+
+
+class ReportRunner:
+    """
+    后台生成检测报告：报告记录在 hs_report 表里，由一个后台线程依次生成，
+    生成的 PDF 以唯一的文件名保存在 REPORT_FOLDER 下。服务重启后未完成的报告重新生成。
+    生成前用 pending -> running 的条件更新认领，同一份报告不会被同时生成两次。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = app.config["REPORT_FOLDER"]
+        app.extensions["report_runner"] = self
+
+    def start(self):
+        """启动后台线程，并把上次没生成完的报告重新排队；每个进程只启动一次"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._start()
+
+    def _start(self):
+        with self.app.app_context():
+            # 启动时仍是 running 的报告属于已退出的上一个进程，改回排队
+            HSReport.query.filter(HSReport.status == "running").update(
+                {"status": "pending"}
+            )
+            db.session.commit()
+            unfinished = (
+                HSReport.query.filter(HSReport.status.in_(HSReport.ACTIVE_STATUSES))
+                .order_by(HSReport.report_id)
+                .all()
+            )
+            for report in unfinished:
+                self._queue.put(report.report_id)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, start_time, end_time):
+        report = HSReport(
+            status="pending",
+            start_time=start_time,
+            end_time=end_time,
+            create_time=datetime.now(),
+        )
+        db.session.add(report)
+        db.session.commit()
+        self._queue.put(report.report_id)
+        return report
+
+    def path_for(self, report):
+        return os.path.join(self.folder, report.report_file_path)
+
+    def _run(self):
+        while True:
+            report_id = self._queue.get()
+            with self.app.app_context():
+                try:
+                    self._run_report(report_id)
+                except Exception as e:
+                    db.session.rollback()
+                    report = db.session.get(HSReport, report_id)
+                    if report is not None:
+                        report.status = "failed"
+                        report.error = str(e)
+                        report.finish_time = datetime.now()
+                        db.session.commit()
+                finally:
+                    db.session.remove()
+
+    def _claim(self, report_id):
+        """把报告从 pending 改为 running，返回是否由本线程认领成功"""
+        claimed = db.session.execute(
+            update(HSReport)
+            .where(HSReport.report_id == report_id, HSReport.status == "pending")
+            .values(status="running")
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _run_report(self, report_id):
+        if not self._claim(report_id):
+            return
+        report = db.session.get(HSReport, report_id)
+
+        data = render_report(report.start_time, report.end_time)
+        # 先写临时文件再改名，下载时不会读到写了一半的文件
+        os.makedirs(self.folder, exist_ok=True)
+        name = f"report_{report_id}_{uuid.uuid4().hex}.pdf"
+        tmp_path = os.path.join(self.folder, name + ".tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.folder, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        report.report_file_path = name
+        report.status = "finished"
+        report.finish_time = datetime.now()
+        db.session.commit()
+
+
+report_runner = ReportRunner()
@@ -1,13 +1,15 @@
-import hashlib
-import os
 from datetime import timedelta, datetime
-from PIL import UnidentifiedImageError, Image
 from dateutil.parser import parse
-from flask import Blueprint, request, jsonify, url_for
+from flask import Blueprint, request, jsonify
+from sqlalchemy import case, exists, func
 
 from src.extensions import db
-from src.config import get_upload_folder, get_allowed_extensions, get_max_content_length
-from src.models import HSBatch, HSImage
+from src.config import get_allowed_extensions, get_max_content_length
+from src.ingest import ingestor
+from src.thumbnails import thumbnail_url
+from src.models import HSBatch, HSImage, HSDefect
+from src import stats
+from src.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_filter, parse_limit
 
 batch_bp = Blueprint('batch', __name__)
 
@@ -33,51 +35,31 @@ def create_batch():
     db.session.add(new_batch)
     db.session.flush()
 
-    os.makedirs(get_upload_folder(), exist_ok=True)
-
-    image_entries = []
-    for file in files:
-        if file and allowed_file(file.filename):
-            time_now = datetime.now()
-            date_folder = time_now.strftime('%Y-%m-%d')  # 按日创建目录
-            daily_folder = os.path.join(get_upload_folder(), date_folder)
-            os.makedirs(daily_folder, exist_ok=True)
-            filename = hashlib.sha256(file.read()).hexdigest() + "_" + os.urandom(8).hex() + \
-                       os.path.splitext(file.filename)[1]
-            file.seek(0)
-            try:
-                image = Image.open(file.stream)
-            except (OSError, IOError, UnidentifiedImageError):
-                continue
-            width, height = image.size
-            file_path = os.path.join(daily_folder, filename)
-            image.save(file_path)
-
-            # 存储缩略图
-            thumbnail_path = os.path.join(daily_folder,
-                                          os.path.splitext(filename)[0] + "_thumbnail" + os.path.splitext(filename)[1])
-            try:
-                image.thumbnail((150, 150))
-                image.save(thumbnail_path)
-            except (OSError, IOError):
-                # 如果缩略图保存失败，用原图替代
-                file.save(thumbnail_path)
-
-            # 创建图片条目
-            image_entry = HSImage(
-                image_original_path=filename,
-                batch_id=new_batch.batch_id,
-                create_time=time_now,
-                width=width,
-                height=height
-            )
-            image_entries.append(image_entry)
+    time_now = datetime.now()
+
+    # 原图按原始字节并行写入内容寻址存储（边写边算哈希，只读文件头取尺寸），同样内容只存一份
+    uploads = [file for file in files if file and allowed_file(file.filename)]
+    saved = [s for s in ingestor.save_files(uploads) if s is not None]
+
+    # 创建图片条目，存储中的引用计数由触发器维护
+    image_entries = [
+        HSImage(
+            image_original_path=relpath,
+            batch_id=new_batch.batch_id,
+            create_time=time_now,
+            width=width,
+            height=height,
+            image_hash=image_hash
+        )
+        for relpath, image_hash, width, height in saved
+    ]
 
     if not image_entries:
         db.session.rollback()
         return jsonify({'error': '没有上传图片！'}), 400
 
     db.session.add_all(image_entries)
+    stats.record_created([entry.create_time for entry in image_entries])
     db.session.commit()
 
     if len(image_entries) != len(files):
@@ -87,16 +69,41 @@ def create_batch():
     return jsonify({'message': '图片全部上传成功！', 'batchId': new_batch.batch_id}), 201
 
 
+def batch_counts(batch_ids=None):
+    """
+    按批次统计图片数、未检测图片数和有缺陷的图片数，返回 {batch_id: (size, unfinished, defective)}。
+    给出 batch_ids 时只统计这些批次（走 batch_id 索引），分页时只算当前页
+    """
+    has_defect = exists().where(HSDefect.image_id == HSImage.image_id)
+    query = db.session.query(
+        HSImage.batch_id,
+        func.count(HSImage.image_id),
+        func.count(case((HSImage.detect_time.is_(None), 1))),
+        func.count(case((has_defect, 1))),
+    )
+    if batch_ids is not None:
+        if not batch_ids:
+            return {}
+        query = query.filter(HSImage.batch_id.in_(batch_ids))
+    return {batch_id: counts for batch_id, *counts in query.group_by(HSImage.batch_id)}
+
+
 @batch_bp.route('/get-batch-list', methods=['GET'])
 def get_batch_list():
     selectedDate = request.args.get('selectedDate')
     range_mode = request.args.get('rangeMode')
     sort_value = request.args.get('sortValue')
     finished_status = request.args.get('finishedStatus')
+    after = request.args.get('after')
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': '无效的 limit 参数'}), 400
+
     query = HSBatch.query
 
     # 筛选时间
-    if selectedDate != "undefined":
+    if selectedDate and selectedDate != "undefined":
         try:
             selected_date = parse(selectedDate)
         except ValueError:
@@ -117,31 +124,58 @@ def get_batch_list():
 
         query = query.filter(HSBatch.import_time >= start_date, HSBatch.import_time <= end_date)
 
-    # 筛选完成状态
+    # 筛选完成状态：是否还有未检测的图片，逐批次用 (batch_id, detect_time) 索引判断
+    has_unfinished = exists().where(HSImage.batch_id == HSBatch.batch_id, HSImage.detect_time.is_(None))
     if finished_status == 'finished':
-        query = query.filter(~HSBatch.images.any(HSImage.detect_time.is_(None)))
+        query = query.filter(~has_unfinished)
     elif finished_status == 'unfinished':
-        query = query.filter(HSBatch.images.any(HSImage.detect_time.is_(None)))
+        query = query.filter(has_unfinished)
+
+    # 根据 sort_value 排序，batch_id 作为最后一个排序键保证分页稳定
+    if sort_value in ('time', '-time'):
+        order_columns = [HSBatch.import_time, HSBatch.batch_id]
+    else:
+        order_columns = [HSBatch.batch_id]
+    descending = sort_value == '-time'
 
-    # 根据 sort_value 排序
-    if sort_value == 'time':
-        query = query.order_by(HSBatch.import_time.asc())
-    elif sort_value == '-time':
-        query = query.order_by(HSBatch.import_time.desc())
+    # 键集分页：after 是上一页返回的 nextCursor
+    if after:
+        try:
+            cursor_values = decode_cursor(after, len(order_columns))
+        except InvalidCursor:
+            return jsonify({'error': '无效的 after 参数'}), 400
+        query = query.filter(keyset_filter(order_columns, cursor_values, descending))
+    query = query.order_by(*[c.desc() if descending else c.asc() for c in order_columns])
+    if limit:
+        query = query.limit(limit + 1)
 
     # 获取结果
     batches = query.all()
-    result = [
-        {
+    next_cursor = None
+    if limit and len(batches) > limit:
+        batches = batches[:limit]
+        last = batches[-1]
+        next_cursor = encode_cursor(*[getattr(last, c.key) for c in order_columns])
+
+    # 只统计本页的批次；不分页时本来就要返回全部批次，一次统计整张表
+    counts = batch_counts([batch.batch_id for batch in batches] if limit else None)
+
+    result = []
+    for batch in batches:
+        batch_size, batch_unfinished, batch_defective = counts.get(batch.batch_id, (0, 0, 0))
+        result.append({
             'batchId': batch.batch_id,
             'importTime': batch.import_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'status': '已完成' if batch.get_batch_status() == 'finished' else '未完成',
-            'size': batch.get_batch_size()
-        }
-        for batch in batches
-    ]
+            'status': '已完成' if batch_unfinished == 0 else '未完成',
+            'size': batch_size,
+            'unfinished': batch_unfinished,
+            'defective': batch_defective
+        })
 
-    return jsonify(result), 200
+    # 不分页时保持原来的数组格式
+    if limit is None:
+        return jsonify(result), 200
+    return jsonify({'items': result, 'nextCursor': next_cursor}), 200
 
 
 @batch_bp.route('/get-batch-detail', methods=['GET'])
@@ -149,27 +183,62 @@ def get_batch_detail():
     batch_id = request.args.get('batchId')
     if not batch_id:
         return jsonify({'error': '缺少 batchId 参数'}), 400
+    after = request.args.get('after')
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': '无效的 limit 参数'}), 400
 
-    batch = HSBatch.query.get(batch_id)
+    batch = db.session.get(HSBatch, batch_id)
     if not batch:
         return jsonify({'error': '未找到对应的批次'}), 404
 
-    images = batch.images.all()
+    size, unfinished = db.session.query(
+        func.count(HSImage.image_id),
+        func.count(case((HSImage.detect_time.is_(None), 1))),
+    ).filter(HSImage.batch_id == batch.batch_id).one()
+
+    # 每张图片是否有缺陷用 EXISTS 子查询一起取出
+    has_defect = exists().where(HSDefect.image_id == HSImage.image_id).correlate(HSImage)
+    query = db.session.query(
+        HSImage.image_id,
+        HSImage.detect_time,
+        HSImage.create_time,
+        HSImage.image_hash,
+        has_defect.label('has_defect'),
+    ).filter(HSImage.batch_id == batch.batch_id)
+    if after:
+        try:
+            (after_id,) = decode_cursor(after, 1)
+        except InvalidCursor:
+            return jsonify({'error': '无效的 after 参数'}), 400
+        query = query.filter(HSImage.image_id > after_id)
+    query = query.order_by(HSImage.image_id)
+    if limit:
+        query = query.limit(limit + 1)
+
+    images = query.all()
+    next_cursor = None
+    if limit and len(images) > limit:
+        images = images[:limit]
+        next_cursor = encode_cursor(images[-1].image_id)
+
     result = {
         'batchId': batch.batch_id,
         'importTime': batch.import_time.strftime('%Y-%m-%d %H:%M:%S'),
-        'size': batch.get_batch_size(),
-        'status': '已完成' if batch.get_batch_status() == 'finished' else '未完成',
+        'size': size,
+        'status': '已完成' if unfinished == 0 else '未完成',
         'images': [
             {
                 'imageId': image.image_id,
                 'status': 'untouched' if image.detect_time is None else (
-                    'faulty' if image.defects.count() > 0 else 'flawless'),
-                'thumbnail': url_for('static',
-                                     filename=f"{image.create_time.strftime('%Y-%m-%d')}/{os.path.splitext(image.image_original_path)[0]}_thumbnail{os.path.splitext(image.image_original_path)[1]}")
+                    'faulty' if image.has_defect else 'flawless'),
+                'thumbnail': thumbnail_url(image.image_id, image.image_hash)
             }
             for image in images
         ]
     }
+    if limit is not None:
+        result['nextCursor'] = next_cursor
 
     return jsonify(result), 200
@@ -0,0 +1,86 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy import select
+
+from src.extensions import db
+from src.models import HSDefect, HSImage, defect_rtree
+from src.pagination import InvalidCursor, decode_cursor, encode_cursor, parse_limit
+
+defect_bp = Blueprint('defect', __name__)
+
+
+def float_arg(name):
+    value = request.args.get(name)
+    return None if value in (None, '') else float(value)
+
+
+@defect_bp.route('/search', methods=['GET'])
+def search_defects():
+    """
+    按区域 / 面积 / 置信度 / 类型查找缺陷。
+    区域 x1,y1,x2,y2 通过 R*Tree 查找与之相交的缺陷框，contained=true 时只要完全落在区域内的。
+    """
+    try:
+        region = [float_arg(k) for k in ('x1', 'y1', 'x2', 'y2')]
+        min_area = float_arg('min_area')
+        max_area = float_arg('max_area')
+        min_confidence = float_arg('min_confidence')
+        limit = parse_limit(request.args.get('limit')) or 100
+    except ValueError:
+        return jsonify({'error': '参数格式错误'}), 400
+    defect_type = request.args.get('defect_type').split(',') if request.args.get('defect_type') else []
+    batch_id = request.args.get('batchId')
+    contained = request.args.get('contained') == 'true'
+    after = request.args.get('after')
+
+    query = db.session.query(HSDefect, HSImage.batch_id).join(HSImage, HSImage.image_id == HSDefect.image_id)
+
+    if any(v is not None for v in region):
+        if any(v is None for v in region):
+            return jsonify({'error': '区域需要同时提供 x1, y1, x2, y2'}), 400
+        rx1, ry1, rx2, ry2 = region
+        if contained:
+            conditions = [defect_rtree.c.min_x >= rx1, defect_rtree.c.max_x <= rx2,
+                          defect_rtree.c.min_y >= ry1, defect_rtree.c.max_y <= ry2]
+        else:
+            conditions = [defect_rtree.c.max_x >= rx1, defect_rtree.c.min_x <= rx2,
+                          defect_rtree.c.max_y >= ry1, defect_rtree.c.min_y <= ry2]
+        query = query.filter(HSDefect.defect_id.in_(select(defect_rtree.c.defect_id).where(*conditions)))
+    if min_area is not None:
+        query = query.filter(HSDefect.area >= min_area)
+    if max_area is not None:
+        query = query.filter(HSDefect.area <= max_area)
+    if min_confidence is not None:
+        query = query.filter(HSDefect.confidence >= min_confidence)
+    if defect_type:
+        query = query.filter(HSDefect.defect_type.in_(defect_type))
+    if batch_id:
+        query = query.filter(HSImage.batch_id == batch_id)
+
+    if after:
+        try:
+            (after_id,) = decode_cursor(after, 1)
+        except InvalidCursor:
+            return jsonify({'error': '无效的 after 参数'}), 400
+        query = query.filter(HSDefect.defect_id > after_id)
+
+    rows = query.order_by(HSDefect.defect_id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][0].defect_id)
+
+    return jsonify({
+        'items': [
+            {
+                'defectId': defect.defect_id,
+                'imageId': defect.image_id,
+                'batchId': image_batch_id,
+                'defectType': defect.defect_type,
+                'bbox': [defect.x1, defect.y1, defect.x2, defect.y2],
+                'area': defect.area,
+                'confidence': defect.confidence
+            }
+            for defect, image_batch_id in rows
+        ],
+        'nextCursor': next_cursor
+    }), 200
@@ -1,20 +1,20 @@
 from flask import (
     Blueprint,
+    current_app,
     request,
     Response,
     stream_with_context,
     json,
     jsonify,
-    url_for,
 )
 
-from src.extensions import db
-from src.models import HSBatch, HSImage, HSDefect
-from src.detect_utils import detect, DEFECT_NAMES
-from src.config import get_upload_folder
+import time
 
-import os
-from datetime import datetime
+from src.extensions import db
+from src.models import HSBatch, HSImage, HSDetectJob
+from src.detect_utils import detect_image, detect_images, dispatcher
+from src.detect_jobs import job_runner
+from src.render import processed_url
 
 detect_bp = Blueprint("detect", __name__)
 
@@ -30,37 +30,11 @@ def single_detect():
     if not image:
         return {"error": "Image not found"}, 404
 
-    # 读取图像文件字节并检测
-    date_folder = image.create_time.strftime("%Y-%m-%d")
-    file_path = os.path.join(
-        get_upload_folder(), date_folder, image.image_original_path
-    )
+    # 检测（内容相同的图片直接复用已有结果）
     try:
-        with open(file_path, "rb") as f:
-            image_bytes = f.read()
-    except Exception as e:
+        has_defect = detect_image(image)
+    except OSError as e:
         return jsonify({"error": f"Failed to read image file: {e}"}), 500
-    response = detect(image_bytes)
-    has_defect = len(response.results) > 0
-    # 保存处理后的图像
-    time_now = datetime.now()
-    processed_name = f"{os.path.splitext(image.image_original_path)[0]}_processed{os.path.splitext(image.image_original_path)[1]}"
-    processed_folder = os.path.join(get_upload_folder(), date_folder)
-    os.makedirs(processed_folder, exist_ok=True)
-    processed_path = os.path.join(processed_folder, processed_name)
-    with open(processed_path, "wb") as f:
-        f.write(response.processed_image)
-    image.image_processed_path = processed_name
-    image.detect_time = time_now
-    # 存储缺陷记录
-    for det in response.results:
-        defect = HSDefect(
-            defect_type=DEFECT_NAMES[det.class_id],
-            bbox=",".join(map(str, det.box)),
-            confidence=det.confidence,
-            image_id=image.image_id,
-        )
-        db.session.add(defect)
     db.session.commit()
 
     db.session.refresh(image)
@@ -69,14 +43,7 @@ def single_detect():
         "hasDefect": has_defect,
         "imageId": image.image_id,
         "detectTime": image.detect_time,
-        "processed": (
-            None
-            if image.image_processed_path is None
-            else url_for(
-                "static",
-                filename=f"{image.detect_time.strftime('%Y-%m-%d')}/{image.image_processed_path}",
-            )
-        ),
+        "processed": processed_url(image),
         "defects": [
             {
                 "defectId": defect.defect_id,
@@ -109,49 +76,91 @@ def batch_detect():
         return {"message": "All images have been detected"}, 200
 
     def generate():
-        # 第一次返回未检测图片的 ID 列表
+        # 每行一个 JSON 对象（NDJSON）；第一行是未检测图片的 ID 列表
         yield json.dumps(
             {"undetectedImageIds": [img.image_id for img in undetected_images]}
-        )
-
-        # 循环检测每张图片
-        for image in undetected_images:
-            # 读取图像文件并检测
-            date_folder = image.create_time.strftime("%Y-%m-%d")
-            file_path = os.path.join(
-                get_upload_folder(), date_folder, image.image_original_path
-            )
-            try:
-                with open(file_path, "rb") as f:
-                    img_bytes = f.read()
-            except Exception as e:
+        ) + "\n"
+
+        for image, has_defect, error in detect_images(
+            undetected_images,
+            prefetch=current_app.config["BATCH_DETECT_PREFETCH"],
+            commit_size=current_app.config["BATCH_DETECT_COMMIT_SIZE"],
+            writers=current_app.config["BATCH_DETECT_WRITERS"],
+        ):
+            if error is not None:
+                kind = "Read error" if isinstance(error, OSError) else "Detect error"
+                yield json.dumps(
+                    {"imageId": image.image_id, "error": f"{kind}: {error}"}
+                ) + "\n"
+            else:
                 yield json.dumps(
-                    {"imageId": image.image_id, "error": f"Read error: {e}"}
-                )
-                continue
-            response = detect(img_bytes)
-            has_defect = len(response.results) > 0
-            # 持久化结果
-            time_now = datetime.now()
-            processed_name = f"{os.path.splitext(image.image_original_path)[0]}_processed{os.path.splitext(image.image_original_path)[1]}"
-            processed_folder = os.path.join(get_upload_folder(), date_folder)
-            os.makedirs(processed_folder, exist_ok=True)
-            processed_path = os.path.join(processed_folder, processed_name)
-            with open(processed_path, "wb") as f:
-                f.write(response.processed_image)
-            image.image_processed_path = processed_name
-            image.detect_time = time_now
-            for det in response.results:
-                defect = HSDefect(
-                    defect_type=DEFECT_NAMES[det.class_id],
-                    bbox=",".join(map(str, det.box)),
-                    confidence=det.confidence,
-                    image_id=image.image_id,
-                )
-                db.session.add(defect)
-            db.session.commit()
-            yield json.dumps({"imageId": image.image_id, "hasDefect": has_defect})
+                    {"imageId": image.image_id, "hasDefect": has_defect}
+                ) + "\n"
 
     return Response(
-        stream_with_context(generate()), headers={"Content-Type": "application/json"}
+        stream_with_context(generate()),
+        headers={"Content-Type": "application/x-ndjson"},
     )
+
+
+@detect_bp.route("/jobs", methods=["POST"])
+def submit_detect_job():
+    batch_id = request.args.get("batchId")
+    if not batch_id:
+        return {"error": "batchId is required"}, 400
+
+    batch = HSBatch.query.filter_by(batch_id=batch_id).first()
+    if not batch:
+        return {"error": "Batch not found"}, 404
+
+    job = job_runner.submit(batch)
+    return jsonify(job.to_dict()), 201
+
+
+@detect_bp.route("/jobs/<int:job_id>", methods=["GET"])
+def get_detect_job(job_id):
+    job = db.session.get(HSDetectJob, job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    return jsonify(job.to_dict()), 200
+
+
+@detect_bp.route("/jobs/<int:job_id>/cancel", methods=["POST"])
+def cancel_detect_job(job_id):
+    job = db.session.get(HSDetectJob, job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    job = job_runner.cancel(job)
+    return jsonify(job.to_dict()), 200
+
+
+@detect_bp.route("/jobs/<int:job_id>/progress", methods=["GET"])
+def stream_detect_job(job_id):
+    job = db.session.get(HSDetectJob, job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    interval = current_app.config["DETECT_JOB_POLL_INTERVAL"]
+
+    def generate():
+        # 每行一个 JSON 对象（NDJSON），进度有变化时推送，任务结束后关闭
+        last = None
+        while True:
+            db.session.expire_all()
+            current = db.session.get(HSDetectJob, job_id).to_dict()
+            if current != last:
+                yield json.dumps(current) + "\n"
+                last = current
+            if current["status"] not in HSDetectJob.ACTIVE_STATUSES:
+                return
+            time.sleep(interval)
+
+    return Response(
+        stream_with_context(generate()),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+
+@detect_bp.route("/pool", methods=["GET"])
+def get_detector_pool():
+    """各检测服务的健康状态、未完成请求数和调用统计"""
+    return jsonify(dispatcher.pool.stats()), 200
@@ -1,9 +1,14 @@
-from flask import Blueprint, request, jsonify, url_for
+from flask import Blueprint, Response, current_app, json, request, jsonify, send_file, stream_with_context, url_for
 
+from src.extensions import db
+from src import stats
 from src.models import HSImage, HSDefect
+from src.pagination import InvalidCursor, decode_cursor, encode_cursor, parse_limit
+from src.blobstore import original_relpath
+from src.render import ensure_processed, processed_url
+from src.thumbnails import IMMUTABLE_MAX_AGE, thumbnails
 
-from flask import request, jsonify
-from sqlalchemy import and_
+from sqlalchemy import and_, exists
 from datetime import datetime
 from collections import defaultdict
 
@@ -23,9 +28,8 @@ def get_image_detail():
     image_detail = {
         'imageId': image.image_id,
         'original': None if image.image_original_path is None else url_for('static',
-                                                                           filename=f"{image.create_time.strftime('%Y-%m-%d')}/{image.image_original_path}"),
-        'processed': None if image.image_processed_path is None else url_for('static',
-                                                                             filename=f"{image.detect_time.strftime('%Y-%m-%d')}/{image.image_processed_path}"),
+                                                                           filename=original_relpath(image)),
+        'processed': processed_url(image),
         'createTime': image.create_time.strftime('%Y-%m-%d %H:%M:%S'),
         'detectTime': image.detect_time.strftime('%Y-%m-%d %H:%M:%S') if image.detect_time else None,
         'width': image.width,
@@ -43,16 +47,86 @@ def get_image_detail():
     return jsonify(image_detail), 200
 
 
+@image_bp.route('/processed/<int:image_id>', methods=['GET'])
+def get_processed_image(image_id):
+    """返回处理后图像，结构化输出模式下第一次访问时才生成"""
+    image = db.session.get(HSImage, image_id)
+    if image is None or image.detect_time is None:
+        return jsonify({'error': '图片未找到或尚未检测'}), 404
+    try:
+        path = ensure_processed(image)
+    except OSError as e:
+        return jsonify({'error': f'生成处理后图像失败: {e}'}), 500
+    return send_file(path)
+
+
+@image_bp.route('/thumb/<int:image_id>', methods=['GET'])
+def get_thumbnail(image_id):
+    """
+    缩略图，第一次请求某个尺寸时生成。size 向上取到 THUMBNAIL_SIZES 中的档位；
+    v 与原图哈希一致时地址内容不会变，允许浏览器长期缓存，否则每次用 ETag 验证
+    """
+    size = request.args.get('size', type=int)
+    if size is not None and size <= 0:
+        return jsonify({'error': '无效的 size 参数'}), 400
+    image = db.session.get(HSImage, image_id)
+    if image is None or image.image_original_path is None:
+        return jsonify({'error': '图片未找到'}), 404
+    try:
+        path = thumbnails.get(image, thumbnails.pick_size(size))
+    except FileNotFoundError:
+        return jsonify({'error': '原图不存在'}), 404
+    except OSError as e:
+        return jsonify({'error': f'生成缩略图失败: {e}'}), 500
+
+    version = request.args.get('v')
+    immutable = bool(version and image.image_hash and image.image_hash.startswith(version))
+    response = send_file(path, mimetype='image/jpeg', max_age=IMMUTABLE_MAX_AGE if immutable else 0)
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
+
+
+def load_defect_types(image_ids):
+    """一次查询取出这些图片各自的缺陷类型"""
+    defect_types = defaultdict(list)
+    if image_ids:
+        rows = db.session.query(HSDefect.image_id, HSDefect.defect_type).filter(
+            HSDefect.image_id.in_(image_ids)).distinct()
+        for image_id, dt in rows:
+            defect_types[image_id].append(dt)
+    return defect_types
+
+
+def serialize_images(rows):
+    defect_types = load_defect_types([row.image_id for row in rows])
+    return [
+        {
+            'image_id': row.image_id,
+            'create_time': row.create_time.strftime('%Y-%m-%d'),
+            'detected': row.detect_time is not None,
+            'detect_time': row.detect_time.strftime('%Y-%m-%d') if row.detect_time else None,
+            'defect_types': defect_types.get(row.image_id) or ['无缺陷']
+        }
+        for row in rows
+    ]
+
+
 @image_bp.route('/get-image-list', methods=['GET'])
 def get_images():
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
     detected = request.args.get('detected')
     defect_type = request.args.get('defect_type').split(',') if request.args.get('defect_type') else []
+    after = request.args.get('after')
+    stream = request.args.get('stream') == 'true'
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': '无效的 limit 参数'}), 400
 
-    print(defect_type)
-
-    query = HSImage.query
+    query = db.session.query(HSImage.image_id, HSImage.create_time, HSImage.detect_time)
 
     if start_time and end_time:
         query = query.filter(HSImage.create_time.between(start_time, end_time))
@@ -62,70 +136,65 @@ def get_images():
     elif detected == 'false':
         query = query.filter(HSImage.detect_time.is_(None))
 
-    results = []
-    for img in query.all():
-        defect_types = list({d.defect_type for d in img.defects})
-        if defect_type and not any(dt in defect_types for dt in defect_type):
-            continue
-        results.append({
-            'image_id': img.image_id,
-            'create_time': img.create_time.strftime('%Y-%m-%d'),
-            'detected': img.detect_time is not None,
-            'detect_time': img.detect_time.strftime('%Y-%m-%d') if img.detect_time else None,
-            'defect_types': defect_types or ['无缺陷']
-        })
-
-    return jsonify(results), 200
+    # 缺陷类型筛选在数据库中完成
+    if defect_type:
+        query = query.filter(exists().where(
+            HSDefect.image_id == HSImage.image_id,
+            HSDefect.defect_type.in_(defect_type)
+        ))
+
+    # 键集分页：按 image_id 排序，after 是上一页返回的 nextCursor
+    after_id = None
+    if after:
+        try:
+            (after_id,) = decode_cursor(after, 1)
+        except InvalidCursor:
+            return jsonify({'error': '无效的 after 参数'}), 400
+
+    def fetch_page(start_after, size):
+        page = query
+        if start_after is not None:
+            page = page.filter(HSImage.image_id > start_after)
+        page = page.order_by(HSImage.image_id)
+        if size:
+            page = page.limit(size)
+        return page.all()
+
+    # 大量导出：逐块查询，每行一个 JSON 对象（NDJSON）
+    if stream:
+        chunk_size = current_app.config['IMAGE_LIST_STREAM_CHUNK']
+
+        def generate():
+            last_id = after_id
+            while True:
+                rows = fetch_page(last_id, chunk_size)
+                for item in serialize_images(rows):
+                    yield json.dumps(item) + '\n'
+                if len(rows) < chunk_size:
+                    return
+                last_id = rows[-1].image_id
+
+        return Response(stream_with_context(generate()),
+                        headers={'Content-Type': 'application/x-ndjson'})
+
+    rows = fetch_page(after_id, limit + 1 if limit else None)
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].image_id)
+    results = serialize_images(rows)
+
+    # 不分页时保持原来的数组格式
+    if limit is None:
+        return jsonify(results), 200
+    return jsonify({'items': results, 'nextCursor': next_cursor}), 200
 
 
 @image_bp.route('/get-image-statistics', methods=['GET'])
 def get_statistics():
     start_time = request.args.get('start_time')
     end_time = request.args.get('end_time')
-    # print(f"start_time:{start_time}")
-    # print(f"end_time:{end_time}")
-    # for img in HSImage.query.all():
-    #     print(img.create_time)
-    start_date = datetime.strptime(start_time, "%Y-%m-%d") if start_time else None
-    end_date = datetime.strptime(end_time, "%Y-%m-%d") if end_time else None
-    if end_date:
-        end_date = end_date.replace(hour=23, minute=59, second=59)
-
-    images = HSImage.query.filter(HSImage.create_time.between(start_date, end_date)).all()
-
-    # print(len(images))
-    date_stats = defaultdict(lambda: {'total': 0, 'defect': 0, 'types': defaultdict(int)})
-    defect_proportion = defaultdict(int)
-
-    for img in images:
-        date = img.create_time.strftime('%Y-%m-%d')
-        date_stats[date]['total'] += 1
-        if img.defects.count() > 0:
-            date_stats[date]['defect'] += 1
-            for d in img.defects:
-                date_stats[date]['types'][d.defect_type] += 1
-                defect_proportion[d.defect_type] += 1
-        else:
-            defect_proportion['无缺陷'] += 1
-
-    dates = sorted(date_stats.keys())
-    statisticsData = {
-        'dates': dates,
-        'total': [date_stats[d]['total'] for d in dates],
-        'defect': [date_stats[d]['defect'] for d in dates]
-    }
-
-    singleStatisticsData = {
-        'dates': dates
-    }
-
-    for defect_type in set(dt for d in dates for dt in date_stats[d]['types'].keys()):
-        singleStatisticsData[defect_type] = [date_stats[d]['types'].get(defect_type, 0) for d in dates]
-
-    proportionData = [{'name': k, 'value': v} for k, v in defect_proportion.items()]
+    start_date = datetime.strptime(start_time, "%Y-%m-%d").date() if start_time else None
+    end_date = datetime.strptime(end_time, "%Y-%m-%d").date() if end_time else None
 
-    return jsonify({
-        'statisticsData': statisticsData,
-        'proportionData': proportionData,
-        'singleStatisticsData': singleStatisticsData
-    })
+    return jsonify(stats.summarize(start_date, end_date))
@@ -1,102 +1,81 @@
 from flask_socketio import emit
-from flask import request
-import base64
-from src.detect_utils import detect, DEFECT_NAMES
-from src.extensions import db
-from src.models import HSBatch, HSImage, HSDefect
+from flask import request, current_app
+from src.detect_utils import DEFECT_NAMES, dispatcher
+from src.db_writer import db_writer
+from src.models import HSDefect
 from src.config import get_upload_folder
+from src.blobstore import blob_store
+from src.ingest import image_size
 from datetime import datetime
-import hashlib
 import os
-from src.rpc_client import DetectorClient
-from PIL import Image
+import queue
+import threading
 
-# track batch per client session
+# track batch per client session: the Future of the batch insert, so only the
+# first frame submits it and the others wait for it without holding the lock
 sessions = {}
+sessions_lock = threading.Lock()
+# one long-lived detection stream per client session, opened through the
+# dispatcher's pool on the detector with the fewest open streams
+streams = {}
+streams_lock = threading.Lock()
+# 检测结果在 gRPC 的读线程里回调，eventlet/gevent 模式下不能在普通线程里直接调用
+# socketio.emit；要推送的消息放进这个队列，由 socketio 的后台任务发出
+outbox = queue.SimpleQueue()
+# eventlet/gevent 下轮询队列的间隔（秒）：有消息时用最短间隔，空闲时逐步加长到最长间隔
+OUTBOX_POLL_MIN = 0.005
+OUTBOX_POLL_MAX = 0.2
+sender_lock = threading.Lock()
+sender_started = False
+
+
+def send(event, data, sid):
+    """从任意线程推送消息给客户端"""
+    outbox.put((event, data, sid))
+
+
+def start_sender(socketio):
+    global sender_started
+    with sender_lock:
+        if not sender_started:
+            socketio.start_background_task(run_sender, socketio)
+            sender_started = True
+
+
+def run_sender(socketio):
+    if socketio.async_mode == "threading":
+        # 后台任务是普通线程，直接阻塞等待
+        while True:
+            event, data, sid = outbox.get()
+            socketio.emit(event, data, room=sid, namespace="/video")
+    # eventlet/gevent 下阻塞的 get 会卡住事件循环，队列为空时用 socketio.sleep 让出
+    interval = OUTBOX_POLL_MIN
+    while True:
+        try:
+            event, data, sid = outbox.get_nowait()
+        except queue.Empty:
+            socketio.sleep(interval)
+            interval = min(interval * 2, OUTBOX_POLL_MAX)
+            continue
+        interval = OUTBOX_POLL_MIN
+        socketio.emit(event, data, room=sid, namespace="/video")
 
 
 def register_video_events(socketio):
     @socketio.on("frame", namespace="/video")
     def handle_video_frame(data):
         sid = request.sid  # 获取当前客户端的sid
-        image_bytes = data
         try:
-            # perform detection
-            client = DetectorClient()
-            response = client.detect(image_bytes)
-            # print(f"Received detection response for session {sid}: {response}")
-            # Build detection results list for overlay
-            defects = []
-            notifications_list = []
-            for idx, result in enumerate(response.results):
-                x1, y1, x2, y2 = result.box
-                label = (
-                    DEFECT_NAMES[result.class_id]
-                    if result.class_id < len(DEFECT_NAMES)
-                    else str(result.class_id)
-                )
-                defects.append(
-                    {
-                        "x": int(x1),
-                        "y": int(y1),
-                        "w": int(x2 - x1),
-                        "h": int(y2 - y1),
-                        "label": label,
-                    }
-                )
-                notifications_list.append(
-                    {"id": idx + 1, "type": label, "severity": "danger"}
-                )
-            emit(
-                "processed_frame",
-                {
-                    "processed_image": response.processed_image,  # 直接 bytes
-                    "defects": defects,
-                    "notifications": notifications_list,
-                },
-                room=sid,
-                namespace="/video",
-            )
-            # if defects found, save to batch/session
-            if response.results:
-                # create batch on first defect
-                if sid not in sessions:
-                    batch = HSBatch(import_time=datetime.now())
-                    db.session.add(batch)
-                    db.session.commit()
-                    sessions[sid] = batch.batch_id
-                batch_id = sessions[sid]
-                # prepare storage folder
-                date_folder = datetime.now().strftime("%Y-%m-%d")
-                upload_dir = os.path.join(get_upload_folder(), date_folder)
-                os.makedirs(upload_dir, exist_ok=True)
-                # save raw image
-                fname = (
-                    hashlib.sha256(image_bytes).hexdigest()
-                    + "_"
-                    + datetime.now().strftime("%H%M%S%f")
-                    + ".jpg"
-                )
-                raw_path = save_raw_image(image_bytes, upload_dir, fname)
-                # save thumbnail
-                thumb_name = (
-                    os.path.splitext(fname)[0]
-                    + "_thumbnail"
-                    + os.path.splitext(fname)[1]
-                )
-                thumb_path = os.path.join(upload_dir, thumb_name)
-                width, height = save_thumbnail(raw_path, thumb_path)
-                # create image record
-                img = create_image_record(fname, batch_id, width, height)
-                # save processed image
-                proc_name = (
-                    os.path.splitext(fname)[0]
-                    + "_processed"
-                    + os.path.splitext(fname)[1]
-                )
-                save_processed_image(response.processed_image, upload_dir, proc_name)
-                update_image_processed(img, proc_name)
-                save_defects(img, response)
+            with streams_lock:
+                stream = streams.get(sid)
+                if stream is None or stream.closed:
+                    start_sender(socketio)
+                    stream = open_session_stream(
+                        current_app._get_current_object(), sid
+                    )
+                    streams[sid] = stream
+            # 积压过多时丢帧，保证实时性
+            stream.send(data)
         except Exception as e:
             emit(
                 "error",
@@ -105,25 +84,110 @@ def register_video_events(socketio):
                 namespace="/video",
             )
 
+    @socketio.on("disconnect", namespace="/video")
+    def handle_disconnect():
+        with streams_lock:
+            stream = streams.pop(request.sid, None)
+        if stream is not None:
+            stream.close()
+        # 已发出的帧仍可能回调，那时会为这个 sid 重新建批次
+        with sessions_lock:
+            sessions.pop(request.sid, None)
 
-def save_raw_image(image_bytes, upload_dir, fname):
-    raw_path = os.path.join(upload_dir, fname)
-    with open(raw_path, "wb") as f:
-        f.write(image_bytes)
-    return raw_path
 
+def open_session_stream(app, sid):
+    # 在 gRPC 读线程中调用：存储和入库在这里做，推送经 send() 交给 socketio 的后台任务
+    def on_result(seq, image_bytes, response, error):
+        with app.app_context():
+            if error is not None:
+                send("error", {"msg": f"Detection error: {error}", "seq": seq}, sid)
+                return
+            try:
+                handle_frame_result(sid, seq, image_bytes, response)
+            except Exception as e:
+                send("error", {"msg": f"Detection error: {str(e)}", "seq": seq}, sid)
 
-def save_thumbnail(raw_path, thumb_path):
-    width, height = None, None
-    try:
-        img_pil = Image.open(raw_path)
-        width, height = img_pil.size
-        img_pil.thumbnail((150, 150))
-        img_pil.save(thumb_path)
-    except Exception:
-        with open(raw_path, "rb") as src, open(thumb_path, "wb") as dst:
-            dst.write(src.read())
-    return width, height
+    return dispatcher.pool.open_stream(
+        on_result, confidence=app.config["DETECT_CONFIDENCE"]
+    )
+
+
+def handle_frame_result(sid, seq, image_bytes, response):
+    # Build detection results list for overlay
+    defects = []
+    notifications_list = []
+    for idx, result in enumerate(response.results):
+        x1, y1, x2, y2 = result.box
+        label = (
+            DEFECT_NAMES[result.class_id]
+            if result.class_id < len(DEFECT_NAMES)
+            else str(result.class_id)
+        )
+        defects.append(
+            {
+                "x": int(x1),
+                "y": int(y1),
+                "w": int(x2 - x1),
+                "h": int(y2 - y1),
+                "label": label,
+            }
+        )
+        notifications_list.append(
+            {"id": idx + 1, "type": label, "severity": "danger"}
+        )
+    send(
+        "processed_frame",
+        {
+            "seq": seq,
+            "processed_image": response.processed_image,  # 直接 bytes
+            "defects": defects,
+            "notifications": notifications_list,
+        },
+        sid,
+    )
+    # if defects found, save to batch/session
+    if response.results:
+        # 日期目录和记录的 create_time/detect_time 用同一个时间，跨零点的帧也能找到处理后图像
+        now = datetime.now()
+        # create batch on first defect (需要 batch_id，在锁外等待写线程确认，不阻塞其他会话)
+        with sessions_lock:
+            batch = sessions.get(sid)
+            if batch is None:
+                batch = sessions[sid] = db_writer.submit("batch", {"import_time": now})
+        try:
+            batch_id = batch.result()
+        except Exception:
+            # 建批次失败时下一帧重试
+            with sessions_lock:
+                if sessions.get(sid) is batch:
+                    del sessions[sid]
+            raise
+        # prepare storage folder
+        date_folder = now.strftime("%Y-%m-%d")
+        upload_dir = os.path.join(get_upload_folder(), date_folder)
+        os.makedirs(upload_dir, exist_ok=True)
+        # 原图存入内容寻址存储，同样的帧只存一份；不 fsync，帧比批量上传多得多
+        fname, image_hash = blob_store.put_bytes(image_bytes, ".jpg", fsync=False)
+        # 缩略图在第一次请求时生成（/api/image/thumb），这里只从文件头读尺寸
+        try:
+            width, height = image_size(blob_store.abspath(fname))
+        except OSError:
+            width, height = None, None
+        # save processed image（按日目录，每帧一个）
+        proc_name = (
+            image_hash
+            + "_"
+            + now.strftime("%H%M%S%f")
+            + "_processed.jpg"
+        )
+        save_processed_image(response.processed_image, upload_dir, proc_name)
+        # 图片和缺陷记录交给写线程批量入库，不等待
+        db_writer.submit(
+            "frame",
+            frame_record(
+                fname, proc_name, batch_id, width, height, image_hash, response, now
+            ),
+        )
 
 
 def save_processed_image(processed_bytes, upload_dir, proc_name):
@@ -133,33 +197,27 @@ def save_processed_image(processed_bytes, upload_dir, proc_name):
     return proc_path
 
 
-def create_image_record(fname, batch_id, width, height):
-    img = HSImage(
-        image_original_path=fname,
-        batch_id=batch_id,
-        create_time=datetime.now(),
-        width=width,
-        height=height,
-    )
-    db.session.add(img)
-    db.session.commit()
-    return img
-
-
-def update_image_processed(img, proc_name):
-    img.image_processed_path = proc_name
-    img.detect_time = datetime.now()
-    db.session.add(img)
-    db.session.commit()
-
-
-def save_defects(img, response):
-    for det in response.results:
-        defect = HSDefect(
-            defect_type=DEFECT_NAMES[det.class_id],
-            bbox=",".join(map(str, det.box)),
-            confidence=det.confidence,
-            image_id=img.image_id,
-        )
-        db.session.add(defect)
-    db.session.commit()
+def frame_record(fname, proc_name, batch_id, width, height, image_hash, response, now):
+    return {
+        "image": {
+            "image_original_path": fname,
+            "image_processed_path": proc_name,
+            "batch_id": batch_id,
+            "create_time": now,
+            "detect_time": now,
+            "width": width,
+            "height": height,
+            "image_hash": image_hash,
+            "model_version": response.model_version
+            or current_app.config["DETECT_MODEL_VERSION"],
+            "detect_conf": current_app.config["DETECT_CONFIDENCE"],
+        },
+        "defects": [
+            dict(
+                HSDefect.box_columns(det.box),
+                defect_type=DEFECT_NAMES[det.class_id],
+                confidence=det.confidence,
+            )
+            for det in response.results
+        ],
+    }
@@ -1,20 +1,390 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+
 import grpc
 import detect_pb2
 import detect_pb2_grpc
 
+# DetectChunked 每块的大小
+CHUNK_SIZE = 1024 * 1024
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "[::1]"}
+
+
+def is_local_target(target):
+    """检测服务是否在本机（可以用 DetectLocal 传路径）"""
+    if target.startswith("unix:"):
+        return True
+    return target.rsplit(":", 1)[0] in LOCAL_HOSTS
+
+
+def iter_chunks(source, chunk_size=CHUNK_SIZE, options=None):
+    """把图像字节或图像文件切成 DetectChunk，第一块带上总长度和 DetectRequest 的其他字段"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        total = len(view)
+        pieces = (view[i : i + chunk_size] for i in range(0, total, chunk_size))
+    else:
+        total = os.path.getsize(source)
+        pieces = _read_file(source, chunk_size)
+    for i, piece in enumerate(pieces):
+        if i == 0:
+            yield detect_pb2.DetectChunk(
+                total_size=total,
+                options=detect_pb2.DetectRequest(**(options or {})),
+                data=bytes(piece),
+            )
+        else:
+            yield detect_pb2.DetectChunk(data=bytes(piece))
+
+
+def _read_file(path, chunk_size):
+    with open(path, "rb") as f:
+        while piece := f.read(chunk_size):
+            yield piece
+
 
 class DetectorClient:
     def __init__(self, target="localhost:50051"):
         # 要传图像，消息长度设置得大一点
-        channel = grpc.insecure_channel(
+        self.channel = grpc.insecure_channel(
             target,
             options=[
                 ("grpc.max_send_message_length", 100 * 1024 * 1024),
                 ("grpc.max_receive_message_length", 100 * 1024 * 1024),
+                # 每个 channel 自己建连接，同一地址开多个 channel 才能分到多个副本上
+                ("grpc.use_local_subchannel_pool", 1),
             ],
         )
-        self.stub = detect_pb2_grpc.DetectorStub(channel)
+        self.stub = detect_pb2_grpc.DetectorStub(self.channel)
 
     def detect(self, image_bytes: bytes) -> detect_pb2.DetectResponse:
         request = detect_pb2.DetectRequest(image_data=image_bytes)
         return self.stub.Detect(request)
+
+    def detect_batch(self, images: list[bytes]) -> list[detect_pb2.DetectResponse]:
+        request = detect_pb2.DetectBatchRequest(
+            requests=[detect_pb2.DetectRequest(image_data=b) for b in images]
+        )
+        return list(self.stub.DetectBatch(request).responses)
+
+    def detect_chunked(
+        self, source, chunk_size=CHUNK_SIZE, timeout=None, **options
+    ) -> detect_pb2.DetectResponse:
+        """分块上传检测，source 为图像字节或文件路径，大图时服务端内存占用更低"""
+        return self.stub.DetectChunked(
+            iter_chunks(source, chunk_size, options), timeout=timeout
+        )
+
+    def detect_local(
+        self,
+        path=None,
+        shm_name=None,
+        shm_size=0,
+        output_path="",
+        timeout=None,
+        **options,
+    ) -> detect_pb2.DetectResponse:
+        """
+        检测服务在同一台机器上时使用：传文件路径或共享内存名而不是图像字节，
+        指定 output_path 时处理后图像由检测服务直接写到该路径
+        """
+        request = detect_pb2.DetectLocalRequest(
+            path=path,
+            shm_name=shm_name,
+            shm_size=shm_size,
+            options=detect_pb2.DetectRequest(**options),
+            output_path=output_path,
+        )
+        return self.stub.DetectLocal(request, timeout=timeout)
+
+    def detect_shared(
+        self, image_bytes: bytes, output_path="", timeout=None, **options
+    ) -> detect_pb2.DetectResponse:
+        """通过共享内存把内存中的图像交给本机的检测服务"""
+        shm = shared_memory.SharedMemory(create=True, size=max(len(image_bytes), 1))
+        try:
+            shm.buf[: len(image_bytes)] = image_bytes
+            return self.detect_local(
+                shm_name=shm.name,
+                shm_size=len(image_bytes),
+                output_path=output_path,
+                timeout=timeout,
+                **options,
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def open_stream(
+        self, on_result, max_in_flight=4, on_done=None, confidence=0.0
+    ) -> "DetectStream":
+        return DetectStream(self.stub, on_result, max_in_flight, on_done, confidence)
+
+    def close(self):
+        self.channel.close()
+
+
+# 换一个检测服务重试的错误：连接失败或服务端内部错误
+RETRYABLE_CODES = (
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.UNKNOWN,
+    grpc.StatusCode.INTERNAL,
+)
+
+
+class Endpoint:
+    """连接池中的一个检测服务"""
+
+    def __init__(self, target, channel=0):
+        self.target = target
+        self.channel = channel
+        self.client = DetectorClient(target)
+        # 可以用 DetectLocal 传路径；检测服务读不到文件时由调用方关掉
+        self.local = is_local_target(target)
+        self.healthy = True
+        self.outstanding = 0
+        self.streams = 0
+        self.queued = 0
+        self.calls = 0
+        self.failures = 0
+        self.last_error = None
+        # 检测服务报告的模型版本，旧版检测服务不报告
+        self.model_version = None
+
+    def to_dict(self):
+        return {
+            "target": self.target,
+            "channel": self.channel,
+            "healthy": self.healthy,
+            "local": self.local,
+            "outstanding": self.outstanding,
+            "streams": self.streams,
+            "queued": self.queued,
+            "calls": self.calls,
+            "failures": self.failures,
+            "lastError": self.last_error,
+            "modelVersion": self.model_version,
+        }
+
+
+class DetectorPool:
+    """
+    多个检测服务的连接池：每个地址 channels 个长期复用的 channel，后台线程定期调用 Health 检查，
+    请求发给未完成请求最少的健康服务，连接失败等错误时换一个服务重试。
+    检测服务以 --replicas 多进程共用端口时，内核按连接分配副本，channels 不少于副本数才能都用上。
+    """
+
+    def __init__(self, targets, health_interval=5, retries=1, channels=1):
+        if not targets:
+            raise ValueError("at least one detector target is required")
+        self.endpoints = [
+            Endpoint(t, i) for t in targets for i in range(max(1, channels))
+        ]
+        self.health_interval = health_interval
+        self.retries = retries
+        self.retried = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._checker = None
+        self._rotation = itertools.count()
+
+    def start(self):
+        """启动健康检查线程（第一次调用 call/open_stream 时也会自动启动）"""
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=self._check_loop, daemon=True)
+                self._checker.start()
+
+    def close(self):
+        self._stopped.set()
+        for endpoint in self.endpoints:
+            endpoint.client.close()
+
+    def call(self, fn, timeout=None):
+        """
+        fn(endpoint, timeout) 在选出的检测服务上发起调用并返回结果。
+        失败时换一个还没试过的服务重试，最多重试 retries 次，整体不超过 timeout 秒。
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tried = []
+        while True:
+            endpoint = self._acquire(tried, "outstanding")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            try:
+                result = fn(endpoint, remaining)
+            except grpc.RpcError as e:
+                self._release(endpoint, e)
+                tried.append(endpoint)
+                retry = (
+                    e.code() in RETRYABLE_CODES
+                    and len(tried) <= self.retries
+                    and len(tried) < len(self.endpoints)
+                    and (deadline is None or deadline > time.monotonic())
+                )
+                if not retry:
+                    raise
+                with self._lock:
+                    self.retried += 1
+                continue
+            except BaseException:
+                self._release(endpoint)
+                raise
+            self._release(endpoint, version=getattr(result, "model_version", None))
+            return result
+
+    def open_stream(self, on_result, max_in_flight=4, confidence=0.0) -> "DetectStream":
+        """在打开流最少的健康服务上建立检测流"""
+        self.start()
+        endpoint = self._acquire([], "streams")
+
+        def on_done():
+            with self._lock:
+                endpoint.streams -= 1
+
+        try:
+            return endpoint.client.open_stream(
+                on_result, max_in_flight, on_done, confidence
+            )
+        except BaseException:
+            on_done()
+            raise
+
+    def model_version(self):
+        """健康的服务正在使用的模型版本；各服务不一致（正在换模型）或没有报告时返回 None"""
+        with self._lock:
+            versions = {e.model_version for e in self.endpoints if e.healthy}
+        return versions.pop() if len(versions) == 1 else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "retried": self.retried,
+                "endpoints": [e.to_dict() for e in self.endpoints],
+            }
+
+    def _acquire(self, exclude, counter):
+        with self._lock:
+            # 轮流从不同位置开始，负载相同时请求不会总落在第一个服务上
+            start = next(self._rotation) % len(self.endpoints)
+            rotated = self.endpoints[start:] + self.endpoints[:start]
+            candidates = [e for e in rotated if e not in exclude]
+            # 都不健康时仍然尝试，健康状态可能已经过时
+            healthy = [e for e in candidates if e.healthy] or candidates
+            endpoint = min(
+                healthy, key=lambda e: (getattr(e, counter), e.outstanding, e.queued)
+            )
+            setattr(endpoint, counter, getattr(endpoint, counter) + 1)
+            if counter == "outstanding":
+                endpoint.calls += 1
+            return endpoint
+
+    def _release(self, endpoint, error=None, version=None):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if version:
+                endpoint.model_version = version
+            if error is not None:
+                endpoint.failures += 1
+                endpoint.last_error = f"{error.code().name}: {error.details()}"
+                if error.code() == grpc.StatusCode.UNAVAILABLE:
+                    endpoint.healthy = False
+
+    def _check_loop(self):
+        # 启动时先检查一次，尽早知道哪些服务已就绪、用的哪个模型版本
+        while True:
+            for endpoint in self.endpoints:
+                self._check(endpoint)
+            if self._stopped.wait(self.health_interval):
+                return
+
+    def _check(self, endpoint):
+        try:
+            response = endpoint.client.stub.Health(
+                detect_pb2.HealthRequest(), timeout=self.health_interval
+            )
+            # serving 为 False 表示模型还在加载预热
+            healthy, queued = response.serving, response.queued
+            version = response.model_version or None
+        except grpc.RpcError as e:
+            # 旧版检测服务没有 Health，能应答就算健康
+            healthy = e.code() == grpc.StatusCode.UNIMPLEMENTED
+            queued = 0
+            version = endpoint.model_version
+        with self._lock:
+            endpoint.healthy = healthy
+            endpoint.queued = queued
+            endpoint.model_version = version
+
+
+class DetectStream:
+    """
+    一个长连接的双向检测流，结果按帧序号异步回调 on_result(seq, image_bytes, response, error)；
+    confidence 为每帧的置信度阈值，0 表示用检测服务的默认值
+    """
+
+    def __init__(self, stub, on_result, max_in_flight=4, on_done=None, confidence=0.0):
+        self._on_result = on_result
+        self._confidence = confidence
+        self._on_done = on_done
+        self._max_in_flight = max_in_flight
+        self._seq = itertools.count()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._closed = False
+        self._responses = stub.DetectStream(iter(self._requests.get, None))
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def send(self, image_bytes: bytes):
+        """推送一帧，返回帧序号；积压帧过多时丢弃该帧并返回 None"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("detect stream is closed")
+            if len(self._pending) >= self._max_in_flight:
+                return None
+            seq = next(self._seq)
+            self._pending[seq] = image_bytes
+        self._requests.put(
+            detect_pb2.DetectFrame(
+                seq=seq, image_data=image_bytes, confidence=self._confidence
+            )
+        )
+        return seq
+
+    def close(self):
+        """停止发送，已发送的帧仍会返回结果"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._requests.put(None)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _read(self):
+        try:
+            for result in self._responses:
+                with self._lock:
+                    image_bytes = self._pending.pop(result.seq, None)
+                error = result.error or None
+                self._on_result(
+                    result.seq, image_bytes, None if error else result.response, error
+                )
+        except grpc.RpcError as e:
+            # 连接断开，通知所有未完成的帧
+            with self._lock:
+                self._closed = True
+                pending, self._pending = self._pending, {}
+            for seq, image_bytes in pending.items():
+                self._on_result(seq, image_bytes, None, e.details() or str(e))
+        finally:
+            if self._on_done is not None:
+                self._on_done()
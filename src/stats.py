@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+from datetime import date
+
+from sqlalchemy import case, distinct, exists, func
+from sqlalchemy.dialects.sqlite import insert
+
+from src.extensions import db
+from src.models import HSDailyDefectStats, HSDailyStats, HSDefect, HSImage
+
+
+def _increment(model, keys, **increments):
+    """在当前事务里对汇总行做原子累加，行不存在时插入"""
+    stmt = insert(model).values(**keys, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={k: getattr(model, k) + stmt.excluded[k] for k in increments},
+    )
+    db.session.execute(stmt)
+
+
+def record_created(create_times):
+    """新图片入库时调用"""
+    for day, n in Counter(t.date() for t in create_times).items():
+        _increment(HSDailyStats, {'stat_date': day}, total=n)
+
+
+def had_defects(image):
+    """图片在本次检测之前是否已有缺陷记录（重复检测时用于避免重复计数）"""
+    if image.detect_time is None or image.image_id is None:
+        return False
+    return db.session.query(exists().where(HSDefect.image_id == image.image_id)).scalar()
+
+
+def record_detected(create_time, defect_types, previously_defective=False):
+    """检测结果写入时调用，create_time 为图片的创建时间，defect_types 为本次新增缺陷的类型列表"""
+    if not defect_types:
+        return
+    day = create_time.date()
+    if not previously_defective:
+        _increment(HSDailyStats, {'stat_date': day}, total=0, defective=1)
+    for defect_type, n in Counter(defect_types).items():
+        _increment(HSDailyDefectStats, {'stat_date': day, 'defect_type': defect_type}, count=n)
+
+
+def rebuild():
+    """根据 hs_image/hs_defect 重新计算全部汇总"""
+    HSDailyDefectStats.query.delete()
+    HSDailyStats.query.delete()
+
+    day = func.date(HSImage.create_time)
+    has_defect = exists().where(HSDefect.image_id == HSImage.image_id)
+    totals = db.session.query(
+        day,
+        func.count(HSImage.image_id),
+        func.count(distinct(case((has_defect, HSImage.image_id)))),
+    ).group_by(day).all()
+    db.session.add_all(
+        HSDailyStats(stat_date=date.fromisoformat(d), total=total, defective=defective)
+        for d, total, defective in totals
+    )
+
+    types = db.session.query(
+        day, HSDefect.defect_type, func.count(HSDefect.defect_id)
+    ).join(HSDefect, HSDefect.image_id == HSImage.image_id).group_by(day, HSDefect.defect_type).all()
+    db.session.add_all(
+        HSDailyDefectStats(stat_date=date.fromisoformat(d), defect_type=t, count=n)
+        for d, t, n in types
+    )
+    db.session.commit()
+    return len(totals)
+
+
+def summarize(start_date=None, end_date=None):
+    """统计接口和报告用的数据：每日总数/缺陷数、各类缺陷占比、每类缺陷的每日数量"""
+    # 读取按天汇总的统计表，而不是逐张图片计算
+    daily_query = HSDailyStats.query.filter(HSDailyStats.total > 0)
+    type_query = HSDailyDefectStats.query.filter(HSDailyDefectStats.count > 0)
+    if start_date:
+        daily_query = daily_query.filter(HSDailyStats.stat_date >= start_date)
+        type_query = type_query.filter(HSDailyDefectStats.stat_date >= start_date)
+    if end_date:
+        daily_query = daily_query.filter(HSDailyStats.stat_date <= end_date)
+        type_query = type_query.filter(HSDailyDefectStats.stat_date <= end_date)
+
+    date_stats = {
+        row.stat_date.strftime('%Y-%m-%d'): {'total': row.total, 'defect': row.defective, 'types': defaultdict(int)}
+        for row in daily_query.order_by(HSDailyStats.stat_date)
+    }
+    defect_proportion = defaultdict(int)
+    for row in type_query:
+        date = row.stat_date.strftime('%Y-%m-%d')
+        if date in date_stats:
+            date_stats[date]['types'][row.defect_type] += row.count
+        defect_proportion[row.defect_type] += row.count
+    no_defect = sum(d['total'] - d['defect'] for d in date_stats.values())
+    if no_defect:
+        defect_proportion['无缺陷'] += no_defect
+
+    dates = sorted(date_stats.keys())
+    statisticsData = {
+        'dates': dates,
+        'total': [date_stats[d]['total'] for d in dates],
+        'defect': [date_stats[d]['defect'] for d in dates]
+    }
+
+    singleStatisticsData = {
+        'dates': dates
+    }
+
+    for defect_type in set(dt for d in dates for dt in date_stats[d]['types'].keys()):
+        singleStatisticsData[defect_type] = [date_stats[d]['types'].get(defect_type, 0) for d in dates]
+
+    proportionData = [{'name': k, 'value': v} for k, v in defect_proportion.items()]
+
+    return {
+        'statisticsData': statisticsData,
+        'proportionData': proportionData,
+        'singleStatisticsData': singleStatisticsData
+    }
@@ -0,0 +1,84 @@
+import os
+import threading
+
+from flask import url_for
+from PIL import Image
+
+from src.blobstore import blob_store, original_relpath
+from src.file_cache import FileCache
+
+# 带版本参数的缩略图地址内容不会变，浏览器可以缓存一年
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def render_thumbnail(source, target, size):
+    """
+    生成不超过 size（边长或 (宽, 高)）的 JPEG 缩略图。JPEG 原图用 draft() 直接按 1/2~1/8 缩小解码，
+    不解码全分辨率图像；先写临时文件再改名，不会读到写了一半的文件
+    """
+    box = size if isinstance(size, tuple) else (size, size)
+    stem, ext = os.path.splitext(target)
+    tmp = f"{stem}.tmp-{os.getpid()}-{threading.get_ident()}{ext}"
+    try:
+        with Image.open(source) as image:
+            image.draft("RGB", box)
+            image.thumbnail(box)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(tmp, "JPEG", quality=85)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def thumbnail_url(image_id, image_hash=None, size=None):
+    """缩略图地址；带上原图哈希作版本，内容不变时地址不变，可以长期缓存"""
+    params = {"size": size} if size else {}
+    if image_hash:
+        params["v"] = image_hash[:12]
+    return url_for("image.get_thumbnail", image_id=image_id, **params)
+
+
+class ThumbnailCache:
+    """
+    按需生成的缩略图，缓存在上传目录的 .thumbs/<边长>/ 下，总大小超过 THUMBNAIL_CACHE_MAX_MB
+    时删除最久未访问的（见 FileCache）
+    """
+
+    def __init__(self, app=None):
+        self.files = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sizes = sorted(app.config["THUMBNAIL_SIZES"])
+        self.default_size = app.config["THUMBNAIL_SIZE"]
+        self.files = FileCache(
+            os.path.join(app.config["UPLOAD_FOLDER"], ".thumbs"),
+            app.config["THUMBNAIL_CACHE_MAX_MB"] * 1024 * 1024,
+        )
+        app.extensions["thumbnails"] = self
+
+    def pick_size(self, requested=None):
+        """不小于 requested 的最小档位，大于所有档位时取最大的"""
+        if not requested:
+            return self.default_size
+        for size in self.sizes:
+            if size >= requested:
+                return size
+        return self.sizes[-1]
+
+    def get(self, image, size):
+        """返回 image 在 size 档位的缩略图路径，不存在时生成"""
+        # 原图文件名以内容哈希开头，内容相同的图片共用缩略图，按前两位分子目录
+        stem = os.path.splitext(os.path.basename(image.image_original_path))[0]
+        path = os.path.join(self.files.folder, str(size), stem[:2], stem + ".jpg")
+        source = blob_store.abspath(original_relpath(image))
+        return self.files.get(
+            path, lambda target: render_thumbnail(source, target, size)
+        )
+
+
+thumbnails = ThumbnailCache()
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from src import create_app
+from src.config import Config
+from src.extensions import db
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """按测试配置（临时数据库和目录、不启动后台线程）创建应用，settings 覆盖其中的配置项"""
+
+    def make(**settings):
+        class TestConfig(Config):
+            TESTING = True
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path}/app.db"
+            UPLOAD_FOLDER = os.path.join(tmp_path, "uploads")
+            STATIC_FOLDER = UPLOAD_FOLDER
+            REPORT_FOLDER = os.path.join(tmp_path, "reports")
+            JOB_RUNNER_ENABLED = False
+            REPORT_RUNNER_ENABLED = False
+
+        for key, value in settings.items():
+            setattr(TestConfig, key, value)
+        return create_app(TestConfig)
+
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
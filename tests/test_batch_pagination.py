@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+from src.extensions import db
+from src.models import HSBatch, HSImage
+
+
+def page_through(client, url, key, **params):
+    """沿着 nextCursor 翻到最后一页，返回每页的条目"""
+    pages = []
+    after = None
+    while True:
+        query = dict(params, **({"after": after} if after else {}))
+        r = client.get(url, query_string=query)
+        assert r.status_code == 200
+        body = r.get_json()
+        pages.append(body[key])
+        after = body["nextCursor"]
+        if after is None:
+            return pages
+
+
+@pytest.fixture
+def batches(app):
+    # 七个批次只有三个不同的导入时间，翻页时要靠 batch_id 区分同一时间的批次
+    times = [datetime(2024, 5, day, 8) for day in (2, 1, 2, 3, 1, 2, 2)]
+    rows = [HSBatch(import_time=t) for t in times]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+@pytest.mark.parametrize("sort_value", ["time", "-time", None])
+def test_batch_list_pages_without_gaps(client, batches, sort_value):
+    if sort_value is None:
+        expected = sorted(batches, key=lambda b: b.batch_id)
+    else:
+        expected = sorted(batches, key=lambda b: (b.import_time, b.batch_id), reverse=sort_value == "-time")
+
+    params = {"limit": 2}
+    if sort_value:
+        params["sortValue"] = sort_value
+    pages = page_through(client, "/api/batch/get-batch-list", "items", **params)
+
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert [item["batchId"] for page in pages for item in page] == [b.batch_id for b in expected]
+
+
+def test_batch_list_rejects_bad_cursor(client, batches):
+    r = client.get("/api/batch/get-batch-list", query_string={"limit": 2, "after": "nope"})
+    assert r.status_code == 400
+
+
+def test_batch_detail_pages_without_gaps(client, batches):
+    batch = batches[0]
+    # 别的批次的图片夹在中间，不能出现在这个批次的分页里
+    for i in range(5):
+        for owner in (batch, batches[1]):
+            db.session.add(
+                HSImage(batch_id=owner.batch_id, image_original_path=f"{owner.batch_id}-{i}.jpg", create_time=owner.import_time)
+            )
+    db.session.commit()
+    expected = [image.image_id for image in batch.images.order_by(HSImage.image_id)]
+
+    pages = page_through(client, "/api/batch/get-batch-detail", "images", batchId=batch.batch_id, limit=2)
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [image["imageId"] for page in pages for image in page] == expected
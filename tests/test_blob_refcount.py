@@ -0,0 +1,131 @@
+import os
+from datetime import datetime
+
+import sqlalchemy
+
+from src import cli
+from src.blobstore import blob_relpath, blob_store
+from src.cli import gc_blobs
+from src.extensions import db
+from src.models import HSBatch, HSBlob, HSImage
+
+HASH_A = "a" * 64
+HASH_B = "b" * 64
+
+
+def add_image(path, image_hash):
+    batch = HSBatch(import_time=datetime(2025, 3, 1))
+    db.session.add(batch)
+    db.session.flush()
+    image = HSImage(
+        image_original_path=path,
+        image_hash=image_hash,
+        batch_id=batch.batch_id,
+        create_time=datetime(2025, 3, 1),
+    )
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def ref_counts():
+    db.session.expire_all()
+    return {blob.blob_hash: (blob.path, blob.ref_count) for blob in HSBlob.query}
+
+
+def test_insert_and_delete(app):
+    path = blob_relpath(HASH_A, ".jpg")
+    first = add_image(path, HASH_A)
+    add_image(path, HASH_A)
+    assert ref_counts() == {HASH_A: (path, 2)}
+
+    db.session.delete(first)
+    db.session.commit()
+    assert ref_counts() == {HASH_A: (path, 1)}
+
+
+def test_legacy_path_is_not_counted(app):
+    add_image("legacy.jpg", None)
+    assert ref_counts() == {}
+
+
+def test_path_and_hash_change_together(app):
+    path_a = blob_relpath(HASH_A, ".jpg")
+    path_b = blob_relpath(HASH_B, ".jpg")
+    image = add_image(path_a, HASH_A)
+    add_image(path_b, HASH_B)
+
+    # 同一条 UPDATE 里同时改路径和哈希，旧原图减一、新原图加一
+    image.image_original_path = path_b
+    image.image_hash = HASH_B
+    db.session.commit()
+    assert ref_counts() == {HASH_A: (path_a, 0), HASH_B: (path_b, 2)}
+
+
+def test_migrated_image_without_hash(app):
+    # 旧数据没有补算哈希时，计数仍按路径中的哈希登记和减少
+    image = add_image("legacy.jpg", None)
+    path = blob_relpath(HASH_A, ".jpg")
+    image.image_original_path = path
+    db.session.commit()
+    assert ref_counts() == {HASH_A: (path, 1)}
+
+    db.session.delete(image)
+    db.session.commit()
+    assert ref_counts() == {HASH_A: (path, 0)}
+
+
+def test_hash_changed_without_path(app):
+    # image_hash 单独改变（例如重新计算）后删除图片，仍减少路径指向的原图
+    path = blob_relpath(HASH_A, ".jpg")
+    image = add_image(path, HASH_A)
+    image.image_hash = HASH_B
+    db.session.commit()
+
+    db.session.delete(image)
+    db.session.commit()
+    assert ref_counts() == {HASH_A: (path, 0)}
+
+
+def gc(app, grace=0):
+    with app.app_context():
+        result = app.test_cli_runner().invoke(gc_blobs, ["--grace", str(grace)])
+    assert result.exit_code == 0, result.output
+
+
+def test_gc_removes_unreferenced_blob(app):
+    relpath, image_hash = blob_store.put_bytes(b"original", ".jpg", fsync=False)
+    image = add_image(relpath, image_hash)
+    db.session.delete(image)
+    db.session.commit()
+
+    gc(app)
+    assert ref_counts() == {}
+    assert not os.path.exists(blob_store.abspath(relpath))
+
+
+def test_gc_keeps_blob_referenced_after_listing(app, monkeypatch):
+    relpath, image_hash = blob_store.put_bytes(b"original", ".jpg", fsync=False)
+    image = add_image(relpath, image_hash)
+    db.session.delete(image)
+    db.session.commit()
+
+    # 模拟 gc 列出计数为 0 的原图之后，另一个连接上的上传又引用了它
+    def delete_after_upload(table):
+        with db.engine.connect() as conn:
+            batch_id = conn.execute(db.insert(HSBatch).values(import_time=datetime(2025, 3, 1))).inserted_primary_key[0]
+            conn.execute(
+                db.insert(HSImage).values(
+                    image_original_path=relpath,
+                    image_hash=image_hash,
+                    batch_id=batch_id,
+                    create_time=datetime(2025, 3, 1),
+                )
+            )
+            conn.commit()
+        return sqlalchemy.delete(table)
+
+    monkeypatch.setattr(cli, "delete", delete_after_upload)
+    gc(app)
+    assert ref_counts() == {image_hash: (relpath, 1)}
+    assert os.path.exists(blob_store.abspath(relpath))
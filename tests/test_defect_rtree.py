@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from src.extensions import db
+from src.models import HSBatch, HSDefect, HSImage, defect_rtree
+
+
+def add_image():
+    batch = HSBatch(import_time=datetime(2025, 3, 1))
+    db.session.add(batch)
+    db.session.flush()
+    image = HSImage(image_original_path="a.jpg", batch_id=batch.batch_id, create_time=datetime(2025, 3, 1))
+    db.session.add(image)
+    db.session.flush()
+    return image
+
+
+def rtree_rows():
+    return {
+        row.defect_id: (row.min_x, row.max_x, row.min_y, row.max_y)
+        for row in db.session.execute(db.select(defect_rtree))
+    }
+
+
+def search(client, **params):
+    r = client.get("/api/defect/search", query_string=params)
+    assert r.status_code == 200
+    return [item["defectId"] for item in r.get_json()["items"]]
+
+
+def test_triggers_keep_rtree_in_sync(app):
+    image = add_image()
+    defect = HSDefect(**HSDefect.box_columns([10, 20, 30, 40]), defect_type="边缘裂纹", image_id=image.image_id)
+    legacy = HSDefect(bbox="1,2,3,4", defect_type="边缘裂纹", image_id=image.image_id)
+    db.session.add_all([defect, legacy])
+    db.session.commit()
+    # 没有数值坐标的旧缺陷不进索引
+    assert rtree_rows() == {defect.defect_id: (10, 30, 20, 40)}
+
+    for key, value in HSDefect.box_columns([100, 200, 150, 260]).items():
+        setattr(defect, key, value)
+    for key, value in HSDefect.box_columns([1, 2, 3, 4]).items():
+        setattr(legacy, key, value)
+    db.session.commit()
+    assert rtree_rows() == {defect.defect_id: (100, 150, 200, 260), legacy.defect_id: (1, 3, 2, 4)}
+
+    db.session.delete(defect)
+    db.session.commit()
+    assert rtree_rows() == {legacy.defect_id: (1, 3, 2, 4)}
+
+
+def test_search_by_region(app, client):
+    image = add_image()
+    inside = HSDefect(**HSDefect.box_columns([10, 10, 20, 20]), defect_type="边缘裂纹", image_id=image.image_id)
+    crossing = HSDefect(**HSDefect.box_columns([90, 90, 120, 120]), defect_type="横向裂纹", image_id=image.image_id)
+    outside = HSDefect(**HSDefect.box_columns([300, 300, 310, 310]), defect_type="边缘裂纹", image_id=image.image_id)
+    db.session.add_all([inside, crossing, outside])
+    db.session.commit()
+
+    region = dict(x1=0, y1=0, x2=100, y2=100)
+    assert search(client, **region) == [inside.defect_id, crossing.defect_id]
+    assert search(client, contained="true", **region) == [inside.defect_id]
+    assert search(client, defect_type="横向裂纹", **region) == [crossing.defect_id]
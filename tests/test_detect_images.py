@@ -0,0 +1,91 @@
+import io
+from unittest import mock
+
+import pytest
+
+import detect_pb2
+from benchmarks.chunked_memory import make_image
+from src import detect_utils
+from src.extensions import db
+from src.models import HSImage
+
+
+def upload(client, *seeds):
+    files = [(io.BytesIO(make_image(64, 48, "jpg", seed)), f"{i}.jpg") for i, seed in enumerate(seeds)]
+    r = client.post("/api/batch/create-batch", data={"images": files}, content_type="multipart/form-data")
+    assert r.status_code == 201
+    return HSImage.query.filter_by(batch_id=r.get_json()["batchId"]).order_by(HSImage.image_id).all()
+
+
+def response(*class_ids):
+    return detect_pb2.DetectResponse(
+        results=[
+            detect_pb2.DetectResult(class_id=class_id, confidence=0.9, box=[10, 10, 40, 40])
+            for class_id in class_ids
+        ]
+    )
+
+
+def run(images, detect=lambda path: response(0), **kwargs):
+    options = dict(prefetch=2, commit_size=2, writers=1)
+    options.update(kwargs)
+    with mock.patch.object(detect_utils, "_read_and_detect", detect):
+        return [(image.image_id, has_defect, error) for image, has_defect, error in
+                detect_utils.detect_images(images, **options)]
+
+
+def test_failed_cache_reuse_only_fails_that_image(app, client):
+    (first,) = upload(client, 1)
+    run([first])
+    duplicate, other = upload(client, 1, 2)
+
+    with mock.patch.object(detect_utils, "reuse_detection", side_effect=OSError("link failed")):
+        results = run([duplicate, other])
+
+    assert [(image_id, has_defect) for image_id, has_defect, _ in results] == [
+        (duplicate.image_id, None),
+        (other.image_id, True),
+    ]
+    assert isinstance(results[0][2], OSError)
+    db.session.expire_all()
+    assert db.session.get(HSImage, duplicate.image_id).detect_time is None
+    assert db.session.get(HSImage, other.image_id).detect_time is not None
+
+
+def test_failed_write_only_fails_that_image(app, client):
+    images = upload(client, 1, 2, 3)
+    failing = images[1]
+    store = detect_utils._store_processed
+
+    def store_processed(path, response):
+        if f"_{failing.image_id}_processed" in path:
+            raise OSError("disk full")
+        store(path, response)
+
+    def detect(path):
+        result = response(0)
+        result.processed_image = make_image(64, 48, "jpg", 9)
+        return result
+
+    with mock.patch.object(detect_utils, "_store_processed", store_processed):
+        results = run(images, detect, commit_size=3)
+
+    assert [(image_id, has_defect) for image_id, has_defect, _ in results] == [
+        (images[0].image_id, True),
+        (failing.image_id, None),
+        (images[2].image_id, True),
+    ]
+    db.session.expire_all()
+    assert db.session.get(HSImage, failing.image_id).detect_time is None
+    assert db.session.get(HSImage, failing.image_id).defects.count() == 0
+    for image in (images[0], images[2]):
+        image = db.session.get(HSImage, image.image_id)
+        assert image.defects.count() == 1
+        with open(detect_utils.get_processed_path(image), "rb") as f:
+            assert f.read() == make_image(64, 48, "jpg", 9)
+
+
+def test_configured_confidence_is_sent(app):
+    assert detect_utils.dispatcher.options["confidence"] == app.config["DETECT_CONFIDENCE"]
+    request = detect_pb2.DetectRequest(image_data=b"", **detect_utils.dispatcher.options)
+    assert request.confidence == pytest.approx(app.config["DETECT_CONFIDENCE"])
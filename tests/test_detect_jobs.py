@@ -0,0 +1,137 @@
+import io
+import threading
+import time
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+import detect_pb2
+from benchmarks.chunked_memory import make_image
+from src import detect_utils
+from src.cli import rebuild_stats
+from src.detect_jobs import DetectJobRunner, job_runner
+from src.extensions import db
+from src.models import HSBatch, HSDetectJob, HSImage
+
+
+def test_runner_starts_on_first_request_only(make_app, monkeypatch):
+    started = []
+
+    def start():
+        started.append(True)
+        job_runner._thread = object()
+
+    monkeypatch.setattr(job_runner, "_thread", None)
+    monkeypatch.setattr(job_runner, "_start", start)
+    app = make_app(JOB_RUNNER_ENABLED=True)
+
+    # 命令行不启动后台线程
+    with app.app_context():
+        assert app.test_cli_runner().invoke(rebuild_stats).exit_code == 0
+    assert started == []
+
+    client = app.test_client()
+    client.get("/api/batch/get-batch-list")
+    client.get("/api/batch/get-batch-list")
+    assert started == [True]
+
+
+def test_runner_disabled(make_app, monkeypatch):
+    def start():
+        raise AssertionError("runner started")
+
+    monkeypatch.setattr(job_runner, "_thread", None)
+    monkeypatch.setattr(job_runner, "_start", start)
+    r = make_app(JOB_RUNNER_ENABLED=False).test_client().get("/api/batch/get-batch-list")
+    assert r.status_code == 200
+
+
+def upload(client, count):
+    files = [(io.BytesIO(make_image(64, 48, "jpg", seed)), f"{seed}.jpg") for seed in range(count)]
+    r = client.post("/api/batch/create-batch", data={"images": files}, content_type="multipart/form-data")
+    assert r.status_code == 201
+    return db.session.get(HSBatch, r.get_json()["batchId"])
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db.session.expire_all()
+        if condition():
+            return
+        time.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+@pytest.fixture
+def runner_app(make_app):
+    app = make_app(BATCH_DETECT_PREFETCH=2, BATCH_DETECT_COMMIT_SIZE=1, BATCH_DETECT_WRITERS=1)
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+def test_claim_is_exclusive(runner_app):
+    batch = upload(runner_app.test_client(), 1)
+    runner = DetectJobRunner(runner_app)
+    job = runner.submit(batch)
+
+    assert runner._claim(job.job_id)
+    assert not runner._claim(job.job_id)
+    db.session.refresh(job)
+    assert job.status == "running"
+    assert job.start_time is not None
+
+
+def test_cancel_then_resume_on_startup(runner_app):
+    batch = upload(runner_app.test_client(), 4)
+    images = batch.images.order_by(HSImage.image_id).all()
+    held = detect_utils.get_original_path(images[2])
+    release = threading.Event()
+
+    def detect(path):
+        # 第三张图片的检测等到任务被取消后才返回
+        if path == held:
+            release.wait(5)
+        return detect_pb2.DetectResponse(
+            results=[detect_pb2.DetectResult(class_id=0, confidence=0.9, box=[1, 1, 5, 5])]
+        )
+
+    with mock.patch.object(detect_utils, "_read_and_detect", detect):
+        runner = DetectJobRunner(runner_app)
+        job = runner.submit(batch)
+        job_id = job.job_id
+        runner.start()
+        wait_until(lambda: db.session.get(HSDetectJob, job_id).processed >= 1)
+
+        runner.cancel(db.session.get(HSDetectJob, job_id))
+        release.set()
+        wait_until(lambda: job_id not in runner._cancelled)
+
+        job = db.session.get(HSDetectJob, job_id)
+        assert job.status == "cancelled"
+        assert job.finish_time is not None
+        detected = batch.images.filter(HSImage.detect_time.isnot(None)).count()
+        assert 1 <= job.processed <= detected < 4
+
+        # 另一个任务在进程退出时还是 running：新进程启动时改回排队并从未检测的图片继续
+        resumed = HSDetectJob(
+            batch_id=batch.batch_id,
+            status="running",
+            total=4,
+            processed=detected,
+            create_time=datetime.now(),
+        )
+        db.session.add(resumed)
+        db.session.commit()
+        resumed_id = resumed.job_id
+
+        restarted = DetectJobRunner(runner_app)
+        restarted.start()
+        wait_until(lambda: db.session.get(HSDetectJob, resumed_id).status == "finished")
+
+    resumed = db.session.get(HSDetectJob, resumed_id)
+    assert resumed.processed == resumed.total == 4
+    assert resumed.failed == 0
+    assert batch.images.filter(HSImage.detect_time.is_(None)).count() == 0
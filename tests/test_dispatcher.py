@@ -0,0 +1,111 @@
+import io
+import threading
+
+import grpc
+import pytest
+
+import detect_pb2
+from benchmarks.chunked_memory import make_image
+from src.detect_utils import DetectorBusyError, dispatcher
+
+
+class DeadlineExceeded(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+
+
+class StubPool:
+    """代替 DetectorPool：调用阻塞到 release()，然后返回结果或抛出给定的异常"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.error = None
+
+    def call(self, fn, timeout=None):
+        self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return detect_pb2.DetectResponse(results=[])
+
+    def release(self):
+        self.gate.set()
+
+    def model_version(self):
+        return None
+
+
+@pytest.fixture
+def pool(make_app, monkeypatch):
+    app = make_app(DETECT_CONCURRENCY=1, DETECT_QUEUE_SIZE=0, DETECT_RETRY_AFTER=7)
+    stub = StubPool()
+    monkeypatch.setattr(dispatcher, "pool", stub)
+    with app.app_context():
+        yield app, stub
+        stub.release()
+
+
+def upload(client):
+    files = [(io.BytesIO(make_image(64, 48, "jpg", 1)), "a.jpg")]
+    r = client.post("/api/batch/create-batch", data={"images": files}, content_type="multipart/form-data")
+    assert r.status_code == 201
+
+
+def single_detect(client, image_id=1):
+    return client.post(f"/api/detect/single-detect?imageId={image_id}")
+
+
+def wait_for_slot():
+    # 槽位在 Future 的回调里归还，调用方拿到结果时回调可能还没执行完
+    assert dispatcher._slots.acquire(timeout=5)
+    dispatcher._slots.release()
+
+
+def test_busy_returns_503_and_slot_is_released(pool):
+    app, stub = pool
+    client = app.test_client()
+    upload(client)
+
+    running = dispatcher.submit(b"image")
+    r = single_detect(client)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "7"
+
+    stub.release()
+    assert running.result(5).results == []
+    wait_for_slot()
+    assert single_detect(client).status_code == 200
+
+
+def test_failed_call_releases_slot(pool):
+    app, stub = pool
+    stub.error = RuntimeError("detector crashed")
+    stub.release()
+    with pytest.raises(RuntimeError):
+        dispatcher.submit(b"image").result(5)
+    # 槽位已归还，下一次提交不会被拒绝
+    wait_for_slot()
+    stub.error = None
+    assert dispatcher.submit(b"image").result(5).results == []
+
+
+def test_timeout_returns_504_and_slot_is_released(pool):
+    app, stub = pool
+    client = app.test_client()
+    upload(client)
+
+    stub.error = DeadlineExceeded()
+    stub.release()
+    assert single_detect(client).status_code == 504
+
+    wait_for_slot()
+    stub.error = None
+    assert single_detect(client).status_code == 200
+
+
+def test_full_queue_rejects_without_blocking(pool):
+    app, stub = pool
+    running = dispatcher.submit(b"image")
+    with pytest.raises(DetectorBusyError):
+        dispatcher.submit(b"image")
+    stub.release()
+    running.result(5)
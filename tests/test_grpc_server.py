@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import detect_pb2
+
+pytest.importorskip("ultralytics")
+import grpc_server  # noqa: E402
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, source, conf):
+        self.calls.append((len(source), conf))
+        return [conf] * len(source)
+
+
+def test_batcher_applies_each_requests_threshold():
+    model = FakeModel()
+    batcher = grpc_server.MicroBatcher(model, max_batch_size=8, window_ms=50)
+    img = np.zeros((8, 8, 3), np.uint8)
+    pending = [batcher.submit(img, 0.25), batcher.submit(img), batcher.submit(img, 0.25)]
+    assert [f.result() for f in pending] == [0.25, grpc_server.CONF_THRESHOLD, 0.25]
+    assert sorted(model.calls) == sorted([(2, 0.25), (1, grpc_server.CONF_THRESHOLD)])
+    batcher.close()
+
+
+def test_confidence_defaults_and_validates():
+    assert grpc_server.confidence(detect_pb2.DetectRequest()) == grpc_server.CONF_THRESHOLD
+    assert grpc_server.confidence(detect_pb2.DetectRequest(confidence=0.6)) == pytest.approx(0.6)
+    assert grpc_server.confidence(detect_pb2.DetectFrame(confidence=0.3)) == pytest.approx(0.3)
+    with pytest.raises(ValueError):
+        grpc_server.confidence(detect_pb2.DetectRequest(confidence=1.5))
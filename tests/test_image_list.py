@@ -0,0 +1,79 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from src.extensions import db
+from src.models import HSBatch, HSDefect, HSImage
+
+
+@pytest.fixture
+def images(app):
+    batch = HSBatch(import_time=datetime(2024, 5, 1))
+    db.session.add(batch)
+    db.session.flush()
+    rows = []
+    for i in range(7):
+        image = HSImage(
+            batch_id=batch.batch_id,
+            image_original_path=f"{i}.jpg",
+            create_time=datetime(2024, 5, 1 + i),
+            detect_time=datetime(2024, 6, 1) if i % 2 else None,
+        )
+        db.session.add(image)
+        db.session.flush()
+        if i % 3 == 0:
+            # 同一张图片两个同类缺陷，不能让它在列表里出现两次
+            db.session.add_all(HSDefect(image_id=image.image_id, defect_type="划痕") for _ in range(2))
+        rows.append(image)
+    db.session.commit()
+    return rows
+
+
+def page_through(client, **params):
+    pages = []
+    after = None
+    while True:
+        query = dict(params, limit=3, **({"after": after} if after else {}))
+        r = client.get("/api/image/get-image-list", query_string=query)
+        assert r.status_code == 200
+        body = r.get_json()
+        pages.append([item["image_id"] for item in body["items"]])
+        after = body["nextCursor"]
+        if after is None:
+            return pages
+
+
+def test_pages_through_all_images(client, images):
+    pages = page_through(client)
+    assert pages == [[image.image_id for image in images[i:i + 3]] for i in (0, 3, 6)]
+
+
+def test_pages_through_filtered_images(client, images):
+    pages = page_through(client, defect_type="划痕")
+    assert pages == [[images[0].image_id, images[3].image_id, images[6].image_id]]
+
+    pages = page_through(client, detected="true")
+    assert pages == [[images[1].image_id, images[3].image_id, images[5].image_id]]
+
+
+def test_bad_cursor(client, images):
+    r = client.get("/api/image/get-image-list", query_string={"limit": 3, "after": "nope"})
+    assert r.status_code == 400
+
+
+@pytest.mark.parametrize("chunk", [2, 7, 100])
+def test_stream_returns_every_image_once(app, client, images, chunk):
+    app.config["IMAGE_LIST_STREAM_CHUNK"] = chunk
+    expected = [image.image_id for image in images]
+
+    r = client.get("/api/image/get-image-list", query_string={"stream": "true"})
+    assert r.headers["Content-Type"] == "application/x-ndjson"
+    items = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+    assert [item["image_id"] for item in items] == expected
+    assert [item["defect_types"] for item in items[:2]] == [["划痕"], ["无缺陷"]]
+
+    # 流式导出也可以从分页游标处接着取
+    first = client.get("/api/image/get-image-list", query_string={"limit": 2}).get_json()
+    r = client.get("/api/image/get-image-list", query_string={"stream": "true", "after": first["nextCursor"]})
+    assert [json.loads(line)["image_id"] for line in r.get_data(as_text=True).splitlines()] == expected[2:]
@@ -0,0 +1,56 @@
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from sqlalchemy import update
+
+from src import render
+from src.extensions import db
+from src.models import HSBatch, HSImage
+
+
+@pytest.fixture
+def image(app):
+    batch = HSBatch(import_time=datetime(2024, 5, 1))
+    db.session.add(batch)
+    db.session.flush()
+    # 结构化输出模式下检测完还没有处理后图像
+    image = HSImage(
+        batch_id=batch.batch_id,
+        image_original_path="a.jpg",
+        create_time=datetime(2024, 5, 1),
+        detect_time=datetime(2024, 5, 2),
+    )
+    db.session.add(image)
+    db.session.commit()
+    return image
+
+
+def test_renders_once_and_records_path(client, image):
+    with mock.patch.object(render, "render_processed", return_value=b"rendered") as rendered:
+        for _ in range(2):
+            r = client.get(f"/api/image/processed/{image.image_id}")
+            assert r.status_code == 200
+            assert r.data == b"rendered"
+
+    assert rendered.call_count == 1
+    db.session.expire_all()
+    assert image.image_processed_path == f"a_{image.image_id}_processed.jpg"
+
+
+def test_redetected_while_rendering_keeps_new_result(client, image):
+    def redetect(_):
+        # 渲染期间图片被重新检测（另一个连接提交），旧结果的路径不能记到新的检测上
+        with db.engine.begin() as conn:
+            conn.execute(
+                update(HSImage).where(HSImage.image_id == image.image_id).values(detect_time=datetime(2024, 5, 3))
+            )
+        return b"stale"
+
+    with mock.patch.object(render, "render_processed", side_effect=redetect):
+        r = client.get(f"/api/image/processed/{image.image_id}")
+    assert r.status_code == 200
+
+    db.session.expire_all()
+    assert image.detect_time == datetime(2024, 5, 3)
+    assert image.image_processed_path is None
@@ -0,0 +1,90 @@
+import os
+from datetime import datetime
+from unittest import mock
+
+from src.cli import rebuild_stats
+from src.extensions import db
+from src.file_cache import FileCache
+from src.models import HSBatch, HSDefect, HSImage
+from src.reports import report_runner, sample_images
+
+
+def test_runner_starts_on_first_request_only(make_app, monkeypatch):
+    started = []
+
+    def start():
+        started.append(True)
+        report_runner._thread = object()
+
+    monkeypatch.setattr(report_runner, "_thread", None)
+    monkeypatch.setattr(report_runner, "_start", start)
+    app = make_app(REPORT_RUNNER_ENABLED=True)
+
+    with app.app_context():
+        assert app.test_cli_runner().invoke(rebuild_stats).exit_code == 0
+    assert started == []
+
+    client = app.test_client()
+    client.get("/api/batch/get-batch-list")
+    client.get("/api/batch/get-batch-list")
+    assert started == [True]
+
+
+def add_images(app):
+    """十张图片：偶数号在五月检测并有划痕，奇数号有划痕但在六月检测，最后一张没有缺陷"""
+    batch = HSBatch(import_time=datetime(2024, 5, 1))
+    db.session.add(batch)
+    db.session.flush()
+    matching = []
+    for i in range(10):
+        image = HSImage(
+            batch_id=batch.batch_id,
+            image_original_path=f"{i}.jpg",
+            create_time=datetime(2024, 5, 1),
+            detect_time=datetime(2024, 5 if i % 2 == 0 else 6, 10),
+        )
+        db.session.add(image)
+        db.session.flush()
+        if i < 9:
+            db.session.add(HSDefect(image_id=image.image_id, defect_type="划痕"))
+            if i % 2 == 0:
+                matching.append(image.image_id)
+    db.session.commit()
+    return matching
+
+
+def test_sample_images_distinct_and_matching(app):
+    matching = add_images(app)
+    start, end = datetime(2024, 5, 1), datetime(2024, 5, 31)
+
+    for _ in range(20):
+        sample = [image.image_id for image in sample_images("划痕", start, end, 3)]
+        assert len(sample) == len(set(sample)) == 3
+        assert set(sample) <= set(matching)
+
+    # 匹配的图片不足 k 张时全部返回
+    assert sorted(image.image_id for image in sample_images("划痕", start, end, 10)) == matching
+    assert sample_images("裂纹", start, end, 3) == []
+
+
+def test_sample_images_probes_from_a_random_id(app):
+    matching = add_images(app)
+    # 起点总在最大的 image_id 时，之后没有匹配的图片，要往前找
+    with mock.patch("src.reports.random.randint", side_effect=lambda low, high: high):
+        sample = sample_images("划痕", datetime(2024, 5, 1), datetime(2024, 5, 31), 2)
+    assert [image.image_id for image in sample] == matching[::-1][:2]
+
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=25)
+
+    def render(path):
+        with open(path, "wb") as f:
+            f.write(b"x" * 10)
+
+    a, b, c = (cache.get(os.path.join(tmp_path, "d", name), render) for name in "abc")
+    assert not os.path.exists(a)
+
+    cache.get(b, render)  # 访问 b 后最久未访问的是 c
+    cache.get(os.path.join(tmp_path, "d", "e"), render)
+    assert os.path.exists(b) and not os.path.exists(c)
@@ -0,0 +1,49 @@
+import io
+from unittest import mock
+
+import detect_pb2
+from benchmarks.chunked_memory import make_image
+from src import detect_utils, stats
+from src.models import HSImage
+
+
+def response(*class_ids):
+    return detect_pb2.DetectResponse(
+        results=[
+            detect_pb2.DetectResult(class_id=class_id, confidence=0.9, box=[10, 10, 40, 40])
+            for class_id in class_ids
+        ]
+    )
+
+
+def detect(images, responses):
+    """用给定的检测结果（按图片 ID）跑一遍批量检测流水线，不调用检测服务"""
+    by_path = {detect_utils.get_original_path(image): responses[image.image_id] for image in images}
+    with mock.patch.object(detect_utils, "_read_and_detect", by_path.__getitem__):
+        for _, _, error in detect_utils.detect_images(images, prefetch=2, commit_size=2, writers=1):
+            assert error is None
+
+
+def summary():
+    # 各类缺陷的先后顺序取决于查询顺序，比较时不计
+    data = stats.summarize()
+    data["proportionData"].sort(key=lambda item: item["name"])
+    return data
+
+
+def test_rollup_matches_rebuild(app, client):
+    files = [(io.BytesIO(make_image(64, 48, "jpg", seed)), f"{seed}.jpg") for seed in range(4)]
+    r = client.post("/api/batch/create-batch", data={"images": files}, content_type="multipart/form-data")
+    assert r.status_code == 201
+
+    images = HSImage.query.order_by(HSImage.image_id).all()
+    ids = [image.image_id for image in images]
+    detect(images, {ids[0]: response(0, 1), ids[1]: response(2), ids[2]: response(), ids[3]: response(3, 3)})
+    # 重新检测：已有缺陷的图片不重复计入缺陷图片数，原来无缺陷的图片新增缺陷
+    detect(images[:3], {ids[0]: response(1), ids[1]: response(), ids[2]: response(0)})
+
+    incremental = summary()
+    assert sum(incremental["statisticsData"]["total"]) == 4
+    assert sum(incremental["statisticsData"]["defect"]) == 4
+    stats.rebuild()
+    assert summary() == incremental
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import detect_pb2
+from flask_socketio import SocketIO
+
+from benchmarks.chunked_memory import make_image
+from src.db_writer import db_writer
+from src.detect_utils import dispatcher
+from src.models import HSImage
+from src.routes import stream_controller
+
+
+class FakeStream:
+    """回调在另一个线程里进行，和 gRPC 读线程一样"""
+
+    closed = False
+
+    def __init__(self, on_result):
+        self.on_result = on_result
+        self.seq = 0
+        self.threads = []
+
+    def send(self, data):
+        self.seq += 1
+        response = detect_pb2.DetectResponse(
+            results=[detect_pb2.DetectResult(class_id=1, confidence=0.9, box=[1, 2, 30, 40])],
+            processed_image=b"jpeg",
+        )
+        thread = threading.Thread(target=self.on_result, args=(self.seq, data, response, None))
+        thread.start()
+        self.threads.append(thread)
+
+    def close(self):
+        self.closed = True
+
+
+def received(client, count, timeout=5):
+    events = []
+    deadline = time.monotonic() + timeout
+    while len(events) < count and time.monotonic() < deadline:
+        events += client.get_received("/video")
+        time.sleep(0.01)
+    return events
+
+
+def test_frames_share_one_batch_and_disconnect_cleans_up(app, monkeypatch):
+    opened = []
+
+    def open_stream(on_result, **kwargs):
+        opened.append(FakeStream(on_result))
+        return opened[-1]
+
+    monkeypatch.setattr(dispatcher.pool, "open_stream", open_stream)
+    socketio = SocketIO(app, async_mode="threading")
+    stream_controller.register_video_events(socketio)
+    client = socketio.test_client(app, namespace="/video")
+
+    for _ in range(3):
+        client.emit("frame", make_image(64, 48, "jpg", 1), namespace="/video")
+    events = received(client, 3)
+    assert sorted(e["args"][0]["seq"] for e in events if e["name"] == "processed_frame") == [1, 2, 3]
+    assert len(opened) == 1
+
+    for thread in opened[0].threads:
+        thread.join()
+    db_writer.flush(timeout=5)
+    images = HSImage.query.all()
+    assert len(images) == 3
+    assert len({image.batch_id for image in images}) == 1
+
+    client.disconnect(namespace="/video")
+    assert opened[0].closed
+    assert stream_controller.streams == {}
+    assert stream_controller.sessions == {}
@@ -0,0 +1,49 @@
+import numpy as np
+
+from detector.tiling import TileDetection, merge_detections, paste_mask, tile_grid
+
+
+def detection(box, confidence=0.9, class_id=0, tile=None):
+    parts = []
+    if tile is not None:
+        x0, y0, size = tile
+        mask = np.zeros((size, size), dtype=bool)
+        mask[int(box[1]) - y0:int(box[3]) - y0, int(box[0]) - x0:int(box[2]) - x0] = True
+        parts.append((x0, y0, mask))
+    return TileDetection(list(box), confidence, class_id, parts)
+
+
+def test_tile_grid_covers_image():
+    tiles = tile_grid(1000, 300, 400, 80)
+    assert tiles == [(0, 0, 400, 300), (320, 0, 720, 300), (600, 0, 1000, 300)]
+    assert tile_grid(200, 100, 400, 80) == [(0, 0, 200, 100)]
+
+
+def test_seam_halves_are_merged():
+    # a defect crossing the x=400 seam is seen partly by each of the two tiles
+    left = detection([350, 50, 400, 90], confidence=0.7, tile=(0, 0, 400))
+    right = detection([320, 50, 450, 90], confidence=0.8, tile=(320, 0, 400))
+    (merged,) = merge_detections([left, right])
+
+    assert merged.box == [320, 50, 450, 90]
+    assert merged.confidence == 0.8
+    mask = paste_mask(merged, 400, 800)
+    assert mask.sum() == (450 - 320) * (90 - 50)
+    assert mask[50:90, 320:450].all()
+
+
+def test_other_classes_and_distant_boxes_are_kept():
+    a = detection([0, 0, 100, 100], class_id=0)
+    b = detection([10, 10, 90, 90], class_id=1)
+    c = detection([500, 500, 600, 600], class_id=0)
+    d = detection([95, 95, 200, 200], class_id=0)
+    assert len(merge_detections([a, b, c, d])) == 4
+
+
+def test_merges_transitively():
+    # b only overlaps a once a has absorbed c, which takes a second pass
+    a = detection([0, 0, 100, 50], confidence=0.95)
+    b = detection([110, 0, 150, 50], confidence=0.9)
+    c = detection([40, 0, 140, 50], confidence=0.8)
+    merged = merge_detections([a, b, c])
+    assert [(m.box, m.confidence) for m in merged] == [([0, 0, 150, 50], 0.95)]